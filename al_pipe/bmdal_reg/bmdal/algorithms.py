@@ -31,7 +31,8 @@ def select_batch(
     This parameter is only used for the acs-rf-hyper transformation
     and can be set to None if this transformation is not used.
     :param base_kernel: Base kernel to use. Currently supported base kernels are
-    'll', 'grad', 'lin', 'nngp', 'ntk', and 'laplace'.
+    'll', 'grad', 'lin', 'nngp', 'ntk', 'laplace', 'kmer', and 'wd'.
+    The string kernels 'kmer' and 'wd' expect the data to contain DNA sequences packed by pack_dna_codes().
     :param kernel_transforms: List of kernel transformations.
     Each kernel transformation is given by a tuple (name, args)
     and the corresponding transformation method is then called with parameters *args.
@@ -63,6 +64,12 @@ def select_batch(
     allow_float64=False: enables using float64 tensors if maxdet or transformations involving posteriors are used.
     compute_eff_dim=True: Triggers the computation of the effective dimension of the pool set kernel matrix
                             for kernels with feature space dimension <= 1000.
+    return_selection_state=True, return_features=True, lcmd_init_state=<Dict>:
+                            Allow to continue an 'lcmd' selection in a later round, see BatchSelectorImpl.select().
+    grad_feature_cache=<GradFeatureCache>: Reuses the gradient features of the same model across calls,
+                            see BatchSelectorImpl.select().
+    posterior_cache=<PosteriorCache>: Reuses the Cholesky factor of a leading ('train', [sigma]) transformation
+                            across rounds, see BatchSelectorImpl.select().
     sel_with_train=True/False: Forces TP/P-mode for the selection method.
                                 By default, the distance-based methods run in TP-mode
                                 and the other ones run in P-mode.
@@ -87,7 +94,8 @@ def select_batch(
     containing the selected indices for the pool data. The dictionary results is of the form
     {'kernel_time': {'total': <float>, 'process': <float>},
      'selection_time': {'total': <float>, 'process': <float>},
-     'selection_status': <None or status message>}
+     'selection_status': <None or status message>,
+     'cholesky_stats': <dict, see CholeskyStats.get_result_dict()>}
     and additionally may contain 'eff_dim': <float> if compute_eff_dim=True has been passed in **config.
     Times are measured in seconds.
     """
@@ -159,6 +167,20 @@ class BatchSelectorImpl:
         for key in self.data:
             self.data[key] = self.data[key].cast_to(torch.float64)
 
+    def get_posterior_cache_key(self, base_kernel: str, tfm_args: List, use_float64: bool, **config) -> Tuple:
+        """
+        Internal method that returns the key under which a PosteriorCache may reuse its Cholesky factor
+        for a ('train', tfm_args) transformation applied directly to the base kernel.
+        It changes whenever the model parameters or options that affect the base kernel change.
+        """
+        kernel_config = utils.select_from_config(
+            config,
+            ["n_ntk_layers", "n_nngp_layers", "weight_gain", "sigma_b", "laplace_scale", "n_last_layers"]
+            + ["kmer_k", "wd_degree"],
+        )
+        model_hash = hash_tensors([tensor for model in self.models for tensor in model.state_dict().values()])
+        return base_kernel, tuple(tfm_args), use_float64, tuple(sorted(kernel_config.items())), model_hash
+
     def select(
         self,
         base_kernel: str,
@@ -174,7 +196,10 @@ class BatchSelectorImpl:
         The used Batch Active Learning method can be flexibly configured.
         This method may reset the gradients of the parameters of the model(s) provided in the constructor to None.
         :param base_kernel: Base kernel to use. Currently supported base kernels are
-        'll', 'grad', 'lin', 'nngp', 'ntk', and 'laplace'.
+        'll', 'grad', 'lin', 'nngp', 'ntk', 'laplace', 'kmer', and 'wd'.
+        The string kernels 'kmer' (k-mer spectrum kernel, see KmerSpectrumFeatureMap)
+        and 'wd' (weighted degree kernel, see WeightedDegreeFeatureMap)
+        expect the data to contain DNA sequences packed by pack_dna_codes().
         :param kernel_transforms: List of kernel transformations.
         Each kernel transformation is given by a tuple (name, args)
         and the corresponding transformation method is then called with parameters *args.
@@ -226,6 +251,47 @@ class BatchSelectorImpl:
         verbosity=<int> (default=1): Allows to control how much information will be printed.
                                      Set to a value <= 0 if no information should be printed.
         use_cuda_synchronize=True: Use CUDA synchronize for more accurate time measurements.
+        add_block_size=<int> (default=1024): Number of training points that are added at once in TP-mode.
+                                             Distance-based methods process each block with one distance matrix.
+        max_tile_size=<int> (default=2**24): Maximum number of distances held in memory at once
+                                              when maxdist, lcmd, kmeanspp or rmds add points,
+                                              and maximum number of feature matrix entries per block in bait.
+        resync_interval=<int> (default=d // 4): Number of updates after which bait recomputes its state in float64
+                                                from the selected points, see BaitFeatureSpaceSelectionMethod.
+                                                Use 0 to disable resyncing.
+        triangle_pruning=True: Lets maxdist and lcmd skip distance computations for pool points
+                               that cannot get closer to a new center by the triangle inequality.
+        n_cluster_candidates=<int> (default=32): Number of candidate points remembered per cluster in lcmd.
+        kernel_n_threads=<int> (default=1): Number of threads on which the selection method evaluates
+                                            large kernel matrices on the CPU in cache-sized tiles,
+                                            see TiledFeatureMap. PyTorch's thread settings are not changed,
+                                            the number of threads is clamped to torch.get_num_threads().
+        kernel_lookup_table=True: Lets the 'ntk' and 'nngp' base kernels look up kernel values in a table
+                                  over the possible dot products if these are integers, e.g. for one-hot inputs,
+                                  see ReLUKernelLookupTable.
+        kmer_k=<int> (default=3): Length of the k-mers for the 'kmer' base kernel.
+        wd_degree=<int> (default=3): Maximum length of the matching substrings for the 'wd' base kernel.
+        grad_engine=<str> (default='hooks'): How the 'grad' and 'll' base kernels compute gradient features,
+                                             'hooks' (with forward and backward hooks, works for any model)
+                                             or 'func' (with torch.func.vjp, for sequential models,
+                                             see FuncGradTransform).
+        grad_feature_cache=<GradFeatureCache>: Keeps the gradient feature data of the 'grad' and 'll' base kernels
+                                               between calls with the same model,
+                                               such that the model is only evaluated in the first call.
+                                               For ensembles, create it with max_n_models >= len(models).
+        posterior_cache=<PosteriorCache>: Keeps the Cholesky factor of a ('train', [sigma]) transformation
+                                          between calls. It is only used if this is the first transformation
+                                          and a single model is given. If the model is unchanged and the training data
+                                          only got new rows appended, the factor is updated instead of recomputed.
+        lcmd_init_state=<Dict>: State returned by a previous 'lcmd' selection with the same features,
+                                which is continued instead of adding all training points again.
+                                If the features changed, its 'min_sq_dists' can be set to None
+                                to keep only the cluster assignment of the pool.
+                                See LargestClusterMaxDistSelectionMethod for the format.
+        return_selection_state=True: Adds the state of the selection method after selection
+                                     (or None if the method has no reusable state) as 'selection_state' to results.
+        return_features=True: Adds the precomputed Features as 'features' to results,
+                              as a dict with the same keys as the data.
 
         There are a few other options, e.g. for the nngp and ntk kernels,
         which can be found by searching for usages of 'config' in the source code.
@@ -234,7 +300,8 @@ class BatchSelectorImpl:
         containing the selected indices for the pool data. The dictionary results is of the form
         {'kernel_time': {'total': <float>, 'process': <float>},
          'selection_time': {'total': <float>, 'process': <float>},
-         'selection_status': <None or status message>}
+         'selection_status': <None or status message>,
+         'cholesky_stats': <dict, see CholeskyStats.get_result_dict()>}
          and additionally may contain 'eff_dim': <float> if compute_eff_dim=True has been passed in **config.
         """
         if self.has_select_been_called:
@@ -258,6 +325,8 @@ class BatchSelectorImpl:
 
         kernel_timer = utils.Timer()
         kernel_timer.start()
+        cholesky_stats = CholeskyStats()
+        config = utils.update_dict(config, {"cholesky_stats": cholesky_stats})
 
         if base_kernel == "ntk":  # data -> features
             feature_maps = [
@@ -267,6 +336,7 @@ class BatchSelectorImpl:
                     ),
                     sigma_w_sq=config.get("weight_gain", 0.4) ** 2,
                     sigma_b_sq=config.get("sigma_b", 0.0) ** 2,
+                    use_lookup_table=config.get("kernel_lookup_table", False),
                 )
                 for model in self.models
             ]
@@ -282,6 +352,7 @@ class BatchSelectorImpl:
                     ),
                     sigma_w_sq=config.get("weight_gain", 0.25) ** 2,
                     sigma_b_sq=config.get("sigma_b", 0.0) ** 2,
+                    use_lookup_table=config.get("kernel_lookup_table", False),
                 )
                 for model in self.models
             ]
@@ -297,7 +368,15 @@ class BatchSelectorImpl:
                         grad_layers.append(layer)
                     elif type(layer) in grad_dict:
                         grad_layers.append(grad_dict[type(layer)](layer))
-                feature_maps.append(create_grad_feature_map(model, grad_layers, use_float64=use_float64))
+                feature_maps.append(
+                    create_grad_feature_map(
+                        model,
+                        grad_layers,
+                        use_float64=use_float64,
+                        cache=config.get("grad_feature_cache", None),
+                        engine=config.get("grad_engine", "hooks"),
+                    )
+                )
         elif base_kernel == "ll":  # data -> features
             n_last_layers = config.get("n_last_layers", 1)
             feature_maps = []
@@ -310,7 +389,13 @@ class BatchSelectorImpl:
                     elif type(layer) in grad_dict:
                         grad_layers.append(grad_dict[type(layer)](layer))
                 feature_maps.append(
-                    create_grad_feature_map(model, grad_layers[-n_last_layers:], use_float64=use_float64)
+                    create_grad_feature_map(
+                        model,
+                        grad_layers[-n_last_layers:],
+                        use_float64=use_float64,
+                        cache=config.get("grad_feature_cache", None),
+                        engine=config.get("grad_engine", "hooks"),
+                    )
                 )
         elif base_kernel == "linear":
             feature_maps = [
@@ -322,6 +407,15 @@ class BatchSelectorImpl:
             feature_maps = [LaplaceKernelFeatureMap(scale=config.get("laplace_scale", 1.0)) for model in self.models]
             if use_float64:
                 self.to_float64()
+        elif base_kernel in ["kmer", "wd"]:
+            # the packed sequences must not be cast to float64, instead the kernel values are computed in float64
+            dtype = torch.float64 if use_float64 else torch.float32
+            if base_kernel == "kmer":
+                feature_maps = [KmerSpectrumFeatureMap(k=config.get("kmer_k", 3), dtype=dtype) for model in self.models]
+            else:
+                feature_maps = [
+                    WeightedDegreeFeatureMap(degree=config.get("wd_degree", 3), dtype=dtype) for model in self.models
+                ]
         else:
             raise ValueError(f'Unknown base kernel "{base_kernel}"')
 
@@ -334,13 +428,25 @@ class BatchSelectorImpl:
                 # use smaller batch size for NN evaluation
                 self.apply_tfm(i, BatchTransform(batch_size=nn_batch_size))
 
-        for tfm_name, args in kernel_transforms:
+        for tfm_idx, (tfm_name, args) in enumerate(kernel_transforms):
             if tfm_name == "train":
+                tfm_config = config
+                posterior_cache = config.get("posterior_cache", None)
+                if posterior_cache is not None:
+                    # the cached factor can only be reused if the feature map only depends on the model(s),
+                    # i.e. no (random or data-dependent) transformation has been applied before
+                    tfm_config = utils.update_dict(config, remove_keys="posterior_cache")
+                    if tfm_idx == 0 and self.n_models == 1:
+                        posterior_cache.set_context(
+                            self.get_posterior_cache_key(base_kernel, args, use_float64, **config),
+                            self.data["train"].get_tensor(),
+                        )
+                        tfm_config = config
                 for i in range(self.n_models):
                     self.apply_tfm(i, PrecomputeTransform(batch_size=precomp_batch_size))
                     if len(args) >= 2:
                         self.apply_tfm(i, self.features["train"][i].scale_tfm(factor=args[1]))
-                    self.apply_tfm(i, self.features["train"][i].posterior_tfm(args[0], **config))
+                    self.apply_tfm(i, self.features["train"][i].posterior_tfm(args[0], **tfm_config))
             elif tfm_name == "pool":
                 for i in range(self.n_models):
                     self.apply_tfm(i, PrecomputeTransform(batch_size=precomp_batch_size))
@@ -387,6 +493,15 @@ class BatchSelectorImpl:
         for i in range(self.n_models):
             self.apply_tfm(i, PrecomputeTransform(batch_size=precomp_batch_size))
 
+        kernel_n_threads = config.get("kernel_n_threads", 1)
+        if kernel_n_threads > 1:
+            # evaluate the kernel matrices of the selection method in tiles on multiple threads
+            tiled_tfm = LambdaFeaturesTransform(
+                lambda f: Features(TiledFeatureMap(f.feature_map, kernel_n_threads), f.feature_data)
+            )
+            for i in range(self.n_models):
+                self.apply_tfm(i, tiled_tfm)
+
         if config.get("use_cuda_synchronize", False):
             torch.cuda.synchronize(self.device)
 
@@ -426,11 +541,12 @@ class BatchSelectorImpl:
             maxdet_sigma = config.get("maxdet_sigma", 0.0)
             if sel_with_train:
                 n_select += self.features["train"].get_n_samples()
+            # the feature-space version needs O(n_features^2) instead of O(n_pool * n_select) memory
+            # and saves O(n_pool * n_selected) time per step
             if (
                 config.get("allow_maxdet_fs", False)
                 and n_features > 0
-                and n_features * 4 < n_select
-                and maxdet_sigma > 0.0
+                and n_features**2 < self.features["pool"].get_n_samples() * n_select
             ):
                 alg = MaxDetFeatureSpaceSelectionMethod(
                     self.features["pool"], self.features["train"], noise_sigma=maxdet_sigma, **config
@@ -478,11 +594,25 @@ class BatchSelectorImpl:
             "kernel_time": kernel_timer.get_result_dict(),
             "selection_time": selection_timer.get_result_dict(),
             "selection_status": alg.get_status(),
+            "cholesky_stats": cholesky_stats.get_result_dict(),
         }
 
+        if config.get("verbosity", 1) >= 1 and cholesky_stats.n_jittered > 0:
+            print(
+                f"Added jitter to {cholesky_stats.n_jittered}/{cholesky_stats.n_factorizations} Cholesky "
+                f"decompositions, max. relative jitter: {cholesky_stats.max_rel_jitter:g}",
+                flush=True,
+            )
+
         if eff_dim is not None:
             results_dict["eff_dim"] = eff_dim
 
+        if config.get("return_selection_state", False):
+            results_dict["selection_state"] = alg.get_state()
+
+        if config.get("return_features", False):
+            results_dict["features"] = self.features
+
         torch.backends.cuda.matmul.allow_tf32 = allow_tf32_before
 
         return batch_idxs, results_dict
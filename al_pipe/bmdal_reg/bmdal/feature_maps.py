@@ -1,42 +1,245 @@
+import functools
+import hashlib
 import math
 
+from concurrent.futures import ThreadPoolExecutor
+
 from .feature_data import *
 
 
-def robust_cholesky(matrix: torch.Tensor) -> torch.Tensor:
+class CholeskyStats:
+    """
+    Statistics about the factorizations done by robust_cholesky(),
+    to see how often (and how much) jitter had to be added to make a matrix positive definite.
+    BatchSelectorImpl.select() passes a CholeskyStats object as config['cholesky_stats']
+    to the transformations and returns its result dict.
+    """
+
+    def __init__(self):
+        self.n_factorizations = 0
+        self.n_jittered = 0  # number of factorizations that needed jitter
+        self.n_retries = 0  # total number of factorization attempts with jitter
+        self.max_rel_jitter = 0.0  # largest jitter that was added, relative to the mean diagonal element
+
+    def get_result_dict(self) -> Dict[str, Union[int, float]]:
+        return {
+            "n_factorizations": self.n_factorizations,
+            "n_jittered": self.n_jittered,
+            "n_retries": self.n_retries,
+            "max_rel_jitter": self.max_rel_jitter,
+        }
+
+
+def try_cholesky(matrix: torch.Tensor) -> Optional[torch.Tensor]:
+    """
+    :param matrix: Symmetric matrix.
+    :return: Returns the Cholesky factor of matrix or None if the decomposition failed.
+    """
+    # cholesky_ex does not throw, failures show up in info (CPU) or as NaN values (GPU)
+    L, info = torch.linalg.cholesky_ex(matrix)
+    if info.item() != 0 or L.isnan().any().item():
+        return None
+    return L
+
+
+def robust_cholesky(matrix: torch.Tensor, stats: Optional[CholeskyStats] = None) -> torch.Tensor:
     """
     Implements a Cholesky decomposition.
-    If the Cholesky decomposition fails, it is retried with increasing added jitter on the diagonal.
+    If the Cholesky decomposition fails, jitter is added to the diagonal of matrix (in-place) and it is retried.
+    The first jitter is estimated from the smallest eigenvalue of matrix, such that usually one retry suffices.
+    If it still fails, the jitter is doubled for each retry.
     :param matrix: Symmetric positive semi-definite matrix to factorize.
+    :param stats: Optional CholeskyStats to record the factorization in.
     :return: Approximate cholesky factor L such that (approximately) LL^T = matrix
     """
-    eps = 1e-5 * matrix.trace() / matrix.shape[-1] + 1e-30
+    stats = CholeskyStats() if stats is None else stats
+    stats.n_factorizations += 1
+    L = try_cholesky(matrix)
+    if L is not None:
+        return L
+
+    stats.n_jittered += 1
+    diag = matrix.diagonal()  # view, updating it changes matrix
+    mean_diag = diag.mean().item() + 1e-30
+    eps = 1e-5 * mean_diag
+    try:
+        min_eigval = torch.linalg.eigvalsh(matrix)[0].item()
+    except RuntimeError:
+        min_eigval = math.nan
+    # rounding errors of the factorization are not covered by the eigenvalue estimate, hence the factor 2
+    jitter = max(eps, -2 * min_eigval) if math.isfinite(min_eigval) else eps
+    total_jitter = 0.0
     for i in range(15):
-        try:
-            # on the CPU, cholesky can fail by throwing RuntimeError
-            # on the GPU, cholesky can fail by returning NaN values
-            # we catch both cases
-            L = torch.linalg.cholesky(matrix)
-            if not L.isnan().any().item():
-                return L
-        except RuntimeError:
-            pass
-
-        print("Increasing jitter for Cholesky decomposition", flush=True)
-        matrix += eps * torch.eye(matrix.shape[-1], device=matrix.device, dtype=matrix.dtype)
-        eps *= 2
+        diag += jitter
+        total_jitter += jitter
+        stats.n_retries += 1
+        stats.max_rel_jitter = max(stats.max_rel_jitter, total_jitter / mean_diag)
+        L = try_cholesky(matrix)
+        if L is not None:
+            return L
+        jitter = total_jitter
     raise RuntimeError("Could not Cholesky decompose the matrix")
 
 
-def robust_cholesky_inv(matrix: torch.Tensor) -> torch.Tensor:
+def triangular_inverse(L: torch.Tensor) -> torch.Tensor:
+    """
+    :param L: Lower triangular matrix with nonzero diagonal.
+    :return: Returns L^{-1}, computed by a triangular solve, which is faster and more stable than torch.inverse().
+    """
+    eye = torch.eye(L.shape[-1], device=L.device, dtype=L.dtype)
+    return torch.linalg.solve_triangular(L, eye, upper=False)
+
+
+def robust_cholesky_inv(matrix: torch.Tensor, stats: Optional[CholeskyStats] = None) -> torch.Tensor:
     """
     :param matrix: Symmetric positive semi-definite matrix.
+    :param stats: Optional CholeskyStats to record the factorization in.
     :return: A matrix A such that (approximately) matrix^{-1} = A^T A, where A = L^{-1} for the Cholesky factor L.
     """
-    # returns a matrix A such that matrix^{-1} = A^T A
-    L = robust_cholesky(matrix)
-    # there might be a better solution, but I found no direct triangular inversion function
-    return L.inverse()
+    return triangular_inverse(robust_cholesky(matrix, stats))
+
+
+def hash_tensors(tensors: Iterable[torch.Tensor]) -> str:
+    """
+    :param tensors: Tensors to hash, e.g. the values of a model's state_dict().
+    :return: Returns a hex digest of the shapes, dtypes and contents of the tensors.
+    """
+    sha = hashlib.sha1()
+    for tensor in tensors:
+        tensor = tensor.detach().cpu().contiguous()
+        sha.update(f"{tuple(tensor.shape)}{tensor.dtype}".encode())
+        sha.update(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+    return sha.hexdigest()
+
+
+def get_kernel_tile_size(n_features: int, element_size: int, cache_bytes: int = 2**21) -> int:
+    """
+    :param n_features: Feature space dimension of the kernel, or a value <= 0 if it is unknown or infinite.
+    :param element_size: Number of bytes per element of the kernel matrix.
+    :param cache_bytes: Cache budget per thread, by default 2 MiB, which is roughly the L2 cache
+    (or the share of the L3 cache) of a core on current server CPUs.
+    :return: Returns the side length t of square kernel matrix tiles such that the t x t output tile
+    and the two t x n_features input blocks fit into the cache budget, but at least 64.
+    """
+    n_entries = cache_bytes // element_size
+    d = max(n_features, 0)
+    return max(64, int(math.sqrt(d * d + n_entries)) - d)
+
+
+def split_into_tiles(
+    feature_data: FeatureData, idxs: Indexes, tile_size: int
+) -> List[Tuple[int, Indexes, FeatureData]]:
+    """
+    Splits feature_data[idxs] into parts of at most tile_size samples that do not cross the parts of
+    feature_data.iterate(idxs).
+    :return: Returns a list of tuples (offset, sub_idxs, sub_data), where offset is the position of the first sample
+    of the part in feature_data[idxs].
+    """
+    tiles = []
+    offset = 0
+    for sub_idxs, sub_data in feature_data.iterate(idxs):
+        n_sub = len(sub_idxs)
+        for start in range(0, n_sub, tile_size):
+            tile_idxs = sub_idxs.compose(Indexes(n_sub, slice(start, min(start + tile_size, n_sub))))
+            tiles.append((offset + start, tile_idxs, sub_data))
+        offset += n_sub
+    return tiles
+
+
+def cholesky_add_rows(L: torch.Tensor, rows: torch.Tensor) -> torch.Tensor:
+    """
+    Rank-k update of a Cholesky factor.
+    :param L: Lower triangular Cholesky factor of a matrix A of shape [d, d].
+    :param rows: Matrix V of shape [k, d].
+    :return: Returns the lower triangular Cholesky factor of A + V^T V,
+    computed from a QR decomposition of [L^T; V] in O((d + k) d^2) without forming A + V^T V.
+    """
+    if rows.shape[0] == 0:
+        return L
+    R = torch.linalg.qr(torch.cat([L.t(), rows], dim=0), mode="r")[1]
+    # R^T R = L L^T + V^T V, fix the signs such that the diagonal is positive
+    signs = torch.where(torch.diagonal(R) < 0, -1.0, 1.0).to(R.dtype)
+    return (signs[:, None] * R).t()
+
+
+def cholesky_extend(
+    L: torch.Tensor, cross_matrix: torch.Tensor, new_matrix: torch.Tensor, stats: Optional[CholeskyStats] = None
+) -> torch.Tensor:
+    """
+    Extend a Cholesky factor to a matrix with additional rows and columns.
+    :param L: Lower triangular Cholesky factor of a matrix A of shape [n, n].
+    :param cross_matrix: Matrix B of shape [n, k].
+    :param new_matrix: Symmetric matrix C of shape [k, k].
+    :param stats: Optional CholeskyStats to record the factorization of the Schur complement in.
+    :return: Returns the lower triangular Cholesky factor of [[A, B], [B^T, C]],
+    which only requires a Cholesky decomposition of the Schur complement C - B^T A^{-1} B.
+    """
+    if new_matrix.shape[0] == 0:
+        return L
+    L_cross = torch.linalg.solve_triangular(L, cross_matrix, upper=False).t()
+    L_new = robust_cholesky(new_matrix - L_cross @ L_cross.t(), stats)
+    top = torch.cat([L, torch.zeros_like(cross_matrix)], dim=1)
+    return torch.cat([top, torch.cat([L_cross, L_new], dim=1)], dim=0)
+
+
+class PosteriorCache:
+    """
+    Keeps the Cholesky factor used by FeatureMap.posterior() between calls,
+    for example between active learning rounds in which the training set only grows.
+    If the data to condition on consists of the rows the factor was computed from followed by new rows,
+    the factor is updated with cholesky_add_rows() (feature space) or cholesky_extend() (kernel space)
+    instead of being recomputed. The caller is responsible for calling set_context() with a key
+    that changes whenever the feature map changes, e.g. because the model has been retrained,
+    which forces a full factorization.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.data_hash = None
+        self.n_rows = 0
+        self.kernel_space = None
+        self.L = None
+        self.cond_tensor = None
+        self.n_updates = 0  # number of times the factor was updated instead of recomputed
+
+    def set_context(self, key: Any, cond_tensor: torch.Tensor):
+        """
+        Set the context for the next posterior computation and drop the cached factor if it cannot be reused.
+        :param key: Hashable key identifying the feature map, e.g. containing a fingerprint of the model parameters.
+        :param cond_tensor: Raw input tensor of the data that will be conditioned on,
+        used to check that the rows of the cached factor are still the first rows of this data.
+        """
+        if (
+            key != self.key
+            or len(cond_tensor) < self.n_rows
+            or hash_tensors([cond_tensor[: self.n_rows]]) != self.data_hash
+        ):
+            self.L = None
+            self.n_rows = 0
+            self.data_hash = None
+        self.key = key
+        self.cond_tensor = cond_tensor
+
+    def get(self, kernel_space: bool) -> Tuple[Optional[torch.Tensor], int]:
+        """
+        :param kernel_space: Whether the factor is needed for the kernel-space posterior.
+        :return: Returns a tuple (L, n_rows) of the cached factor and the number of rows it was computed from,
+        or (None, 0) if there is no cached factor of the given kind.
+        """
+        if self.L is None or self.kernel_space != kernel_space:
+            return None, 0
+        return self.L, self.n_rows
+
+    def store(self, L: torch.Tensor, n_rows: int, kernel_space: bool):
+        """
+        :param L: Cholesky factor computed from the first n_rows rows of the data set in set_context().
+        :param n_rows: Number of rows.
+        :param kernel_space: Whether L is the factor of the kernel matrix or of the feature covariance matrix.
+        """
+        self.L = L
+        self.n_rows = n_rows
+        self.kernel_space = kernel_space
+        self.data_hash = hash_tensors([self.cond_tensor[:n_rows]])
 
 
 class DataTransform:
@@ -147,7 +350,12 @@ class FeatureMap(DataTransform):
         return self, feature_data[idxs]
 
     def posterior(
-        self, feature_data: FeatureData, sigma: float, allow_kernel_space_posterior: bool = True
+        self,
+        feature_data: FeatureData,
+        sigma: float,
+        allow_kernel_space_posterior: bool = True,
+        posterior_cache: Optional[PosteriorCache] = None,
+        cholesky_stats: Optional[CholeskyStats] = None,
     ) -> "FeatureMap":
         """
         Returns a feature map that represents the Gaussian Process posterior kernel after observing feature_data,
@@ -158,18 +366,45 @@ class FeatureMap(DataTransform):
         if it is deemed more efficient but not strictly necessary. The kernel-space posterior feature map returned
         will not allow a computation of the feature matrix, which could be detrimental
         for methods that want to operate in feature space.
+        :param posterior_cache: Optional PosteriorCache whose context has been set for feature_data.
+        If it contains a factor for the first rows of feature_data, only the remaining rows are processed.
+        :param cholesky_stats: Optional CholeskyStats to record the Cholesky decompositions in.
         :return: Returns a feature map that represents the Gaussian Process posterior kernel after observing feature_data,
         if the noise variance is sigma^2.
         """
-        if self.n_features < 0 or (allow_kernel_space_posterior and self.n_features > max(1024, 3 * len(feature_data))):
+        n_rows = feature_data.get_n_samples()
+        if self.n_features < 0 or (allow_kernel_space_posterior and self.n_features > max(1024, 3 * n_rows)):
             # compute the posterior in kernel space
-            return KernelSpacePosteriorFeatureMap(feature_map=self, cond_data=feature_data, sigma=sigma)
-
-        feature_matrix = self.get_feature_matrix(feature_data)
-        eye = torch.eye(self.n_features, device=feature_matrix.device, dtype=feature_matrix.dtype)
-        cov_matrix = feature_matrix.t().matmul(feature_matrix) + (sigma**2) * eye
+            L = None
+            if posterior_cache is not None:
+                L, n_cached = posterior_cache.get(kernel_space=True)
+                if L is not None:
+                    old_idxs, new_idxs = slice(0, n_cached), slice(n_cached, n_rows)
+                    cross_matrix = self.get_kernel_matrix(feature_data, feature_data, old_idxs, new_idxs)
+                    new_matrix = self.get_kernel_matrix(feature_data, feature_data, new_idxs, new_idxs)
+                    eye = torch.eye(n_rows - n_cached, device=new_matrix.device, dtype=new_matrix.dtype)
+                    L = cholesky_extend(L, cross_matrix, new_matrix + sigma**2 * eye, cholesky_stats)
+                    posterior_cache.n_updates += 1
+            fm = KernelSpacePosteriorFeatureMap(
+                feature_map=self, cond_data=feature_data, sigma=sigma, L=L, cholesky_stats=cholesky_stats
+            )
+            if posterior_cache is not None:
+                posterior_cache.store(fm.L, n_rows, kernel_space=True)
+            return fm
+
+        L, n_cached = (None, 0) if posterior_cache is None else posterior_cache.get(kernel_space=False)
+        if L is not None:
+            L = cholesky_add_rows(L, self.get_feature_matrix(feature_data, slice(n_cached, n_rows)))
+            posterior_cache.n_updates += 1
+        else:
+            feature_matrix = self.get_feature_matrix(feature_data)
+            eye = torch.eye(self.n_features, device=feature_matrix.device, dtype=feature_matrix.dtype)
+            cov_matrix = feature_matrix.t().matmul(feature_matrix) + (sigma**2) * eye
+            L = robust_cholesky(cov_matrix, cholesky_stats)
+        if posterior_cache is not None:
+            posterior_cache.store(L, n_rows, kernel_space=False)
 
-        return SequentialFeatureMap(LinearFeatureMap(sigma * robust_cholesky_inv(cov_matrix).t()), [self])
+        return SequentialFeatureMap(LinearFeatureMap(sigma * triangular_inverse(L).t()), [self])
 
     def get_feature_matrix(self, feature_data: FeatureData, idxs: Optional[Indexes] = None) -> torch.Tensor:
         """
@@ -313,6 +548,99 @@ class IdentityFeatureMap(FeatureMap):
         return SequentialFeatureMap(LinearFeatureMap(matrix), [self])
 
 
+class ReLUKernelLookupTable:
+    """
+    Lookup tables for kernels on inputs whose squared norms and pairwise dot products are integers,
+    for example one-hot encoded DNA sequences, where the squared norm is the number of positions that are not
+    padding or N (which are all-zero rows), and the dot product is the number of matching positions.
+    Then, the kernel value only depends on (|x|^2, |y|^2, <x, y>) with 0 <= <x, y> <= min(|x|^2, |y|^2).
+    For each kernel, one table of shape [n_norms, n_norms, max_norm + 1] over all squared norms seen so far
+    is evaluated in a single vectorized call, and afterwards the kernel matrix is gathered from it.
+    If new squared norms occur, only the table entries involving them are evaluated.
+    This is used by ReLUNTKFeatureMap and ReLUNNGPFeatureMap with use_lookup_table=True.
+    """
+
+    def __init__(self):
+        # maps (key, dtype, device) to (sorted squared norms, table)
+        self.tables: Dict[Tuple, Tuple[torch.Tensor, torch.Tensor]] = {}
+
+    @staticmethod
+    def evaluate_(
+        kernel_fn: Callable, sq_norms_1: torch.Tensor, sq_norms_2: torch.Tensor, n_dots: int, dtype
+    ) -> torch.Tensor:
+        """
+        :param kernel_fn: Function mapping (dot products, squared norms 1, squared norms 2) to kernel values.
+        :param sq_norms_1: Squared norms of shape [n_1].
+        :param sq_norms_2: Squared norms of shape [n_2].
+        :param n_dots: Number of dot products 0, ..., n_dots - 1 to evaluate the kernel on.
+        :return: Returns the kernel values of shape [n_1, n_2, n_dots].
+        Dot products larger than min(sq_norm_1, sq_norm_2) are impossible and are clamped to this value.
+        """
+        sq_norms_1 = sq_norms_1.type(dtype)[:, None, None]
+        sq_norms_2 = sq_norms_2.type(dtype)[None, :, None]
+        dots = torch.arange(n_dots, dtype=dtype, device=sq_norms_1.device)[None, None, :]
+        dots = torch.minimum(dots, torch.minimum(sq_norms_1, sq_norms_2))
+        return kernel_fn(dots, sq_norms_1, sq_norms_2)
+
+    def get_table(
+        self, kernel_fn: Callable, key: Tuple, sq_norms: torch.Tensor, dtype
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        :param kernel_fn: Function mapping (dot products, squared norms 1, squared norms 2) to kernel values.
+        :param key: Additional key identifying kernel_fn.
+        :param sq_norms: Tensor of integer squared norms that the table must contain.
+        :return: Returns a tuple (norms, table), where norms is the sorted tensor of squared norms in the table
+        and table[i, j, d] is the kernel value for the squared norms norms[i], norms[j] and the dot product d.
+        """
+        full_key = (key, dtype, str(sq_norms.device))
+        norms, table = self.tables.get(full_key, (None, None))
+        if norms is not None and bool(torch.isin(sq_norms, norms).all()):
+            return norms, table
+        if norms is None:
+            new_norms = torch.unique(sq_norms)
+            new_table = self.evaluate_(kernel_fn, new_norms, new_norms, int(new_norms[-1]) + 1, dtype)
+        else:
+            new_norms = torch.unique(torch.cat([norms, sq_norms]))
+            n_dots = int(new_norms[-1]) + 1
+            new_table = torch.empty(len(new_norms), len(new_norms), n_dots, dtype=dtype, device=table.device)
+            # copy the entries of the old table and only evaluate those involving new squared norms
+            old_pos = torch.searchsorted(new_norms, norms)
+            is_new = torch.ones(len(new_norms), dtype=torch.bool, device=table.device)
+            is_new[old_pos] = False
+            added_pos = is_new.nonzero()[:, 0]
+            new_table[old_pos[:, None], old_pos[None, :], : table.shape[-1]] = table
+            new_table[added_pos] = self.evaluate_(kernel_fn, new_norms[added_pos], new_norms, n_dots, dtype)
+            new_table[old_pos[:, None], added_pos[None, :]] = self.evaluate_(
+                kernel_fn, norms, new_norms[added_pos], n_dots, dtype
+            )
+        self.tables[full_key] = (new_norms, new_table)
+        return new_norms, new_table
+
+    def lookup(
+        self,
+        kernel_fn: Callable,
+        key: Tuple,
+        dot_mat: torch.Tensor,
+        sq_norms_1: torch.Tensor,
+        sq_norms_2: torch.Tensor,
+    ) -> Optional[torch.Tensor]:
+        """
+        :param kernel_fn: Function mapping (dot products, squared norms 1, squared norms 2) to kernel values.
+        :param key: Additional key identifying kernel_fn.
+        :param dot_mat: Matrix of dot products between the inputs, of shape [n_1, n_2].
+        :param sq_norms_1: Squared norms of the first inputs, of shape [n_1].
+        :param sq_norms_2: Squared norms of the second inputs, of shape [n_2].
+        :return: Returns the kernel matrix, or None if the dot products or norms are not all integers.
+        """
+        if not all(torch.equal(t, t.round()) for t in [dot_mat, sq_norms_1, sq_norms_2]):
+            return None
+        sq_norms_1, sq_norms_2 = sq_norms_1.long(), sq_norms_2.long()
+        norms, table = self.get_table(kernel_fn, key, torch.cat([sq_norms_1, sq_norms_2]), dot_mat.dtype)
+        pos_1 = torch.searchsorted(norms, sq_norms_1)
+        pos_2 = torch.searchsorted(norms, sq_norms_2)
+        return table[pos_1[:, None], pos_2[None, :], dot_mat.long()]
+
+
 class ReLUNTKFeatureMap(FeatureMap):
     """
     This feature map represents the Neural Tangent Kernel (Jacot et al., 2018) corresponding to a ReLU NN
@@ -322,16 +650,19 @@ class ReLUNTKFeatureMap(FeatureMap):
 
     # following SM 3 and 5 in
     # https://proceedings.neurips.cc/paper/2019/hash/0d1a9651497a38d8b1c3871c84528bd4-Abstract.html
-    def __init__(self, n_layers=3, sigma_w_sq=2.0, sigma_b_sq=0.0):
+    def __init__(self, n_layers=3, sigma_w_sq=2.0, sigma_b_sq=0.0, use_lookup_table: bool = False):
         """
         :param n_layers: Number of layers of the corresponding NN
         :param sigma_w_sq: sigma_w**2 in the notation of Lee et al. (2019)
         :param sigma_b_sq: sigma_b**2 in the notation of Lee et al. (2019)
+        :param use_lookup_table: If True and the inputs have integer-valued dot products (e.g. one-hot encodings),
+        kernel values are looked up in a ReLUKernelLookupTable instead of evaluating the recursion for every pair.
         """
         super().__init__(n_features=-1, allow_precompute_features=False)
         self.n_layers = n_layers
         self.sigma_w_sq = sigma_w_sq
         self.sigma_b_sq = sigma_b_sq
+        self.lookup_table = ReLUKernelLookupTable() if use_lookup_table else None
 
     def t_and_tdot_(self, a: torch.Tensor, b: torch.Tensor, d: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
         a_sqrt = a.sqrt()
@@ -354,12 +685,25 @@ class ReLUNTKFeatureMap(FeatureMap):
         feature_mat_2 = feature_data_2.get_tensor(idxs_2)
         kernel_mat = feature_mat_1.matmul(feature_mat_2.t())
         d_in = feature_mat_1.shape[1]
-        diag_1 = self.sigma_w_sq / d_in * (feature_mat_1**2).sum(dim=1) + self.sigma_b_sq
-        diag_2 = self.sigma_w_sq / d_in * (feature_mat_2**2).sum(dim=1) + self.sigma_b_sq
+        sq_norms_1 = (feature_mat_1**2).sum(dim=1)
+        sq_norms_2 = (feature_mat_2**2).sum(dim=1)
+        if self.lookup_table is not None:
+            kernel_fn = functools.partial(self.kernel_from_dot_products_, d_in=d_in)
+            ntk_mat = self.lookup_table.lookup(kernel_fn, (d_in,), kernel_mat, sq_norms_1, sq_norms_2)
+            if ntk_mat is not None:
+                return ntk_mat
+        return self.kernel_from_dot_products_(kernel_mat, sq_norms_1[:, None], sq_norms_2[None, :], d_in)
+
+    def kernel_from_dot_products_(
+        self, kernel_mat: torch.Tensor, sq_norms_1: torch.Tensor, sq_norms_2: torch.Tensor, d_in: int
+    ) -> torch.Tensor:
+        # evaluates the layer recursion from the input dot products and squared norms (broadcastable to kernel_mat)
+        diag_1 = self.sigma_w_sq / d_in * sq_norms_1 + self.sigma_b_sq
+        diag_2 = self.sigma_w_sq / d_in * sq_norms_2 + self.sigma_b_sq
         nngp_mat = self.sigma_w_sq / d_in * kernel_mat + self.sigma_b_sq
         ntk_mat = nngp_mat
         for i in range(self.n_layers - 1):
-            t, tdot = self.t_and_tdot_(diag_1[:, None], nngp_mat, diag_2[None, :])
+            t, tdot = self.t_and_tdot_(diag_1, nngp_mat, diag_2)
             nngp_mat = self.sigma_w_sq * t + self.sigma_b_sq
             ntk_mat = nngp_mat + self.sigma_w_sq * ntk_mat * tdot
             diag_1 = self.diag_prop_(diag_1)
@@ -384,16 +728,19 @@ class ReLUNNGPFeatureMap(FeatureMap):
     and where the biases are initialized from N(0, 1).
     """
 
-    def __init__(self, n_layers=3, sigma_w_sq=2.0, sigma_b_sq=0.0):
+    def __init__(self, n_layers=3, sigma_w_sq=2.0, sigma_b_sq=0.0, use_lookup_table: bool = False):
         """
         :param n_layers: Number of layers of the corresponding NN
         :param sigma_w_sq: sigma_w**2 in the notation of Lee et al. (2019)
         :param sigma_b_sq: sigma_b**2 in the notation of Lee et al. (2019)
+        :param use_lookup_table: If True and the inputs have integer-valued dot products (e.g. one-hot encodings),
+        kernel values are looked up in a ReLUKernelLookupTable instead of evaluating the recursion for every pair.
         """
         super().__init__(n_features=-1, allow_precompute_features=False)
         self.n_layers = n_layers
         self.sigma_w_sq = sigma_w_sq
         self.sigma_b_sq = sigma_b_sq
+        self.lookup_table = ReLUKernelLookupTable() if use_lookup_table else None
 
     def get_t_(self, a: torch.Tensor, b: torch.Tensor, d: torch.Tensor) -> torch.Tensor:
         a_sqrt = a.sqrt()
@@ -415,11 +762,24 @@ class ReLUNNGPFeatureMap(FeatureMap):
         feature_mat_2 = feature_data_2.get_tensor(idxs_2)
         kernel_mat = feature_mat_1.matmul(feature_mat_2.t())
         d_in = feature_mat_1.shape[1]
-        diag_1 = self.sigma_w_sq / d_in * (feature_mat_1**2).sum(dim=1) + self.sigma_b_sq
-        diag_2 = self.sigma_w_sq / d_in * (feature_mat_2**2).sum(dim=1) + self.sigma_b_sq
+        sq_norms_1 = (feature_mat_1**2).sum(dim=1)
+        sq_norms_2 = (feature_mat_2**2).sum(dim=1)
+        if self.lookup_table is not None:
+            kernel_fn = functools.partial(self.kernel_from_dot_products_, d_in=d_in)
+            nngp_mat = self.lookup_table.lookup(kernel_fn, (d_in,), kernel_mat, sq_norms_1, sq_norms_2)
+            if nngp_mat is not None:
+                return nngp_mat
+        return self.kernel_from_dot_products_(kernel_mat, sq_norms_1[:, None], sq_norms_2[None, :], d_in)
+
+    def kernel_from_dot_products_(
+        self, kernel_mat: torch.Tensor, sq_norms_1: torch.Tensor, sq_norms_2: torch.Tensor, d_in: int
+    ) -> torch.Tensor:
+        # evaluates the layer recursion from the input dot products and squared norms (broadcastable to kernel_mat)
+        diag_1 = self.sigma_w_sq / d_in * sq_norms_1 + self.sigma_b_sq
+        diag_2 = self.sigma_w_sq / d_in * sq_norms_2 + self.sigma_b_sq
         nngp_mat = self.sigma_w_sq / d_in * kernel_mat + self.sigma_b_sq
         for i in range(self.n_layers - 1):
-            t = self.get_t_(diag_1[:, None], nngp_mat, diag_2[None, :])
+            t = self.get_t_(diag_1, nngp_mat, diag_2)
             nngp_mat = self.sigma_w_sq * t + self.sigma_b_sq
             diag_1 = self.diag_prop_(diag_1)
             diag_2 = self.diag_prop_(diag_2)
@@ -464,23 +824,286 @@ class LaplaceKernelFeatureMap(FeatureMap):
         return torch.ones_like(feature_mat[:, 0])
 
 
+# mask selecting the lower bit of every 2-bit slot of an int64 word
+LOW_SLOT_BITS = 0x5555555555555555
+N_SLOTS_PER_WORD = 32
+
+
+def popcount(x: torch.Tensor) -> torch.Tensor:
+    """
+    Counts the set bits of each element of an int64 tensor, since PyTorch has no popcount operation.
+    This uses the usual bit-parallel summation of neighboring bit groups. All right shifts are arithmetic,
+    which is harmless here since the sign bits they bring in are masked out afterwards.
+    :param x: Tensor of dtype torch.int64.
+    :return: Returns an int64 tensor of the same shape containing the number of set bits in each element.
+    """
+    x = x - ((x >> 1) & 0x5555555555555555)
+    x = (x & 0x3333333333333333) + ((x >> 2) & 0x3333333333333333)
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0F
+    x = x + (x >> 8)
+    x = x + (x >> 16)
+    x = x + (x >> 32)
+    return x & 0x7F
+
+
+def pack_dna_codes(codes: torch.Tensor) -> torch.Tensor:
+    """
+    Packs nucleotide codes into 2 bits per position,
+    which is the input format of KmerSpectrumFeatureMap and WeightedDegreeFeatureMap.
+    The codes 0-3 are the four nucleotides, all other codes (e.g. N and padding) are treated as invalid positions,
+    which never match any other position.
+    Every sequence is stored as n_words = ceil(length / 32) int64 words holding the codes
+    followed by n_words int64 words whose bits are set for the valid positions.
+    This uses 4 bits per position, i.e. 32x less memory than a float32 one-hot encoding
+    and 16x less than a float16 one-hot encoding.
+    :param codes: Integer tensor (or array) of shape [n_samples, length].
+    :return: Returns a tensor of dtype torch.int64 and shape [n_samples, 2 * n_words].
+    """
+    codes = torch.as_tensor(codes)
+    n_samples, length = codes.shape
+    n_words = max(1, -(-length // N_SLOTS_PER_WORD))
+    valid = (codes >= 0) & (codes < 4)
+    padded_codes = torch.zeros(n_samples, n_words * N_SLOTS_PER_WORD, dtype=torch.int64, device=codes.device)
+    padded_codes[:, :length] = torch.where(valid, codes.long(), 0)
+    padded_valid = torch.zeros_like(padded_codes)
+    padded_valid[:, :length] = 3 * valid.long()
+    shifts = 2 * torch.arange(N_SLOTS_PER_WORD, device=codes.device)
+    # the bits of different slots do not overlap, hence the sum is a bitwise or
+    code_words = (padded_codes.view(n_samples, n_words, N_SLOTS_PER_WORD) << shifts).sum(dim=-1)
+    valid_words = (padded_valid.view(n_samples, n_words, N_SLOTS_PER_WORD) << shifts).sum(dim=-1)
+    return torch.cat([code_words, valid_words], dim=-1)
+
+
+def unpack_dna_codes(packed: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Inverse of pack_dna_codes(), except that invalid positions get the code 0
+    and the length is rounded up to a multiple of 32.
+    :param packed: Packed sequences of shape [n_samples, 2 * n_words].
+    :return: Returns a tuple (codes, valid) of an int64 tensor and a bool tensor of shape [n_samples, 32 * n_words].
+    """
+    n_words = packed.shape[-1] // 2
+    shifts = 2 * torch.arange(N_SLOTS_PER_WORD, device=packed.device)
+    codes = (packed[:, :n_words, None] >> shifts) & 3
+    valid = ((packed[:, n_words:, None] >> shifts) & 1) == 1
+    return codes.flatten(start_dim=-2), valid.flatten(start_dim=-2)
+
+
+def iterate_kmer_ids(codes: torch.Tensor, valid: torch.Tensor, max_k: int):
+    """
+    Generator yielding the integer ids of the k-mers at each position of unpacked sequences for k = 1, ..., max_k.
+    The id of a k-mer is sum_j code_j * 4^(k-1-j).
+    :param codes: int64 tensor of shape [n_samples, length] as returned by unpack_dna_codes().
+    :param valid: bool tensor of shape [n_samples, length] as returned by unpack_dna_codes().
+    :param max_k: Maximum k-mer length.
+    :return: Yields tuples (k, ids, ids_valid) of tensors of shape [n_samples, length - k + 1],
+    where ids_valid specifies whether the k-mer only contains valid positions.
+    """
+    ids, ids_valid = codes, valid
+    for k in range(1, max_k + 1):
+        if k > 1:
+            ids = 4 * ids[:, :-1] + codes[:, k - 1 :]
+            ids_valid = ids_valid[:, :-1] & valid[:, k - 1 :]
+        yield k, ids, ids_valid
+
+
+class KmerSpectrumFeatureMap(FeatureMap):
+    """
+    Implements the k-mer spectrum kernel k(x, y) = sum_u c_u(x) c_u(y) on DNA sequences packed by pack_dna_codes(),
+    where c_u(x) is the number of occurrences of the k-mer u in x.
+    The feature map consists of the counts of all 4^k k-mers, k-mers containing invalid positions are not counted.
+    Since the feature space dimension grows quickly with k, the features are not precomputed
+    but computed from the packed sequences whenever they are needed.
+    """
+
+    def __init__(self, k: int = 3, dtype=torch.float32):
+        """
+        :param k: Length of the k-mers.
+        :param dtype: dtype of the features and kernel values.
+        """
+        super().__init__(n_features=4**k, allow_precompute_features=False)
+        self.k = k
+        self.dtype = dtype
+
+    def get_weighted_keys(self, packed: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Returns the non-negative integer keys of the feature space coordinates occurring in the packed sequences,
+        such that the feature vector of a sequence is the sum of the weights times the unit vectors of the keys.
+        This is used by HashedSequenceFeatureMap.
+        :param packed: Packed sequences of shape [n_samples, 2 * n_words].
+        :return: Returns a tuple (keys, weights) of tensors of shape [n_samples, n_keys].
+        """
+        codes, valid = unpack_dna_codes(packed)
+        for k, ids, ids_valid in iterate_kmer_ids(codes, valid, self.k):
+            if k == self.k:
+                return ids, ids_valid.type(self.dtype)
+
+    def get_feature_matrix_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        keys, weights = self.get_weighted_keys(feature_data.get_tensor(idxs))
+        counts = torch.zeros(keys.shape[0], self.n_features, dtype=self.dtype, device=keys.device)
+        return counts.scatter_add_(1, keys, weights)
+
+    def get_kernel_matrix_impl_(
+        self, feature_data_1: FeatureData, feature_data_2: FeatureData, idxs_1: Indexes, idxs_2: Indexes
+    ) -> torch.Tensor:
+        counts_1 = self.get_feature_matrix_impl_(feature_data_1, idxs_1)
+        counts_2 = self.get_feature_matrix_impl_(feature_data_2, idxs_2)
+        return counts_1.matmul(counts_2.t())
+
+    def get_kernel_matrix_diag_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        return (self.get_feature_matrix_impl_(feature_data, idxs) ** 2).sum(dim=-1)
+
+    def sketch(self, n_features: int, **config) -> "FeatureMap":
+        return HashedSequenceFeatureMap(self, n_features)
+
+
+class WeightedDegreeFeatureMap(FeatureMap):
+    """
+    Implements the weighted degree kernel k(x, y) = sum_{d=1}^D beta_d sum_l 1[x_{l:l+d} = y_{l:l+d}]
+    with beta_d = 2(D-d+1) / (D(D+1)) on DNA sequences packed by pack_dna_codes(),
+    i.e. a weighted count of the position-wise matching substrings of length at most D,
+    where substrings containing invalid positions never match. For D = 1, this is the Hamming similarity.
+    The kernel is evaluated on the packed sequences: the positions where two sequences match are obtained
+    for 32 positions at once by xor-ing their words, matches of length d are obtained from those of length d-1
+    by a shifted and, and they are counted with popcount().
+    """
+
+    def __init__(self, degree: int = 3, dtype=torch.float32, max_block_size: int = 2**16):
+        """
+        :param degree: Maximum substring length D.
+        :param dtype: dtype of the kernel values.
+        :param max_block_size: Maximum number of int64 words of pairwise match bits held in memory at once.
+        The default of 512 KiB keeps the intermediate results in the cache, which is considerably faster.
+        """
+        super().__init__(n_features=-1, allow_precompute_features=False)
+        self.degree = degree
+        self.dtype = dtype
+        self.max_block_size = max_block_size
+        self.weights = [2 * (degree - d + 1) / (degree * (degree + 1)) for d in range(1, degree + 1)]
+
+    def count_matches(self, match: torch.Tensor) -> torch.Tensor:
+        """
+        :param match: int64 tensor of shape [..., n_words] whose lower slot bits are set at the matching positions.
+        :return: Returns the tensor of shape [...] containing the weighted counts of matching substrings.
+        """
+        result = torch.zeros(match.shape[:-1], dtype=self.dtype, device=match.device)
+        run = match
+        for d, weight in enumerate(self.weights):
+            if d > 0:
+                # a substring of length d+1 matches at l if those of length d match at l and at l+1
+                next_words = torch.zeros_like(run)
+                next_words[..., :-1] = run[..., 1:] & 1
+                run = run & (((run >> 2) & LOW_SLOT_BITS) | (next_words << 62))
+            result += weight * popcount(run).sum(dim=-1).type(self.dtype)
+        return result
+
+    def get_kernel_matrix_impl_(
+        self, feature_data_1: FeatureData, feature_data_2: FeatureData, idxs_1: Indexes, idxs_2: Indexes
+    ) -> torch.Tensor:
+        packed_1 = feature_data_1.get_tensor(idxs_1)
+        packed_2 = feature_data_2.get_tensor(idxs_2)
+        n_words = packed_1.shape[-1] // 2
+        codes_2 = packed_2[None, :, :n_words]
+        valid_2 = packed_2[None, :, n_words:] & LOW_SLOT_BITS
+        block_size = max(1, self.max_block_size // max(1, packed_2.shape[0] * n_words))
+        results = []
+        for start in range(0, packed_1.shape[0], block_size):
+            block = packed_1[start : start + block_size, None, :]
+            diff = block[:, :, :n_words] ^ codes_2
+            match = ~(diff | (diff >> 1)) & block[:, :, n_words:] & valid_2
+            results.append(self.count_matches(match))
+        return torch_cat(results, dim=-2)
+
+    def get_kernel_matrix_diag_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        packed = feature_data.get_tensor(idxs)
+        return self.count_matches(packed[:, packed.shape[-1] // 2 :] & LOW_SLOT_BITS)
+
+    def get_weighted_keys(self, packed: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Returns the non-negative integer keys of the feature space coordinates occurring in the packed sequences,
+        such that the feature vector of a sequence is the sum of the weights times the unit vectors of the keys.
+        Here, the coordinates are the (substring length, position, substring) triples.
+        This is used by HashedSequenceFeatureMap.
+        :param packed: Packed sequences of shape [n_samples, 2 * n_words].
+        :return: Returns a tuple (keys, weights) of tensors of shape [n_samples, n_keys].
+        """
+        codes, valid = unpack_dna_codes(packed)
+        length = codes.shape[-1]
+        all_keys, all_weights = [], []
+        for d, ids, ids_valid in iterate_kmer_ids(codes, valid, self.degree):
+            positions = torch.arange(ids.shape[-1], device=ids.device)
+            all_keys.append((((d - 1) * length + positions) << (2 * self.degree)) + ids)
+            all_weights.append(math.sqrt(self.weights[d - 1]) * ids_valid.type(self.dtype))
+        return torch.cat(all_keys, dim=-1), torch.cat(all_weights, dim=-1)
+
+    def sketch(self, n_features: int, **config) -> "FeatureMap":
+        return HashedSequenceFeatureMap(self, n_features)
+
+
+class HashedSequenceFeatureMap(FeatureMap):
+    """
+    Count sketch (a.k.a. feature hashing) of KmerSpectrumFeatureMap or WeightedDegreeFeatureMap.
+    Every key returned by get_weighted_keys() of the sketched feature map is hashed to one of n_features coordinates
+    and a random sign, such that the inner products of the hashed feature vectors
+    are unbiased estimates of the kernel values. Since the keys are hashed with a random multiply-shift hash function,
+    the 4^k or more coordinates of the sketched feature map never need to be materialized.
+    """
+
+    def __init__(self, feature_map: FeatureMap, n_features: int):
+        """
+        :param feature_map: Feature map that provides get_weighted_keys().
+        :param n_features: Number of target features.
+        """
+        super().__init__(n_features=n_features)
+        self.feature_map = feature_map
+        # odd multiplier for the multiply-shift hash function
+        self.multiplier = 2 * int(torch.randint(2**62, ())) + 1
+        self.offset = int(torch.randint(2**62, ()))
+
+    def get_feature_matrix_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        keys, weights = self.feature_map.get_weighted_keys(feature_data.get_tensor(idxs))
+        # the multiplication overflows, which leaves the lower 64 bits of the product as intended
+        hashes = keys * self.multiplier + self.offset
+        coordinates = ((hashes >> 32) & 0x7FFFFFFF) % self.n_features
+        signs = 1 - 2 * ((hashes >> 31) & 1)
+        features = torch.zeros(keys.shape[0], self.n_features, dtype=weights.dtype, device=keys.device)
+        return features.scatter_add_(1, coordinates, weights * signs.type(weights.dtype))
+
+    def sketch(self, n_features: int, **config) -> "FeatureMap":
+        # sketch by using the sketching function of IdentityFeatureMap
+        return SequentialFeatureMap(IdentityFeatureMap(n_features=self.get_n_features()), [self]).sketch(
+            n_features, **config
+        )
+
+
 class KernelSpacePosteriorFeatureMap(FeatureMap):
     """
     This internal class represents the posterior kernel of a GP after observing data.
     This is used internally by FeatureMap.posterior().
     """
 
-    def __init__(self, feature_map: FeatureMap, cond_data: FeatureData, sigma: float):
+    def __init__(
+        self,
+        feature_map: FeatureMap,
+        cond_data: FeatureData,
+        sigma: float,
+        L: Optional[torch.Tensor] = None,
+        cholesky_stats: Optional[CholeskyStats] = None,
+    ):
         """
         :param feature_map: Prior feature map.
         :param cond_data: Data that the GP is conditioned on.
         :param sigma: Noise standard deviation of the GP.
+        :param L: Optional precomputed Cholesky factor of k(cond_data, cond_data) + sigma^2 I.
+        :param cholesky_stats: Optional CholeskyStats to record the Cholesky decomposition in if L is None.
         """
         super().__init__(n_features=-1, allow_precompute_features=False)
-        mat = feature_map.get_kernel_matrix(cond_data, cond_data)
+        if L is None:
+            mat = feature_map.get_kernel_matrix(cond_data, cond_data)
+            eye = torch.eye(mat.shape[0], device=mat.device, dtype=mat.dtype)
+            L = robust_cholesky(mat + sigma**2 * eye, cholesky_stats)
+        self.L = L
         # (K + sigma*I)^{-1} = L_inv.t() @ L_inv
-        eye = torch.eye(mat.shape[0], device=mat.device, dtype=mat.dtype)
-        self.L_inv = robust_cholesky_inv(mat + sigma**2 * eye)
+        self.L_inv = triangular_inverse(L)
         self.inv_mat = self.L_inv.t() @ self.L_inv
         self.feature_map = feature_map
         self.cond_data = cond_data
@@ -832,6 +1455,103 @@ class SequentialFeatureMap(FeatureMap):
         return SequentialFeatureMap(self.feature_map.sketch(n_features, **config), self.tfms)
 
 
+class TiledFeatureMap(FeatureMap):
+    """
+    Wraps a feature map such that large kernel matrices are evaluated on the CPU in cache-sized tiles
+    on a pool of threads, see get_kernel_matrix_tiled(). Everything else is delegated to the wrapped feature map.
+    Each tile is evaluated by a single call of the wrapped feature map,
+    so nested kernel matrix evaluations inside a tile always run sequentially.
+    PyTorch's thread settings are not modified, but they bound the number of threads:
+    at most torch.get_num_threads() tiles are evaluated at once, see get_n_threads().
+    This is used by BatchSelectorImpl.select() if kernel_n_threads > 1 is passed.
+    """
+
+    def __init__(self, feature_map: FeatureMap, n_threads: int):
+        """
+        :param feature_map: Feature map whose kernel matrices should be evaluated in tiles.
+        :param n_threads: Number of threads to use.
+        """
+        super().__init__(
+            n_features=feature_map.get_n_features(), allow_precompute_features=feature_map.allow_precompute_features
+        )
+        self.feature_map = feature_map
+        self.n_threads = n_threads
+
+    def get_n_threads(self) -> int:
+        """
+        :return: Returns the number of threads to evaluate tiles on, which is n_threads clamped to
+        torch.get_num_threads(), such that the thread budget of PyTorch is respected.
+        This is evaluated on every call since torch.set_num_threads() may be called after construction.
+        """
+        return max(1, min(self.n_threads, torch.get_num_threads()))
+
+    def precompute_soft_(self, feature_data: FeatureData, idxs: Indexes) -> Tuple["FeatureMap", FeatureData]:
+        fm, fd = self.feature_map.precompute(feature_data, idxs)
+        return TiledFeatureMap(fm, self.n_threads), fd
+
+    def get_feature_matrix_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        return self.feature_map.get_feature_matrix(feature_data, idxs)
+
+    def get_kernel_matrix_impl_(
+        self, feature_data_1: FeatureData, feature_data_2: FeatureData, idxs_1: Indexes, idxs_2: Indexes
+    ) -> torch.Tensor:
+        n_threads = self.get_n_threads()
+        if n_threads > 1 and torch.device(feature_data_1.get_device()).type == "cpu":
+            element_size = torch.empty(0, dtype=feature_data_1.get_dtype()).element_size()
+            tile_size = get_kernel_tile_size(self.n_features, element_size)
+            if len(idxs_1) * len(idxs_2) >= 2 * n_threads * tile_size**2:
+                return self.get_kernel_matrix_tiled(feature_data_1, feature_data_2, idxs_1, idxs_2, tile_size)
+        return self.feature_map.get_kernel_matrix(feature_data_1, feature_data_2, idxs_1, idxs_2)
+
+    def get_kernel_matrix_tiled(
+        self,
+        feature_data_1: FeatureData,
+        feature_data_2: FeatureData,
+        idxs_1: Indexes,
+        idxs_2: Indexes,
+        tile_size: int,
+    ) -> torch.Tensor:
+        """
+        Computes the same kernel matrix as get_kernel_matrix(), but evaluates independent tiles
+        of at most tile_size x tile_size entries on a pool of self.get_n_threads() threads
+        and writes them into a preallocated output tensor.
+        :param feature_data_1: First feature data.
+        :param feature_data_2: Second feature data.
+        :param idxs_1: Indexes for first feature data.
+        :param idxs_2: Indexes for second feature data.
+        :param tile_size: Maximum number of rows and columns of a tile.
+        :return: Kernel matrix as torch.Tensor of shape n_samples_1 x n_samples_2
+        """
+        tiles = [
+            (tile_1, tile_2)
+            for tile_1 in split_into_tiles(feature_data_1, idxs_1, tile_size)
+            for tile_2 in split_into_tiles(feature_data_2, idxs_2, tile_size)
+        ]
+
+        def compute_tile(tile_1: Tuple[int, Indexes, FeatureData], tile_2: Tuple[int, Indexes, FeatureData]):
+            offset_1, sub_idxs_1, sub_data_1 = tile_1
+            offset_2, sub_idxs_2, sub_data_2 = tile_2
+            result = self.feature_map.get_kernel_matrix(sub_data_1, sub_data_2, sub_idxs_1, sub_idxs_2)
+            out[..., offset_1 : offset_1 + len(sub_idxs_1), offset_2 : offset_2 + len(sub_idxs_2)] = result
+
+        # the first tile determines the dtype and leading dimensions of the output
+        (offset_1, sub_idxs_1, sub_data_1), (offset_2, sub_idxs_2, sub_data_2) = tiles[0]
+        first = self.feature_map.get_kernel_matrix(sub_data_1, sub_data_2, sub_idxs_1, sub_idxs_2)
+        out = torch.empty(*first.shape[:-2], len(idxs_1), len(idxs_2), dtype=first.dtype, device=first.device)
+        out[..., : first.shape[-2], : first.shape[-1]] = first
+
+        with ThreadPoolExecutor(max_workers=self.get_n_threads()) as executor:
+            # list() re-raises exceptions from the threads
+            list(executor.map(lambda tile: compute_tile(*tile), tiles[1:]))
+        return out
+
+    def get_kernel_matrix_diag_impl_(self, feature_data: FeatureData, idxs: Indexes) -> torch.Tensor:
+        return self.feature_map.get_kernel_matrix_diag(feature_data, idxs)
+
+    def sketch(self, n_features: int, **config) -> "FeatureMap":
+        return TiledFeatureMap(self.feature_map.sketch(n_features, **config), self.n_threads)
+
+
 class ToDoubleTransform(DataTransform):
     """
     Transforms data to float64 format
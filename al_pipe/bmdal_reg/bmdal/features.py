@@ -68,7 +68,11 @@ class Features:
         return LambdaFeaturesTransform(lambda f: Features(ScaledFeatureMap(f.feature_map, factor), f.feature_data))
 
     def posterior_tfm(
-        self, sigma: float = 1.0, allow_kernel_space_posterior: bool = True, **config
+        self,
+        sigma: float = 1.0,
+        allow_kernel_space_posterior: bool = True,
+        posterior_cache: Optional[PosteriorCache] = None,
+        **config,
     ) -> "FeaturesTransform":
         """
         Computes the posterior transformation after observing self.feature_data.
@@ -77,12 +81,17 @@ class Features:
         if it is deemed more efficient but not strictly necessary. The kernel-space posterior feature map returned
         will not allow a computation of the feature matrix, which could be detrimental
         for methods that want to operate in feature space.
+        :param posterior_cache: Optional PosteriorCache to reuse the Cholesky factor from, see FeatureMap.posterior().
         :return: Returns a transformation object that replaces the feature map of a Features object
         by the posterior feature map arising from the GP with prior given by self.feature_map,
         after observing self.feature_data.
         """
         fm = self.feature_map.posterior(
-            self.feature_data, sigma, allow_kernel_space_posterior=allow_kernel_space_posterior
+            self.feature_data,
+            sigma,
+            allow_kernel_space_posterior=allow_kernel_space_posterior,
+            posterior_cache=posterior_cache,
+            cholesky_stats=config.get("cholesky_stats", None),
         )
         return LambdaFeaturesTransform(lambda f, fm=fm: Features(fm, f.feature_data))
 
@@ -131,8 +140,9 @@ class Features:
         y_var = b0 / a0
         w_cov_prior = s * torch.eye(in_features, device=x_train.device, dtype=x_train.dtype)
         xxw = x_train.t().matmul(x_train) + w_cov_prior
-        L = robust_cholesky(xxw)  # xxw = L * L^T
-        L_inv = torch.inverse(L)  # xxw^{-1} = L^{-T} * L^{-1}
+        L_inv = robust_cholesky_inv(
+            xxw, config.get("cholesky_stats", None)
+        )  # xxw^{-1} = L^{-T} * L^{-1} for xxw = L * L^T
         # theta_cov = torch.inverse(xxw)
         theta_cov = L_inv.t().matmul(L_inv)
         theta_mean = theta_cov.matmul(x_train.t().matmul(y_train))
@@ -165,8 +175,9 @@ class Features:
         in_features = x_train.shape[1]
         w_cov_prior = sigma**2 * torch.eye(in_features, device=x_train.device, dtype=x_train.dtype)
         xxw = x_train.t().matmul(x_train) + w_cov_prior
-        L = robust_cholesky(xxw)  # xxw = L * L^T
-        L_inv = torch.inverse(L)  # xxw^{-1} = L^{-T} * L^{-1}
+        L_inv = robust_cholesky_inv(
+            xxw, config.get("cholesky_stats", None)
+        )  # xxw^{-1} = L^{-T} * L^{-1} for xxw = L * L^T
         # theta_cov = torch.inverse(xxw)
         theta_cov = L_inv.t().matmul(L_inv)
         # theta_samples is be of shape in_features x n_features
@@ -206,8 +217,13 @@ class Features:
     def get_dtype(self) -> Any:
         """
         :return: Returns the (torch) dtype that the feature data has.
+        If the feature data is not floating-point, e.g. DNA sequences packed by pack_dna_codes(),
+        the dtype of the kernel values is returned instead.
         """
-        return self.feature_data.get_dtype()
+        dtype = self.feature_data.get_dtype()
+        if dtype.is_floating_point:
+            return dtype
+        return self.feature_map.get_kernel_matrix_diag(self.feature_data, slice(0, 1)).dtype
 
     def __getitem__(self, idxs: Union[int, slice, torch.Tensor]) -> "Features":
         """
@@ -271,6 +287,118 @@ class Features:
         sq_dists = diag[:, None] + other_diag[None, :] - 2 * kernel_matrix
         return sq_dists
 
+    def get_paired_sq_dists(self, other_features: "Features", batch_size: int = 1024) -> torch.Tensor:
+        """
+        Return the squared feature space distances between sample i of self and sample i of other_features.
+        For feature maps with a finite-dimensional feature space, these are computed from the feature matrices,
+        otherwise from the diagonals of the kernel matrices between batches of self and other_features,
+        which costs batch_size kernel evaluations per pair.
+        :param other_features: Features object with the same number of samples as self.
+        :param batch_size: Number of pairs processed at once.
+        :return: Returns a torch.Tensor of shape [len(self)] containing the squared distances.
+        """
+        if len(self) != len(other_features):
+            raise ValueError(f"Cannot pair {len(self)} samples with {len(other_features)} samples")
+        if len(self) == 0:
+            return torch.zeros(0, dtype=self.get_dtype(), device=self.get_device())
+        sq_dists = []
+        for start, stop in utils.get_batch_intervals(len(self), batch_size=batch_size):
+            if self.get_n_features() >= 0:
+                diffs = self[start:stop].get_feature_matrix() - other_features[start:stop].get_feature_matrix()
+                sq_dists.append((diffs**2).sum(dim=-1))
+            else:
+                kernel_matrix = self[start:stop].get_kernel_matrix(other_features[start:stop])
+                sq_dists.append(
+                    self[start:stop].get_kernel_matrix_diag()
+                    + other_features[start:stop].get_kernel_matrix_diag()
+                    - 2 * torch.diagonal(kernel_matrix)
+                )
+        return torch_cat(sq_dists, dim=0)
+
+    def update_min_sq_dists(
+        self,
+        min_sq_dists: torch.Tensor,
+        candidates: "Features",
+        closest_idxs: Optional[torch.Tensor] = None,
+        first_closest_idx: int = 0,
+        max_tile_size: int = 2**24,
+        idxs: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, Optional[torch.Tensor]]:
+        """
+        Update the squared distances of the samples in self to their closest point in a set
+        by adding the points in candidates to this set.
+        This is equivalent to taking the minimum of min_sq_dists and candidates.get_sq_dists(self) along dim 0,
+        but processes self in tiles such that at most max_tile_size distances are held in memory at once.
+        :param min_sq_dists: torch.Tensor of shape [len(self)] containing the current squared distances,
+        which is updated in-place.
+        :param candidates: Features of the points to add, they need to share the feature map with self.
+        :param closest_idxs: Optional torch.Tensor of shape [len(self)] and integer type containing the index
+        of the current closest point for each sample, which is updated in-place.
+        Candidate i gets the index first_closest_idx + i. If multiple candidates are equally close,
+        the first one is used, and samples are only reassigned if the new distance is strictly smaller,
+        such that the result is the same as adding the candidates one after another.
+        :param first_closest_idx: Index to assign to the first candidate in closest_idxs.
+        :param max_tile_size: Maximum number of distances computed at once.
+        :param idxs: Optional torch.Tensor of integer type containing the indices of the samples in self
+        that should be updated. If it is None, all samples are updated.
+        :return: Returns a tuple (changed_idxs, old_min_sq_dists, old_closest_idxs),
+        where changed_idxs contains the indices of the samples in self whose distance decreased,
+        and the other tensors contain the previous values of min_sq_dists and closest_idxs at these indices
+        (old_closest_idxs is None if closest_idxs is None).
+        """
+        # compute the kernel diagonals once such that they are reused in every tile
+        self.get_kernel_matrix_diag()
+        candidates.get_kernel_matrix_diag()
+        tile_size = max(1, max_tile_size // max(1, len(candidates)))
+        n_samples = len(self) if idxs is None else len(idxs)
+        changed_idxs, old_min_sq_dists, old_closest_idxs = [], [], []
+        for start, stop in utils.get_batch_intervals(n_samples, batch_size=tile_size):
+            if idxs is None:
+                tile_idxs = torch.arange(start, stop, device=min_sq_dists.device)
+                tile_features = self[start:stop]
+            else:
+                tile_idxs = idxs[start:stop]
+                tile_features = self[tile_idxs]
+            tile_min, tile_argmin = candidates.get_sq_dists(tile_features).min(dim=0)
+            tile_changed = torch.nonzero(tile_min < min_sq_dists[tile_idxs]).squeeze(-1)
+            changed = tile_idxs[tile_changed]
+            changed_idxs.append(changed)
+            old_min_sq_dists.append(min_sq_dists[changed])
+            min_sq_dists[changed] = tile_min[tile_changed]
+            if closest_idxs is not None:
+                old_closest_idxs.append(closest_idxs[changed])
+                closest_idxs[changed] = first_closest_idx + tile_argmin[tile_changed]
+        if n_samples == 0:
+            empty = torch.zeros(0, dtype=torch.long, device=min_sq_dists.device)
+            return empty, min_sq_dists[empty], None if closest_idxs is None else closest_idxs[empty]
+        return (
+            torch_cat(changed_idxs, dim=0),
+            torch_cat(old_min_sq_dists, dim=0),
+            None if closest_idxs is None else torch_cat(old_closest_idxs, dim=0),
+        )
+
+    def get_min_sq_dist_sums(
+        self, min_sq_dists: torch.Tensor, candidates: "Features", max_tile_size: int = 2**24
+    ) -> torch.Tensor:
+        """
+        For each candidate, return the sum of the squared distances of the samples in self to their closest point
+        if the candidate was added to the set of points that min_sq_dists refers to.
+        This is equivalent to torch.minimum(min_sq_dists[None, :], candidates.get_sq_dists(self)).sum(dim=-1),
+        but processes self in tiles such that at most max_tile_size distances are held in memory at once.
+        :param min_sq_dists: torch.Tensor of shape [len(self)] containing the current squared distances.
+        :param candidates: Features of the points to evaluate, they need to share the feature map with self.
+        :param max_tile_size: Maximum number of distances computed at once.
+        :return: Returns a torch.Tensor of shape [len(candidates)] containing the sums.
+        """
+        self.get_kernel_matrix_diag()
+        candidates.get_kernel_matrix_diag()
+        tile_size = max(1, max_tile_size // max(1, len(candidates)))
+        sums = torch.zeros(len(candidates), dtype=min_sq_dists.dtype, device=min_sq_dists.device)
+        for start, stop in utils.get_batch_intervals(len(self), batch_size=tile_size):
+            sq_dists = candidates.get_sq_dists(self[start:stop])
+            sums += torch.minimum(min_sq_dists[None, start:stop], sq_dists).sum(dim=-1)
+        return sums
+
     def batched(self, batch_size: int) -> "Features":
         """
         Return a Features object that behaves as self,
@@ -1,3 +1,5 @@
+import weakref
+
 import torch.nn as nn
 
 from .feature_maps import *
@@ -45,6 +47,94 @@ class LayerGradientComputation:
         """
         raise NotImplementedError()
 
+    def get_feature_data(self, inp: torch.Tensor, grad_output: torch.Tensor) -> FeatureData:
+        """
+        Optional method used by FuncGradTransform, which computes inputs and output gradients without hooks.
+        :param inp: Inputs of the layer, of shape [n_samples, ...].
+        :param grad_output: Gradients of the summed model outputs with respect to the outputs of the layer.
+        :return: Returns the same feature data as pop_feature_data() would return for these inputs.
+        """
+        raise NotImplementedError()
+
+
+class GradFeatureCache:
+    """
+    Cache for the feature data computed by ModelGradTransform, i.e., the per-layer (input, grad_output) data.
+    Entries are keyed by a hash of the model parameters and buffers, the selected gradient layers,
+    a hash of the input data and the indexes of the batch. The input data is only hashed once per FeatureData object,
+    not for every batch. If the same cache is passed to several select_batch() calls
+    with the same model (for example to compare selection methods or to tune sigma),
+    the forward and backward passes through the model are only done in the first call.
+    Since the model parameters are part of the key, entries of a retrained model are not reused.
+    Only the entries of the max_n_models most recently used models are kept, the entries of older models are
+    evicted when the features of a new model are stored.
+    """
+
+    def __init__(self, max_n_models: int = 1):
+        """
+        :param max_n_models: Number of models (i.e., different model parameters) whose entries are kept.
+        When the cache is shared between the models of an ensemble, this should be at least the ensemble size.
+        """
+        if max_n_models < 1:
+            raise ValueError(f"max_n_models must be at least 1, but got {max_n_models}")
+        self.max_n_models = max_n_models
+        self.entries: Dict[Tuple, FeatureData] = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        # hashes of the full tensors of the input FeatureData objects that have been seen
+        self.data_hashes = weakref.WeakKeyDictionary()
+        # hashes of the model parameters of the stored entries, from least to most recently used
+        self.model_hashes: Dict[str, None] = {}
+
+    def get_data_key(self, feature_data: FeatureData, idxs: Indexes) -> Tuple:
+        """
+        :param feature_data: Input feature data.
+        :param idxs: Indexes of the batch in feature_data.
+        :return: Returns a key identifying feature_data[idxs]. The contents of feature_data are only hashed
+        the first time that feature_data is seen, afterwards only the indexes are used.
+        """
+        data_hash = self.data_hashes.get(feature_data, None)
+        if data_hash is None:
+            data_hash = hash_tensors([feature_data.get_tensor()])
+            self.data_hashes[feature_data] = data_hash
+        idxs = idxs.get_idxs()
+        return data_hash, idxs.indices(feature_data.get_n_samples()) if isinstance(idxs, slice) else hash_tensors([idxs])
+
+    def use_model(self, model_hash: str):
+        """
+        Marks model_hash as the most recently used model and evicts the entries of the least recently used models
+        if more than max_n_models models are used.
+        :param model_hash: Hash of the model parameters, the first element of the keys.
+        """
+        self.model_hashes.pop(model_hash, None)
+        self.model_hashes[model_hash] = None
+        while len(self.model_hashes) > self.max_n_models:
+            old_hash = next(iter(self.model_hashes))
+            del self.model_hashes[old_hash]
+            self.entries = {key: value for key, value in self.entries.items() if key[0] != old_hash}
+
+    def get(self, key: Tuple) -> Optional[FeatureData]:
+        """
+        :param key: Key as computed by ModelGradTransform.
+        :return: Returns the cached feature data or None if there is no entry for key.
+        """
+        data = self.entries.get(key, None)
+        if data is None:
+            self.n_misses += 1
+        else:
+            self.n_hits += 1
+            self.use_model(key[0])
+        return data
+
+    def store(self, key: Tuple, data: FeatureData):
+        self.use_model(key[0])
+        self.entries[key] = data
+
+    def clear(self):
+        self.entries = {}
+        self.data_hashes = weakref.WeakKeyDictionary()
+        self.model_hashes = {}
+
 
 class ModelGradTransform(DataTransform):
     """
@@ -52,18 +142,30 @@ class ModelGradTransform(DataTransform):
     in order to obtain feature data corresponding to gradients
     """
 
-    def __init__(self, model: nn.Module, grad_layers: List[LayerGradientComputation]):
+    def __init__(
+        self, model: nn.Module, grad_layers: List[LayerGradientComputation], cache: Optional[GradFeatureCache] = None
+    ):
         """
         :param model: The model to be computed gradients of
         :param grad_layers: All layers of the model whose parameters we want to compute gradients of
+        :param cache: Optional GradFeatureCache to look up and store the computed feature data in.
+        The model must not be modified while this transform is in use, since its parameters are only hashed here.
         """
         self.model = model
         self.grad_layers = grad_layers
+        self.cache = cache
         self.requires_grad_list = [
             any([any([p is gl_p for gl_p in gl.get_layer().parameters()]) for gl in grad_layers])
             for p in model.parameters()
         ]
         self.grad_params = [p for grad_layer in grad_layers for p in grad_layer.get_layer().parameters()]
+        self.cache_key = None
+        if cache is not None:
+            modules = list(model.modules())
+            layer_keys = tuple(
+                (type(gl).__name__, next(i for i, m in enumerate(modules) if m is gl.get_layer())) for gl in grad_layers
+            )
+            self.cache_key = (hash_tensors(model.state_dict().values()), layer_keys)
 
     def forward(self, feature_data: FeatureData, idxs: Indexes) -> FeatureData:
         """
@@ -71,6 +173,20 @@ class ModelGradTransform(DataTransform):
         :param idxs: indexes of the feature data that should be passed through the model
         :return: feature data provided by the layers
         """
+        if self.cache is not None:
+            key = self.cache_key + self.cache.get_data_key(feature_data, idxs)
+            data = self.cache.get(key)
+            if data is None:
+                data = self.compute_feature_data(feature_data.get_tensor(idxs))
+                self.cache.store(key, data)
+            return data
+        return self.compute_feature_data(feature_data.get_tensor(idxs))
+
+    def compute_feature_data(self, X: torch.Tensor) -> FeatureData:
+        """
+        :param X: Input tensor to pass through the model.
+        :return: feature data provided by the layers
+        """
         for grad_layer in self.grad_layers:
             grad_layer.before_forward()
 
@@ -81,7 +197,6 @@ class ModelGradTransform(DataTransform):
 
         old_training = self.model.training
         self.model.eval()
-        X = feature_data.get_tensor(idxs)
         y = self.model(X)  # implicitly calls hooks that were set by l.before_forward()
         y.backward(torch.ones_like(y))
         with torch.no_grad():
@@ -98,17 +213,124 @@ class ModelGradTransform(DataTransform):
         return data
 
 
+class FuncGradTransform(ModelGradTransform):
+    """
+    Alternative to ModelGradTransform that computes the same feature data with torch.func.vjp instead of hooks.
+    The model is evaluated in eval mode, where the samples do not interact (BatchNorm uses its running statistics),
+    such that one vector-Jacobian product of the summed outputs yields the per-sample output gradients of all layers.
+    The forward pass is split at the gradient layers, the backward pass then chains the vjp functions of the segments.
+    No hooks are registered, no inputs or gradients are cloned and requires_grad of the parameters is not modified.
+    This requires that the model applies its modules one after another, i.e., that it is an nn.Sequential
+    (possibly nested) or that it flattens its input and passes it to an nn.Sequential stored as model.network,
+    like al_pipe.regression.mlp.MLP.
+    """
+
+    def __init__(
+        self, model: nn.Module, grad_layers: List[LayerGradientComputation], cache: Optional[GradFeatureCache] = None
+    ):
+        """
+        :param model: The model to be computed gradients of
+        :param grad_layers: All layers of the model whose parameters we want to compute gradients of,
+        in the order in which they are applied.
+        :param cache: Optional GradFeatureCache to look up and store the computed feature data in.
+        """
+        super().__init__(model, grad_layers, cache=cache)
+        if isinstance(model, nn.Sequential):
+            self.flatten_input = False
+            modules = self.flatten_sequential(model)
+        elif isinstance(getattr(model, "network", None), nn.Sequential):
+            self.flatten_input = True
+            modules = self.flatten_sequential(model.network)
+        else:
+            raise ValueError("FuncGradTransform only supports nn.Sequential models or models with a sequential network")
+        # split the modules into the modules before the first gradient layer
+        # and the modules between each gradient layer and the next one (or the model output)
+        positions = []
+        for gl in grad_layers:
+            matches = [i for i, module in enumerate(modules) if module is gl.get_layer()]
+            if len(matches) != 1:
+                raise ValueError("Every gradient layer must occur exactly once in the sequential model")
+            positions.append(matches[0])
+        if positions != sorted(positions):
+            raise ValueError("The gradient layers must be given in the order in which the model applies them")
+        self.pre_modules = modules[: positions[0]]
+        self.post_modules = [modules[start + 1 : end] for start, end in zip(positions, positions[1:] + [len(modules)])]
+
+    @staticmethod
+    def flatten_sequential(module: nn.Sequential) -> List[nn.Module]:
+        modules = []
+        for child in module:
+            if isinstance(child, nn.Sequential):
+                modules.extend(FuncGradTransform.flatten_sequential(child))
+            else:
+                modules.append(child)
+        return modules
+
+    @staticmethod
+    def apply_modules(modules: List[nn.Module], x: torch.Tensor) -> torch.Tensor:
+        for module in modules:
+            x = module(x)
+        return x
+
+    def compute_feature_data(self, X: torch.Tensor) -> FeatureData:
+        old_training = self.model.training
+        self.model.eval()
+        # the parameters are constants here, torch.func.vjp still differentiates with respect to its inputs
+        with torch.no_grad():
+            if self.flatten_input:
+                X = X.view(X.shape[0], -1)
+            x = self.apply_modules(self.pre_modules, X)
+            inputs = []
+            vjp_fns = []
+            for i, post_modules in enumerate(self.post_modules):
+                inputs.append(x)
+                out = self.grad_layers[i].get_layer()(x)
+                next_layer = self.grad_layers[i + 1].get_layer() if i + 1 < len(self.grad_layers) else None
+
+                # maps the output of this gradient layer to the output of the next one (or the model output)
+                # and returns the input of the next gradient layer as auxiliary output
+                def segment(h, post_modules=post_modules, next_layer=next_layer):
+                    y = self.apply_modules(post_modules, h)
+                    return (y if next_layer is None else next_layer(y)), y
+
+                out, vjp_fn, x = torch.func.vjp(segment, out, has_aux=True)
+                vjp_fns.append(vjp_fn)
+
+            grad_outputs = [None] * len(vjp_fns)
+            grad = torch.ones_like(out)
+            for i in reversed(range(len(vjp_fns))):
+                grad = vjp_fns[i](grad)[0]
+                grad_outputs[i] = grad
+
+        self.model.train(old_training)
+        return ListFeatureData(
+            [gl.get_feature_data(inp, grad) for gl, inp, grad in zip(self.grad_layers, inputs, grad_outputs)]
+        )
+
+
 def create_grad_feature_map(
-    model: nn.Module, grad_layers: List[LayerGradientComputation], use_float64: bool = False
+    model: nn.Module,
+    grad_layers: List[LayerGradientComputation],
+    use_float64: bool = False,
+    cache: Optional[GradFeatureCache] = None,
+    engine: str = "hooks",
 ) -> FeatureMap:
     """
     Creates a feature map corresponding to phi_{grad} or phi_{ll}, depending on which layers are provided.
     :param model: Model to compute gradients of
     :param grad_layers: All layers of the model whose parameters we want to compute gradients of
     :param use_float64: Set to true if the gradient features should be converted to float64 after computing them
+    :param cache: Optional GradFeatureCache to reuse the gradient feature data of previous calls with the same model.
+    :param engine: 'hooks' to compute the feature data with ModelGradTransform,
+    'func' to compute it with FuncGradTransform.
     :return: Returns a feature map corresponding to phi_{grad} for the given layers.
     """
-    tfms = [ModelGradTransform(model, grad_layers)]
+    if engine == "hooks":
+        tfms = [ModelGradTransform(model, grad_layers, cache=cache)]
+    elif engine == "func":
+        tfms = [FuncGradTransform(model, grad_layers, cache=cache)]
+    else:
+        raise ValueError(f'Unknown gradient engine "{engine}"')
     if use_float64:
         tfms.append(ToDoubleTransform())
     return SequentialFeatureMap(SumFeatureMap([l.get_feature_map() for l in grad_layers]), tfms)
@@ -179,16 +401,7 @@ class GeneralLinearGradientComputation(LayerGradientComputation):
         # remove the hooks
         self._input_hook.remove()
         self._grad_output_hook.remove()
-        # compute the adjusted input \tilde{x} from the paper
-        inp = torch.cat(
-            [
-                self.weight_factor * self._input_data,
-                self.bias_factor * torch.ones(self._input_data.shape[0], 1, device=self._input_data.device),
-            ],
-            dim=1,
-        )
-        # feature data for the two IdentityFeatureMaps in the ProductFeatureMap, given by inputs and grad_outputs
-        fd = ListFeatureData([TensorFeatureData(inp), TensorFeatureData(self._grad_output_data)])
+        fd = self.get_feature_data(self._input_data, self._grad_output_data)
 
         # allow to release memory earlier
         self._input_data = None
@@ -196,6 +409,14 @@ class GeneralLinearGradientComputation(LayerGradientComputation):
 
         return fd
 
+    def get_feature_data(self, inp: torch.Tensor, grad_output: torch.Tensor) -> FeatureData:
+        # compute the adjusted input \tilde{x} from the paper
+        inp = torch.cat(
+            [self.weight_factor * inp, self.bias_factor * torch.ones(inp.shape[0], 1, device=inp.device)], dim=1
+        )
+        # feature data for the two IdentityFeatureMaps in the ProductFeatureMap, given by inputs and grad_outputs
+        return ListFeatureData([TensorFeatureData(inp), TensorFeatureData(grad_output)])
+
 
 class LinearGradientComputation(GeneralLinearGradientComputation):
     """
@@ -5,6 +5,17 @@ import numpy as np
 from .features import *
 
 
+def idxs_to_tensor(idxs: Union[slice, torch.Tensor], n: int) -> torch.Tensor:
+    """
+    :param idxs: slice or torch.Tensor of integer type.
+    :param n: Length of the sequence that idxs indexes.
+    :return: Returns idxs as a torch.Tensor of integer type.
+    """
+    if isinstance(idxs, slice):
+        return torch.arange(*idxs.indices(n))
+    return idxs
+
+
 class SelectionMethod:
     """
     Abstract base class for selection methods,
@@ -34,6 +45,14 @@ class SelectionMethod:
         """
         return self.status
 
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        """
+        This method may be overridden by subclasses whose state after select() can be reused
+        to continue the selection in a later round, see LargestClusterMaxDistSelectionMethod.
+        :return: Returns a dict representing the state after selection, or None if there is no reusable state.
+        """
+        return None
+
 
 class IterativeSelectionMethod(SelectionMethod):
     """
@@ -41,7 +60,13 @@ class IterativeSelectionMethod(SelectionMethod):
     """
 
     def __init__(
-        self, pool_features: Features, train_features: Features, sel_with_train: bool, verbosity: int = 1, **config
+        self,
+        pool_features: Features,
+        train_features: Features,
+        sel_with_train: bool,
+        verbosity: int = 1,
+        add_block_size: int = 1024,
+        **config,
     ):
         """
         :param pool_features: Features representing the pool set.
@@ -49,6 +74,7 @@ class IterativeSelectionMethod(SelectionMethod):
         :param sel_with_train: This corresponds to the mode parameter in the paper.
         Set to True if you want to use TP-mode (i.e. use the training data for selection), and to False for P-mode.
         :param verbosity: Level of verbosity. If >= 1, something may be printed to indicate the progress of selection.
+        :param add_block_size: Number of training points that are passed to add_many() at once in TP-mode.
         """
         super().__init__()
         self.train_features = train_features
@@ -60,7 +86,11 @@ class IterativeSelectionMethod(SelectionMethod):
         )
         self.with_train = sel_with_train
         self.verbosity = verbosity
+        self.add_block_size = add_block_size
         self.n_added = 0
+        # number of leading training points that are already part of an initial state passed by a subclass,
+        # these are not added again in TP-mode
+        self.n_init_train = 0
 
     def prepare(self, n_adds: int):
         """
@@ -90,6 +120,19 @@ class IterativeSelectionMethod(SelectionMethod):
         """
         raise NotImplementedError()
 
+    def add_many(self, new_idxs: Union[slice, torch.Tensor]):
+        """
+        Update the state of the object based on adding several points to the selected set, in the given order.
+        Unlike add(), this method also increases self.n_added by the number of added points.
+        By default, it calls add() for each point. Subclasses may override this method
+        to process all points at once, which is used for adding the training points in TP-mode.
+        :param new_idxs: slice or torch.Tensor of integer type containing idxs wrt self.features, see add().
+        Since self.features is a concatenation in TP-mode, only slices are supported there.
+        """
+        for new_idx in idxs_to_tensor(new_idxs, len(self.features)).tolist():
+            self.add(new_idx)
+            self.n_added += 1
+
     def get_next_idx(self) -> Optional[int]:
         """
         This method may be overridden by subclasses.
@@ -111,15 +154,16 @@ class IterativeSelectionMethod(SelectionMethod):
         """
         device = self.pool_features.get_device()
 
-        self.prepare(batch_size + len(self.train_features) if self.with_train else batch_size)
+        self.prepare(batch_size + len(self.train_features) - self.n_init_train if self.with_train else batch_size)
 
         if self.with_train:
-            # add training points first
-            for i in range(len(self.train_features)):
-                self.add(len(self.pool_features) + i)
-                self.n_added += 1
-                if (i + 1) % 256 == 0 and self.verbosity >= 1:
-                    print(f"Added {i + 1} train samples to selection", flush=True)
+            # add training points first, in blocks
+            n_pool, n_train = len(self.pool_features), len(self.train_features)
+            for start in range(self.n_init_train, n_train, self.add_block_size):
+                stop = min(start + self.add_block_size, n_train)
+                self.add_many(slice(n_pool + start, n_pool + stop))
+                if self.verbosity >= 1 and stop // 256 > start // 256:
+                    print(f"Added {stop} train samples to selection", flush=True)
 
         for i in range(batch_size):
             next_idx = self.get_next_idx()
@@ -341,9 +385,13 @@ class MaxDetSelectionMethod(IterativeSelectionMethod):
 
 class MaxDetFeatureSpaceSelectionMethod(IterativeSelectionMethod):
     """
-    Implements MaxDet in feature space for Batch Active Learning.
-    In terms of efficiency, this is only recommended for (roughly) batch_size > 3*n_features,
-    so normally MaxDetSelectionMethod should be used instead.
+    Implements MaxDet in feature space for Batch Active Learning, for features of finite dimension d.
+    Instead of the n x (number of selected points) matrix of MaxDetSelectionMethod,
+    it maintains the d x d matrix B = sigma^2 (Phi_S^T Phi_S + sigma^2 I)^{-1}, where Phi_S are the features
+    of the selected points and sigma = noise_sigma, through rank-1 (Sherman-Morrison) updates.
+    Then, the posterior variance of x is phi(x)^T B phi(x) + sigma^2.
+    For sigma = 0, B is the orthogonal projection onto the complement of the span of Phi_S,
+    so noise_sigma > 0 is not required. The memory overhead is O(n + d^2) and each step takes O(nd + d^2) time.
     """
 
     def __init__(
@@ -359,11 +407,11 @@ class MaxDetFeatureSpaceSelectionMethod(IterativeSelectionMethod):
         )
         self.noise_sigma = noise_sigma
         self.diag = self.features.get_kernel_matrix_diag().clone() + self.noise_sigma**2
-        self.feature_matrix = self.features.get_feature_matrix().clone()
+        self.feature_matrix = self.features.get_feature_matrix()
+        n_features = self.feature_matrix.shape[1]
+        self.inv_gram = torch.eye(n_features, device=self.feature_matrix.device, dtype=self.feature_matrix.dtype)
 
     def get_scores(self) -> torch.Tensor:
-        # if self.n_added % 100 == 0:
-        #     print(f'{self.n_added=}, {self.diag=}')
         return self.diag[: len(self.pool_features)]
 
     def get_next_idx(self) -> Optional[int]:
@@ -378,18 +426,26 @@ class MaxDetFeatureSpaceSelectionMethod(IterativeSelectionMethod):
         return new_idx
 
     def add(self, new_idx: int):
-        diag_entry = self.diag[new_idx]
-        sqrt_diag_entry = torch.sqrt(diag_entry)
-        beta = 1.0 / (sqrt_diag_entry * (sqrt_diag_entry + self.noise_sigma))
-        phi_x = self.feature_matrix[new_idx]
-        dot_prods = self.feature_matrix.matmul(phi_x)
-        self.feature_matrix -= dot_prods[:, None] * (beta * phi_x[None, :])
+        diag_entry = self.diag[new_idx]  # = phi_x^T B phi_x + sigma^2
+        u = self.inv_gram.matmul(self.feature_matrix[new_idx])
+        # B <- B - u u^T / diag_entry
+        self.inv_gram.addr_(u, u, alpha=-1.0 / diag_entry.item())
+        dot_prods = self.feature_matrix.matmul(u)
         self.diag -= dot_prods**2 / diag_entry
 
 
 class BaitFeatureSpaceSelectionMethod(ForwardBackwardSelectionMethod):
     """
     Implements BAIT in feature space for Batch Active Learning.
+    Adding or removing a point multiplies the (deflated) feature matrix from the right by a d x d matrix.
+    Instead of modifying a copy of the n x d feature matrix, only the product of these matrices is stored,
+    and products with the current feature matrix are computed by streaming the original features in row blocks.
+    Apart from the features themselves, this needs O(d^2) memory for the state and O(n) memory for the scores.
+    Since the rounding errors of the accumulated product are applied to all rows at once, the state is recomputed
+    every resync_interval updates from the Gram matrix of the added points: After adding the points with original
+    feature matrix Phi, the product T satisfies T T^T = (I + Phi^T Phi / noise_sigma^2)^{-1}
+    (the projection onto the orthogonal complement of the rows of Phi for noise_sigma = 0),
+    and the scores only depend on T T^T, such that T can be replaced by the symmetric square root of this matrix.
     """
 
     def __init__(
@@ -398,21 +454,108 @@ class BaitFeatureSpaceSelectionMethod(ForwardBackwardSelectionMethod):
         train_features: Features,
         sel_with_train: bool = False,
         noise_sigma: float = 0.0,
+        max_tile_size: int = 2**24,
+        resync_interval: Optional[int] = None,
         **config,
     ):
+        """
+        :param pool_features: Features on the pool set.
+        :param train_features: Features on the train set.
+        :param sel_with_train: If True, TP-mode is used instead of P-mode. This is False by default.
+        :param noise_sigma: noise_sigma**2 is added to the kernel diagonal.
+        :param max_tile_size: Maximum number of feature matrix entries held in memory at once.
+        :param resync_interval: Number of added or removed points after which the state is recomputed in float64.
+        A resync costs about as much as d updates, the default is max(1, d // 4). Use 0 to disable resyncing.
+        """
         super().__init__(
             pool_features=pool_features, train_features=train_features, sel_with_train=sel_with_train, **config
         )
         self.noise_sigma = noise_sigma
         self.diag = self.features.get_kernel_matrix_diag().clone()
-        self.feature_matrix = self.features.get_feature_matrix().clone()
-
-        self.feature_cov_matrix = self.feature_matrix.t() @ self.feature_matrix
-        if not sel_with_train:
-            train_feature_matrix = train_features.get_feature_matrix()
-            self.feature_cov_matrix += train_feature_matrix.t() @ train_feature_matrix
-        self.scores_numerator = torch.einsum(
-            "ij,ji->i", self.feature_matrix, self.feature_cov_matrix @ self.feature_matrix.t()
+        n_features = self.features.get_n_features()
+        self.block_size = max(1, max_tile_size // n_features)
+        # the current feature matrix is the original feature matrix times self.transform
+        self.transform = torch.eye(n_features, device=self.diag.device, dtype=self.diag.dtype)
+        self.resync_interval = max(1, n_features // 4) if resync_interval is None else resync_interval
+        self.n_updates = 0
+        # Gram matrix of the original features of the added points, in float64
+        self.added_gram_matrix = torch.zeros(n_features, n_features, device=self.diag.device, dtype=torch.float64)
+
+        self.feature_cov_matrix = torch.zeros_like(self.transform)
+        cov_features = [self.features] if sel_with_train else [self.features, train_features]
+        for features in cov_features:
+            for feature_matrix in self.iterate_feature_blocks(features):
+                self.feature_cov_matrix += feature_matrix.t() @ feature_matrix
+        self.initial_cov_matrix = self.feature_cov_matrix.clone()
+        self.scores_numerator = torch.cat(
+            [
+                ((feature_matrix @ self.feature_cov_matrix) * feature_matrix).sum(dim=-1)
+                for feature_matrix in self.iterate_feature_blocks(self.features)
+            ]
+        )
+
+    def iterate_feature_blocks(self, features: Features) -> Iterator[torch.Tensor]:
+        """
+        :param features: Features to iterate over.
+        :return: Yields the original feature matrix of features in blocks of at most self.block_size rows.
+        """
+        n_samples = features.get_n_samples()
+        for start in range(0, n_samples, self.block_size):
+            yield features[start : min(start + self.block_size, n_samples)].get_feature_matrix()
+
+    def get_feature_vector(self, idx: int) -> torch.Tensor:
+        """
+        :return: Returns the row of the current feature matrix for self.features[idx].
+        """
+        return self.features[idx : idx + 1].get_feature_matrix()[0] @ self.transform
+
+    def update_gram_matrix(self, idx: int, sign: float):
+        """
+        Adds (sign=1) or subtracts (sign=-1) the outer product of the original features of self.features[idx]
+        to self.added_gram_matrix and recomputes the state every self.resync_interval updates.
+        :param idx: Index wrt self.features of the added or removed point.
+        :param sign: 1.0 for adding and -1.0 for removing the point.
+        """
+        phi = self.features[idx : idx + 1].get_feature_matrix()[0].to(torch.float64)
+        self.added_gram_matrix += sign * (phi[:, None] * phi[None, :])
+        self.n_updates += 1
+        if self.resync_interval > 0 and self.n_updates % self.resync_interval == 0:
+            self.resync()
+
+    def resync(self):
+        """
+        Recomputes the transform, the feature covariance matrix, the diagonal and the score numerators
+        from self.added_gram_matrix, discarding the rounding errors accumulated by the updates.
+        """
+        eig_vals, eig_vecs = torch.linalg.eigh(self.added_gram_matrix)
+        eig_vals = torch.clamp(eig_vals, min=0.0)
+        if self.noise_sigma > 0.0:
+            factors = self.noise_sigma / torch.sqrt(eig_vals + self.noise_sigma**2)
+        else:
+            # projection onto the orthogonal complement of the row space of the added features
+            eps = torch.finfo(self.diag.dtype).eps
+            factors = (eig_vals <= eps * len(eig_vals) * eig_vals.max()).to(eig_vals.dtype)
+        transform = (eig_vecs * factors[None, :]) @ eig_vecs.t()
+        self.transform = transform.to(self.transform.dtype)
+        self.feature_cov_matrix = (transform @ self.initial_cov_matrix.to(torch.float64) @ transform).to(
+            self.transform.dtype
+        )
+        diags, scores_numerators = [], []
+        for feature_matrix in self.iterate_feature_blocks(self.features):
+            feature_matrix = feature_matrix @ self.transform
+            diags.append((feature_matrix**2).sum(dim=-1))
+            scores_numerators.append(((feature_matrix @ self.feature_cov_matrix) * feature_matrix).sum(dim=-1))
+        self.diag = torch.cat(diags)
+        self.scores_numerator = torch.cat(scores_numerators)
+
+    def multiply_feature_matrix(self, vectors: torch.Tensor) -> torch.Tensor:
+        """
+        :param vectors: Tensor of shape [d, k].
+        :return: Returns the current feature matrix times vectors, of shape [len(self.features), k].
+        """
+        transformed = self.transform @ vectors
+        return torch.cat(
+            [feature_matrix @ transformed for feature_matrix in self.iterate_feature_blocks(self.features)], dim=0
         )
 
     def get_scores(self) -> torch.Tensor:
@@ -433,26 +576,27 @@ class BaitFeatureSpaceSelectionMethod(ForwardBackwardSelectionMethod):
         diag_entry = self.diag[new_idx] + self.noise_sigma**2
         sqrt_diag_entry = torch.sqrt(diag_entry)
         beta = 1.0 / (sqrt_diag_entry * (sqrt_diag_entry + self.noise_sigma))
-        phi_x = self.feature_matrix[new_idx]
-        dot_prods = self.feature_matrix.matmul(phi_x)
+        phi_x = self.get_feature_vector(new_idx)
+        cov_phi = self.feature_cov_matrix @ phi_x
+        dot_prods, cov_dot_prods = self.multiply_feature_matrix(torch.stack([phi_x, cov_phi], dim=1)).unbind(dim=1)
         dot_prods_sq = dot_prods**2
 
         # update scores_numerator
-        cov_phi = self.feature_cov_matrix @ phi_x
         phi_cov_phi = self.scores_numerator[new_idx].clone()
         # phi_cov_phi = torch.dot(phi_x, cov_phi)
         mult = 1 / diag_entry
-        self.scores_numerator -= 2 * mult * (self.feature_matrix @ cov_phi) * dot_prods
+        self.scores_numerator -= 2 * mult * cov_dot_prods * dot_prods
         self.scores_numerator += mult**2 * phi_cov_phi * dot_prods_sq
         # update feature_cov_matrix
         cov_phi_phit = cov_phi[:, None] * phi_x[None, :]
         phi_phit = phi_x[:, None] * phi_x[None, :]
         self.feature_cov_matrix -= beta * (cov_phi_phit + cov_phi_phit.t())
         self.feature_cov_matrix += beta**2 * phi_cov_phi * phi_phit
-        # update feature matrix
-        self.feature_matrix -= dot_prods[:, None] * (beta * phi_x[None, :])
+        # update feature matrix, F <- F (I - beta phi_x phi_x^T)
+        self.transform -= (beta * (self.transform @ phi_x))[:, None] * phi_x[None, :]
         # update diag
         self.diag -= dot_prods_sq / diag_entry
+        self.update_gram_matrix(new_idx, 1.0)
 
     def get_scores_backward(self) -> torch.Tensor:
         den = self.diag[self.selected_idxs] - self.noise_sigma**2
@@ -477,25 +621,87 @@ class BaitFeatureSpaceSelectionMethod(ForwardBackwardSelectionMethod):
         diag_entry = torch.clamp(diag_entry, min=1e-15)
         sqrt_diag_entry = torch.sqrt(diag_entry)
         beta = 1.0 / (sqrt_diag_entry * (sqrt_diag_entry + self.noise_sigma))
-        phi_x = self.feature_matrix[features_idx]
-        dot_prods = self.feature_matrix.matmul(phi_x)
+        phi_x = self.get_feature_vector(features_idx)
+        cov_phi = self.feature_cov_matrix @ phi_x
+        dot_prods, cov_dot_prods = self.multiply_feature_matrix(torch.stack([phi_x, cov_phi], dim=1)).unbind(dim=1)
         dot_prods_sq = dot_prods**2
 
         # update scores_numerator
-        cov_phi = self.feature_cov_matrix @ phi_x
         phi_cov_phi = self.scores_numerator[features_idx].clone()
         mult = 1 / diag_entry
-        self.scores_numerator += 2 * mult * (self.feature_matrix @ cov_phi) * dot_prods
+        self.scores_numerator += 2 * mult * cov_dot_prods * dot_prods
         self.scores_numerator += mult**2 * phi_cov_phi * dot_prods_sq
         # update feature_cov_matrix
         cov_phi_phit = cov_phi[:, None] * phi_x[None, :]
         phi_phit = phi_x[:, None] * phi_x[None, :]
         self.feature_cov_matrix += beta * (cov_phi_phit + cov_phi_phit.t())
         self.feature_cov_matrix += beta**2 * phi_cov_phi * phi_phit
-        # update feature matrix
-        self.feature_matrix += dot_prods[:, None] * (beta * phi_x[None, :])
+        # update feature matrix, F <- F (I + beta phi_x phi_x^T)
+        self.transform += (beta * (self.transform @ phi_x))[:, None] * phi_x[None, :]
         # update diag
         self.diag += dot_prods_sq / diag_entry
+        self.update_gram_matrix(features_idx, -1.0)
+
+
+class TriangleInequalityPruning:
+    """
+    Helper for the optional accelerated mode of MaxDistSelectionMethod and LargestClusterMaxDistSelectionMethod.
+    It keeps the centers that have been added to the selection so far. If a pool point x has the squared distance m
+    to its closest center c and a new center z satisfies d(c, z)^2 >= 4m, then by the triangle inequality
+    d(x, z) >= d(c, z) - d(x, c) >= sqrt(m), so x cannot get closer to the selection by adding z.
+    Checking this only requires the distances between the existing and the new centers,
+    such that the distances to the pool only need to be computed for the remaining pool points.
+    """
+
+    def __init__(self, pool_features: Features, train_features: Features, n_init_centers: int = 0, slack: float = 1e-3):
+        """
+        :param pool_features: Features representing the pool set.
+        :param train_features: Features representing the training set.
+        :param n_init_centers: Number of centers whose features are not known, e.g. from an initial state.
+        Pool points assigned to one of them are never pruned.
+        :param slack: Relative slack on the pruning condition to account for rounding errors
+        in the squared distances, which are computed via the kernel.
+        """
+        self.pool_features = pool_features
+        self.train_features = train_features
+        self.n_init_centers = n_init_centers
+        self.slack = slack
+        # indices of the centers wrt the concatenation of pool and train features, in the order they were added
+        self.center_idxs = torch.zeros(0, dtype=torch.long, device=pool_features.get_device())
+
+    def get_candidates(
+        self, min_sq_dists: torch.Tensor, closest_idxs: torch.Tensor, new_features: Features
+    ) -> torch.Tensor:
+        """
+        :param min_sq_dists: Squared distances of the pool points to their closest center.
+        :param closest_idxs: Index of the closest center of each pool point, where center i (in the order of
+        add_centers(), after the n_init_centers unknown ones) has index i + 1 and 0 means no center.
+        :param new_features: Features of the new centers.
+        :return: Returns a torch.Tensor of integer type containing the pool indices
+        whose distance to the selection might decrease by adding the new centers.
+        """
+        n_pool = len(self.pool_features)
+        # for each center, the smallest squared distance to one of the new centers;
+        # it stays zero for 'no center' and unknown centers such that their points are always candidates
+        center_sq_dists = torch.zeros(
+            1 + self.n_init_centers + len(self.center_idxs), dtype=min_sq_dists.dtype, device=min_sq_dists.device
+        )
+        rows = torch.arange(1 + self.n_init_centers, len(center_sq_dists), device=min_sq_dists.device)
+        is_pool = self.center_idxs < n_pool
+        if is_pool.any():
+            pool_centers = self.pool_features[self.center_idxs[is_pool]]
+            center_sq_dists[rows[is_pool]] = pool_centers.get_sq_dists(new_features).min(dim=1)[0]
+        if not is_pool.all():
+            train_centers = self.train_features[self.center_idxs[~is_pool] - n_pool]
+            center_sq_dists[rows[~is_pool]] = train_centers.get_sq_dists(new_features).min(dim=1)[0]
+        return torch.nonzero(center_sq_dists[closest_idxs] < 4 * (1 + self.slack) * min_sq_dists).squeeze(-1)
+
+    def add_centers(self, new_idxs: torch.Tensor):
+        """
+        :param new_idxs: torch.Tensor of integer type containing the indices of the new centers
+        wrt the concatenation of pool and train features.
+        """
+        self.center_idxs = torch.cat([self.center_idxs, new_idxs.to(self.center_idxs.device)])
 
 
 class MaxDistSelectionMethod(IterativeSelectionMethod):
@@ -503,11 +709,40 @@ class MaxDistSelectionMethod(IterativeSelectionMethod):
     Implements the MaxDist selection method for Batch Active Learning.
     """
 
-    def __init__(self, pool_features: Features, train_features: Features, sel_with_train: bool = True, **config):
+    def __init__(
+        self,
+        pool_features: Features,
+        train_features: Features,
+        sel_with_train: bool = True,
+        max_tile_size: int = 2**24,
+        triangle_pruning: bool = False,
+        **config,
+    ):
+        """
+        :param pool_features:
+        :param train_features:
+        :param sel_with_train:
+        :param max_tile_size: Maximum number of distances held in memory at once when adding points.
+        :param triangle_pruning: If True, use TriangleInequalityPruning to skip the distance computations
+        for pool points that cannot get closer to a new center. This can be much faster for large pool sets,
+        and the result only differs from the exact mode if there are (numerical) ties.
+        """
         super().__init__(
             pool_features=pool_features, train_features=train_features, sel_with_train=sel_with_train, **config
         )
-        self.min_sq_dists = np.inf * torch.ones(self.pool_features.get_n_samples(), device=pool_features.get_device())
+        self.max_tile_size = max_tile_size
+        self.min_sq_dists = np.inf * torch.ones(
+            self.pool_features.get_n_samples(), dtype=pool_features.get_dtype(), device=pool_features.get_device()
+        )
+        # the closest centers are only needed for pruning
+        self.closest_idxs = None
+        self.pruning = None
+        if triangle_pruning:
+            self.closest_idxs = torch.zeros(
+                self.pool_features.get_n_samples(), device=pool_features.get_device(), dtype=torch.long
+            )
+            self.pruning = TriangleInequalityPruning(pool_features, train_features)
+        self.n_sq_dist_evals = 0  # number of computed squared distances, including the ones between centers
 
     def get_scores(self) -> torch.Tensor:
         return self.min_sq_dists
@@ -522,12 +757,37 @@ class MaxDistSelectionMethod(IterativeSelectionMethod):
         # print('Next idx:', idx, '- Value:', scores[idx].item())
         return idx
 
+    def add_centers(
+        self, new_idxs: Union[slice, torch.Tensor]
+    ) -> Tuple[torch.Tensor, torch.Tensor, Optional[torch.Tensor]]:
+        """
+        Update the distances to the selection after adding new points to it, without increasing self.n_added.
+        :param new_idxs: slice or torch.Tensor of integer type containing idxs wrt self.features, see add_many().
+        :return: Returns the result of Features.update_min_sq_dists().
+        """
+        new_features = self.features[new_idxs]
+        idxs = None
+        if self.pruning is not None:
+            self.n_sq_dist_evals += len(self.pruning.center_idxs) * len(new_features)
+            idxs = self.pruning.get_candidates(self.min_sq_dists, self.closest_idxs, new_features)
+            self.pruning.add_centers(idxs_to_tensor(new_idxs, len(self.features)))
+        self.n_sq_dist_evals += len(new_features) * (len(self.pool_features) if idxs is None else len(idxs))
+        return self.pool_features.update_min_sq_dists(
+            self.min_sq_dists,
+            new_features,
+            closest_idxs=self.closest_idxs,
+            first_closest_idx=self.n_added + 1,
+            max_tile_size=self.max_tile_size,
+            idxs=idxs,
+        )
+
     def add(self, new_idx: int):
-        sq_dists = self.features[new_idx].get_sq_dists(self.pool_features).squeeze(0)
-        self.min_sq_dists = torch.minimum(self.min_sq_dists, sq_dists)
+        self.add_centers(slice(new_idx, new_idx + 1))
         # print('min_sq_dists:', self.min_sq_dists)
-        # if new_idx < len(self.pool_features):
-        #     print('sq dists at new idx:', sq_dists[new_idx].item(), 'and', self.min_sq_dists[new_idx].item())
+
+    def add_many(self, new_idxs: Union[slice, torch.Tensor]):
+        self.add_centers(new_idxs)
+        self.n_added += len(idxs_to_tensor(new_idxs, len(self.features)))
 
 
 class LargestClusterMaxDistSelectionMethod(IterativeSelectionMethod):
@@ -541,6 +801,11 @@ class LargestClusterMaxDistSelectionMethod(IterativeSelectionMethod):
         train_features: Features,
         sel_with_train: bool = True,
         dist_weight_mode: str = "sq-dist",
+        lcmd_init_state: Optional[Dict[str, Any]] = None,
+        n_cluster_candidates: int = 32,
+        max_tile_size: int = 2**24,
+        triangle_pruning: bool = False,
+        weight_rtol: float = 1e-9,
         **config,
     ):
         """
@@ -548,11 +813,31 @@ class LargestClusterMaxDistSelectionMethod(IterativeSelectionMethod):
         :param train_features:
         :param sel_with_train:
         :param dist_weight_mode: one of 'none', 'dist' or 'sq-dist'
+        :param lcmd_init_state: Optional state to continue from, in the format returned by get_state().
+        Its 'min_sq_dists' and 'closest_idxs' must correspond to the pool samples,
+        'n_clusters' is the number of centers already added
+        and the first 'n_train' training samples are assumed to be among these centers.
+        The state is only valid if the features are the same as the ones it was computed with.
+        If the features changed, 'min_sq_dists' can be set to None. Then the first 'n_train' training samples
+        must be the 'n_clusters' centers in the order in which they were added, the pool samples keep
+        their assignment to these centers, and their distances are recomputed with the current features.
+        Since a different center may have become closer, these distances can overestimate the true ones.
+        :param n_cluster_candidates: Number of points with the largest distance to their center
+        that are remembered per cluster. If all of them have been selected or have moved to a different cluster,
+        the candidates of the cluster are recomputed with a pass over the pool.
+        :param max_tile_size: Maximum number of distances held in memory at once when adding points.
+        :param triangle_pruning: If True, use TriangleInequalityPruning to skip the distance computations
+        for pool points that cannot get closer to a new center, see MaxDistSelectionMethod.
+        Points assigned to a center from lcmd_init_state are never pruned.
+        :param weight_rtol: Relative tolerance below the largest maintained cluster weight within which clusters
+        are compared again with freshly summed weights, such that ties are resolved as in get_scores().
         """
         super().__init__(
             pool_features=pool_features, train_features=train_features, sel_with_train=sel_with_train, **config
         )
         self.dist_weight_mode = dist_weight_mode
+        self.max_tile_size = max_tile_size
+        self.weight_rtol = weight_rtol
         self.min_sq_dists = np.inf * torch.ones(
             self.pool_features.get_n_samples(), dtype=pool_features.get_dtype(), device=pool_features.get_device()
         )
@@ -562,15 +847,55 @@ class LargestClusterMaxDistSelectionMethod(IterativeSelectionMethod):
         self.neg_inf_tensor = torch.as_tensor(
             [-np.inf], dtype=pool_features.get_dtype(), device=pool_features.get_device()
         )
-
-    def get_scores(self) -> torch.Tensor:
+        if lcmd_init_state is not None:
+            self.closest_idxs = torch.as_tensor(
+                lcmd_init_state["closest_idxs"], dtype=torch.long, device=pool_features.get_device()
+            ).clone()
+            if lcmd_init_state["min_sq_dists"] is None:
+                if not sel_with_train or lcmd_init_state["n_train"] != lcmd_init_state["n_clusters"]:
+                    raise ValueError("Recomputing the distances of lcmd_init_state requires all centers in train")
+                # cluster i > 0 belongs to the i-th added center, i.e., to training sample i - 1
+                self.min_sq_dists = pool_features.get_paired_sq_dists(train_features[self.closest_idxs - 1])
+            else:
+                self.min_sq_dists = torch.as_tensor(
+                    lcmd_init_state["min_sq_dists"], dtype=pool_features.get_dtype(), device=pool_features.get_device()
+                ).clone()
+            self.n_added = lcmd_init_state["n_clusters"]
+            self.n_init_train = lcmd_init_state["n_train"] if sel_with_train else 0
+        self.pruning = (
+            TriangleInequalityPruning(pool_features, train_features, n_init_centers=self.n_added)
+            if triangle_pruning
+            else None
+        )
+        self.n_sq_dist_evals = 0  # number of computed squared distances, including the ones between centers
+
+        # index over the clusters such that a selection step does not need to look at the whole pool:
+        # the summed weights of each cluster and, for the clusters in which points were (re)assigned,
+        # the non-selected points with the largest distances to their center as candidates
+        self.n_cluster_candidates = n_cluster_candidates
+        self.cluster_weights = torch.zeros(self.n_added + 1, dtype=torch.float64, device=pool_features.get_device())
+        self.cluster_candidates = {}
+        if self.n_added > 0:
+            weights = self.get_weights(self.min_sq_dists).to(torch.float64)
+            self.cluster_weights.index_add_(0, self.closest_idxs, weights)
+            self.update_cluster_candidates(torch.arange(len(self.min_sq_dists), device=pool_features.get_device()))
+
+    def get_weights(self, sq_dists: torch.Tensor) -> torch.Tensor:
+        """
+        :param sq_dists: Squared distances of pool points to their closest center.
+        :return: Returns the weights with which these points count towards the size of their cluster.
+        """
         if self.dist_weight_mode == "sq-dist":
-            weights = self.min_sq_dists
+            return sq_dists
         elif self.dist_weight_mode == "dist":
-            weights = self.min_sq_dists.sqrt()
-        else:
-            weights = None
-        bincount = torch.bincount(self.closest_idxs, weights=weights, minlength=self.n_added + 1)
+            # clamp rounding errors, a nan would stay in the summed cluster weights
+            return sq_dists.clamp(min=0.0).sqrt()
+        return torch.ones_like(sq_dists)
+
+    def get_scores(self) -> torch.Tensor:
+        bincount = torch.bincount(
+            self.closest_idxs, weights=self.get_weights(self.min_sq_dists), minlength=self.n_added + 1
+        )
         max_bincount = torch.max(bincount)
         # print(f'max bincount: {max_bincount.item():g}, max_min_sq_dist: {torch.max(self.min_sq_dists).item():g}, '
         #       f'number of zero dists: {self.min_sq_dists.shape[0] - torch.count_nonzero(self.min_sq_dists).item()}, ',
@@ -581,16 +906,137 @@ class LargestClusterMaxDistSelectionMethod(IterativeSelectionMethod):
         if self.n_added == 0:
             # no point added yet, take point with largest norm
             return torch.argmax(self.pool_features.get_kernel_matrix_diag()).item()
-        scores = self.get_scores().clone()
-        scores[self.selected_idxs] = -np.inf
-        idx = torch.argmax(scores).item()
-        return idx
+        # this is equivalent to the argmax of get_scores() over the non-selected points,
+        # but only looks at the cluster weights and the candidates of the largest cluster(s)
+        weights = self.cluster_weights[: self.n_added + 1]
+        max_weight = weights.max()
+        # the incrementally updated weights can deviate from the sums in get_scores() by rounding errors,
+        # hence all clusters close to the maximum are compared again with freshly summed weights
+        # (unless all weights are one, then the sums are exact)
+        clusters = torch.nonzero(weights >= max_weight - self.weight_rtol * max_weight).squeeze(-1)
+        if len(clusters) > 1 and self.dist_weight_mode != "none":
+            summed_weights = self.get_summed_cluster_weights(clusters)
+            clusters = clusters[summed_weights == summed_weights.max()]
+        best_idx = None
+        for cluster in clusters.tolist():
+            idx = self.get_cluster_candidate(cluster)
+            if idx is not None and (
+                best_idx is None
+                or (self.min_sq_dists[idx].item(), -idx) > (self.min_sq_dists[best_idx].item(), -best_idx)
+            ):
+                best_idx = idx
+        return best_idx
+
+    def get_summed_cluster_weights(self, clusters: torch.Tensor) -> torch.Tensor:
+        """
+        :param clusters: torch.Tensor of integer type containing cluster indices.
+        :return: Returns the weights of these clusters summed over their points in the same order as
+        the torch.bincount() in get_scores(), which gives the same values without the rounding errors
+        accumulated in self.cluster_weights.
+        """
+        in_clusters = torch.isin(self.closest_idxs, clusters)
+        summed_weights = torch.bincount(
+            self.closest_idxs[in_clusters],
+            weights=self.get_weights(self.min_sq_dists[in_clusters]),
+            minlength=self.n_added + 1,
+        )
+        return summed_weights[clusters]
+
+    def get_cluster_candidate(self, cluster: int) -> Optional[int]:
+        """
+        :param cluster: Index of the cluster.
+        :return: Returns the non-selected point of the cluster with the largest distance to its center,
+        or None if all points of the cluster have been selected.
+        """
+        for rebuild in [False, True]:
+            if rebuild:
+                self.update_cluster_candidates(torch.nonzero(self.closest_idxs == cluster).squeeze(-1))
+            candidates = self.cluster_candidates.get(cluster, [])
+            while len(candidates) > 0:
+                idx = candidates[-1]
+                if self.closest_idxs[idx].item() == cluster and not self.selected_arr[idx].item():
+                    return idx
+                candidates.pop()  # the point has moved to a newer cluster or has been selected
+        return None
+
+    def update_cluster_candidates(self, idxs: torch.Tensor):
+        """
+        Recompute the candidate lists of all clusters that contain one of the given pool points
+        from the non-selected points among them. Since points only move to newly added clusters,
+        passing all points whose cluster changed keeps the candidate lists of the new clusters complete,
+        while stale entries in the lists of the old clusters are skipped in get_next_idx().
+        :param idxs: torch.Tensor of integer type containing pool indices.
+        """
+        idxs = idxs[~self.selected_arr[idxs]]
+        # sort by distance (largest first, lower index first on ties) and then group by cluster
+        idxs = idxs[torch.sort(self.min_sq_dists[idxs], descending=True, stable=True)[1]]
+        idxs = idxs[torch.sort(self.closest_idxs[idxs], stable=True)[1]]
+        clusters, counts = torch.unique_consecutive(self.closest_idxs[idxs], return_counts=True)
+        idxs_list = idxs.tolist()
+        start = 0
+        for cluster, count in zip(clusters.tolist(), counts.tolist()):
+            # stored in ascending order such that the best candidate can be removed with pop()
+            self.cluster_candidates[cluster] = idxs_list[start : start + min(count, self.n_cluster_candidates)][::-1]
+            start += count
+
+    def update_clusters(self, idxs: torch.Tensor, old_sq_dists: torch.Tensor, old_clusters: torch.Tensor):
+        """
+        Update the cluster weights and candidate lists after pool points have moved to new clusters.
+        :param idxs: torch.Tensor of integer type containing the pool indices of the points that moved.
+        :param old_sq_dists: torch.Tensor containing the previous squared distance of each point to its center.
+        :param old_clusters: torch.Tensor of integer type containing the previous cluster of each point.
+        """
+        clusters = self.closest_idxs[idxs]
+        n_clusters = clusters.max().item() + 1 if len(clusters) > 0 else 0
+        if n_clusters > len(self.cluster_weights):
+            # grow geometrically since add() is called once per selected point
+            cluster_weights = self.cluster_weights.new_zeros(max(n_clusters, 2 * len(self.cluster_weights)))
+            cluster_weights[: len(self.cluster_weights)] = self.cluster_weights
+            self.cluster_weights = cluster_weights
+        old_weights = self.get_weights(old_sq_dists).to(torch.float64)
+        # points that have not been assigned to a center yet have infinite weight, which is not summed up
+        old_weights = torch.where(torch.isfinite(old_weights), old_weights, torch.zeros_like(old_weights))
+        self.cluster_weights.index_add_(0, old_clusters, -old_weights)
+        self.cluster_weights.index_add_(0, clusters, self.get_weights(self.min_sq_dists[idxs]).to(torch.float64))
+        self.update_cluster_candidates(idxs)
+
+    def add_centers(self, new_idxs: Union[slice, torch.Tensor]):
+        """
+        Add new centers, which get the next cluster indices in order, without increasing self.n_added.
+        :param new_idxs: slice or torch.Tensor of integer type containing idxs wrt self.features, see add_many().
+        """
+        new_features = self.features[new_idxs]
+        idxs = None
+        if self.pruning is not None:
+            self.n_sq_dist_evals += len(self.pruning.center_idxs) * len(new_features)
+            idxs = self.pruning.get_candidates(self.min_sq_dists, self.closest_idxs, new_features)
+            self.pruning.add_centers(idxs_to_tensor(new_idxs, len(self.features)))
+        self.n_sq_dist_evals += len(new_features) * (len(self.pool_features) if idxs is None else len(idxs))
+        self.update_clusters(
+            *self.pool_features.update_min_sq_dists(
+                self.min_sq_dists,
+                new_features,
+                closest_idxs=self.closest_idxs,
+                first_closest_idx=self.n_added + 1,
+                max_tile_size=self.max_tile_size,
+                idxs=idxs,
+            )
+        )
 
     def add(self, new_idx: int):
-        sq_dists = self.features[new_idx].get_sq_dists(self.pool_features).squeeze(0)
-        new_min = sq_dists < self.min_sq_dists
-        self.closest_idxs[new_min] = self.n_added + 1
-        self.min_sq_dists[new_min] = sq_dists[new_min]
+        self.add_centers(slice(new_idx, new_idx + 1))
+
+    def add_many(self, new_idxs: Union[slice, torch.Tensor]):
+        self.add_centers(new_idxs)
+        self.n_added += len(idxs_to_tensor(new_idxs, len(self.features)))
+
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        return {
+            "min_sq_dists": self.min_sq_dists,
+            "closest_idxs": self.closest_idxs,
+            "n_clusters": self.n_added,
+            "n_train": len(self.train_features) if self.with_train else 0,
+        }
 
 
 class FrankWolfeSelectionMethod(IterativeSelectionMethod):
@@ -727,9 +1173,10 @@ class RandomizedMinDistSumSelectionMethod(MaxDistSelectionMethod):
         n_candidates = min(self.max_n_candidates, len(self.pool_features) - len(self.selected_idxs))
         weights = torch.ones_like(self.min_sq_dists) if self.n_added == 0 else torch.clamp(self.min_sq_dists, min=0.0)
         candidates = torch.multinomial(weights, n_candidates)
-        sq_dists = self.pool_features[candidates].get_sq_dists(self.pool_features)
-        new_sq_dist_sums = torch.minimum(self.min_sq_dists[None, :].expand(n_candidates, -1), sq_dists).sum(dim=-1)
-        new_sq_dist_sums[self.selected_idxs] = np.inf
+        new_sq_dist_sums = self.pool_features.get_min_sq_dist_sums(
+            self.min_sq_dists, self.pool_features[candidates], max_tile_size=self.max_tile_size
+        )
+        new_sq_dist_sums[self.selected_arr[candidates]] = np.inf
         return candidates[torch.argmin(new_sq_dist_sums)].item()
 
 
@@ -6,10 +6,10 @@ from abc import ABC, abstractmethod
 
 import torch
 
-from torch.nn import functional as F
 from torch.utils.data import Dataset
 
 from al_pipe.embedding_models.static.base_static_embedder import BaseStaticEmbedder
+from al_pipe.util.data import dna_collate_fn, keep_mask
 
 
 class BaseDataset(Dataset, ABC):
@@ -46,30 +46,19 @@ class BaseDataset(Dataset, ABC):
         raise NotImplementedError()
 
     @abstractmethod
-    def _embed_data(self) -> list[torch.Tensor]:
+    def _embed_data(self) -> torch.Tensor:
         """Embed the data."""
         raise NotImplementedError()
 
     def delete(self, indices: list[int]) -> None:
-        """Delete the items at the given indices."""
-        for index in sorted(indices, reverse=True):
-            del self.data[index]
+        """Delete the items at the given indices (or boolean mask) in one pass."""
+        mask = keep_mask(indices, len(self.data))
+        self.data = [item for item, keep in zip(self.data, mask, strict=True) if keep]
 
     def dna_collate_fn(
         self, batch: list[tuple[torch.Tensor, torch.Tensor]], max_length: int
     ) -> tuple[torch.Tensor, torch.Tensor]:
         """
-        Collate function for DNA sequences of various lengths.
+        Collate function for DNA sequences of various lengths, see `al_pipe.util.data.dna_collate_fn`.
         """
-        inputs = [item[0] for item in batch]
-        labels = torch.stack([item[1] for item in batch])
-
-        processed_inputs = []
-        for tensor in inputs:
-            if tensor.shape[0] < max_length:
-                processed_inputs.append(F.pad(tensor, (0, 0, 0, max_length - tensor.shape[0]), "constant", 0))
-                # padding = torch.zeros(max_length - tensor.shape[0], *tensor.shape[1:])
-                # processed_inputs.append(torch.cat([tensor, padding], dim=0))
-            else:
-                processed_inputs.append(tensor[:max_length])
-        return torch.stack(processed_inputs), labels
+        return dna_collate_fn(batch, max_length)
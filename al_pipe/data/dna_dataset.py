@@ -1,17 +1,29 @@
 """Specialized dataset class(es) for DNA data."""
 
-from copy import deepcopy
-
+import numpy as np
 import pandas as pd
 import torch
 
 from al_pipe.data.base_dataset import BaseDataset
+from al_pipe.data.embedding_store import CodeEmbeddingStore, EmbeddingStore
 from al_pipe.embedding_models.static.base_static_embedder import BaseStaticEmbedder
-from al_pipe.util.data import load_data
+from al_pipe.util.data import BINARY_SUFFIX, CodedSequences, keep_mask, load_binary_data, load_data
 
 
 class DNADataset(BaseDataset):
-    """Dataset for DNA data."""
+    """Dataset for DNA data.
+
+    The loaded data is kept as columnar storage (``sequences``, ``values`` and the
+    embedding store), all indexed by global row id. The dataset itself only owns
+    ``row_ids``, the global row ids of the rows it currently contains, so subsets
+    created with `return_subset` share the storage and cost one int64 array each.
+
+    Files with the binary dataset suffix (see `al_pipe.util.data.convert_csv_to_binary`)
+    are memory-mapped instead of parsed: ``codes`` holds the nucleotide byte codes,
+    sequences are only decoded to strings when they are accessed and rows are only embedded
+    when they are fetched or a whole split is read. Passing ``chunksize`` streams a CSV into
+    such a file first, see `al_pipe.util.data.load_data`.
+    """
 
     def __init__(
         self,
@@ -21,64 +33,159 @@ class DNADataset(BaseDataset):
         train_val_test_pool_split: list[float],
         max_length: int,
         embedding_model: BaseStaticEmbedder,
+        chunksize: int | None = None,
     ) -> None:
         super().__init__(data_path, data_name, batch_size, train_val_test_pool_split, max_length, embedding_model)
-        self.data: pd.DataFrame = self._load_data()
+        self.codes: np.ndarray | None = None
+        if self.data_path.lower().endswith(BINARY_SUFFIX):
+            self.codes, self.values = load_binary_data(self.data_path)
+        elif chunksize is not None:
+            self.codes, self.values = load_data(self.data_path, chunksize=chunksize, max_length=max_length)
+        else:
+            data = self._load_data()
+            self.sequences: np.ndarray | CodedSequences = data["sequences"].to_numpy()
+            self.values: np.ndarray = data["values"].to_numpy()
+        if self.codes is not None:
+            self.sequences = CodedSequences(self.codes)
+        self.row_ids: np.ndarray = np.arange(len(self.values), dtype=np.int64)
+        # contiguous float32 labels by global row id, used for batched fetching
+        self.label_store: torch.Tensor = torch.from_numpy(np.array(self.values, dtype=np.float32))
         self.max_length: int = max_length
+        self.embedding_store: EmbeddingStore | None = None
+        self._sequence_index: tuple[pd.Index, np.ndarray] | None = None
 
         if self.embedding_model is not None:
             self.update_embedded_data()
 
-    # TODO: this is such shit design (you need to update embedded data every run)
     def update_embedded_data(self) -> None:
-        """Update the embedded data."""
-        self.embedded_data: list[torch.Tensor] = self._embed_data()
+        """Build the embedding store if it does not exist yet.
+
+        The store is keyed by global row id and shared with every subset, so calling this
+        again after rows were moved between splits is a no-op. For binary or streamed datasets
+        the store keeps the codes and embeds rows lazily, see `CodeEmbeddingStore`.
+        """
+        if self.embedding_store is None:
+            if self.codes is not None:
+                # the (memory-mapped) codes back the store and are embedded per gather
+                self.embedding_store = CodeEmbeddingStore(self.codes, self.embedding_model, self.max_length)
+            else:
+                self.embedding_store = EmbeddingStore(self._embed_data())
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """The rows of this dataset as a DataFrame indexed by global row id."""
+        return pd.DataFrame(
+            {"sequences": self.sequences[self.row_ids], "values": self.values[self.row_ids]}, index=self.row_ids
+        )
+
+    @property
+    def embedded_data(self) -> torch.Tensor:
+        """Embeddings of the rows in this dataset, gathered from the embedding store.
+
+        As this reads a whole split, the store is materialized first, such that lazily
+        embedded stores embed every row only once and not on every access.
+        """
+        self.embedding_store.materialize()
+        return self.embedding_store.gather(self.row_ids)
 
-    # TODO: check potential bug here, 1. dtype 2. tolist() -> tensor?
     def get_labels(self) -> torch.Tensor:
         """Get the labels of the data."""
-        return torch.tensor(self.data["values"].tolist(), dtype=torch.float32).unsqueeze(1)
+        return self.label_store[self.row_ids].unsqueeze(1)
 
-    def return_subset(self, indices: list[int]) -> "DNADataset":
-        """Return a subset of the data."""
-        new_dataset = deepcopy(self)
-        new_dataset.data = self.data.iloc[indices]
-        new_dataset.update_embedded_data()
-        return new_dataset
+    def return_subset(self, indices: list[int]) -> "DNASubset":
+        """Return a subset of the data.
+
+        Args:
+            indices (list[int]): Positions (not row ids) of the rows to keep.
+
+        Returns:
+            DNASubset: A view sharing the storage of this dataset.
+        """
+        return DNASubset(self, self.row_ids[np.asarray(indices, dtype=np.int64)])
 
     def get_subset(self, indices: list[int]) -> pd.DataFrame:
         """Get a subset of the data."""
-        return self.data.iloc[indices]
-
-    def delete(self, indices):
-        # allow indices as Tensor, list of Tensor, or list of ints
-        # TODO: shady fix, change when have time
-        if isinstance(indices, torch.Tensor):
-            indices = indices.tolist()
-        indices = [int(i) for i in indices]
-        for idx in sorted(indices, reverse=True):
-            # drop by positional index, not label
-            self.data = self.data.drop(self.data.index[idx])
-        self.data.reset_index(drop=True, inplace=True)
-
-    def append(self, data: pd.DataFrame) -> None:
-        """Append the given data to the data."""
-        self.data = pd.concat([self.data, data], ignore_index=True)
-
-    def _embed_data(self) -> list[torch.Tensor]:
+        row_ids = self.row_ids[np.asarray(indices, dtype=np.int64)]
+        return pd.DataFrame({"sequences": self.sequences[row_ids], "values": self.values[row_ids]}, index=row_ids)
+
+    def delete(self, indices: np.ndarray | torch.Tensor | list[int]) -> None:
+        """Delete the rows at the given positions in one pass.
+
+        Args:
+            indices: A boolean mask over the rows, or integer positions as a tensor, array,
+                list or set. Only the row id array is touched, the shared storage is not.
+        """
+        self.row_ids = self.row_ids[keep_mask(indices, len(self.row_ids))]
+        self._sequence_index = None
+
+    def append(self, data: pd.DataFrame | np.ndarray) -> None:
+        """Append rows of the storage to this dataset.
+
+        Args:
+            data (pd.DataFrame | np.ndarray): Either global row ids or a DataFrame returned by
+                `get_subset`, whose index holds the global row ids.
+        """
+        row_ids = data.index if isinstance(data, pd.DataFrame) else data
+        self.row_ids = np.concatenate([self.row_ids, np.asarray(row_ids, dtype=np.int64)])
+        self._sequence_index = None
+
+    def _embed_data(self) -> torch.Tensor:
         """Embed the data."""
-        return self.embedding_model.embed_any_sequences(self.data["sequences"])
+        embeddings = self.embedding_model.embed_any_sequences(pd.Series(self.sequences), max_length=self.max_length)
+        if len(embeddings) != len(self.sequences):
+            raise ValueError(
+                f"Embedding model returned {len(embeddings)} embeddings for {len(self.sequences)} sequences."
+            )
+        return embeddings
 
     def _load_data(self) -> pd.DataFrame:
         """Load data from the data path.
 
         This method utilizes the load_data function to read the dataset from the specified
-        data path. It returns the loaded data as a list of torch tensors.
+        data path. Rows whose sequence contains characters other than A, C, G, T and N are
+        dropped, as the embedding model skips them and embeddings, values and row ids have to
+        stay aligned.
 
         Returns:
             pd.DataFrame: A pandas DataFrame containing the loaded DNA sequences and their values.
         """
-        return load_data(self.data_path)
+        data = load_data(self.data_path)
+        valid = data["sequences"].str.fullmatch("[ACGTN]*", na=False).to_numpy(dtype=bool)
+        if not valid.all():
+            print(f"Dropping {int((~valid).sum())} sequences with characters other than A, C, G, T and N.")
+            data = data[valid].reset_index(drop=True)
+        return data
+
+    def _get_sequence_index(self) -> tuple[pd.Index, np.ndarray]:
+        """Return the hash index of the sequences in this dataset and the row id of each entry.
+
+        Built lazily on first use and dropped whenever rows are appended or deleted. If a
+        sequence occurs more than once, its first occurrence is used.
+        """
+        if self._sequence_index is None:
+            sequences = pd.Index(self.sequences[self.row_ids])
+            first = ~sequences.duplicated(keep="first")
+            self._sequence_index = (sequences[first], self.row_ids[first])
+        return self._sequence_index
+
+    def return_labels(self, sequences: list[str] | np.ndarray | pd.Series) -> np.ndarray:
+        """Return the labels for the given sequences in one vectorized lookup.
+
+        Args:
+            sequences (list[str] | np.ndarray | pd.Series): The DNA sequences to label.
+
+        Returns:
+            np.ndarray: The labels, in the order of the given sequences.
+
+        Raises:
+            ValueError: If a sequence is not in the dataset.
+        """
+        index, row_ids = self._get_sequence_index()
+        positions = index.get_indexer(sequences)
+        missing = positions < 0
+        if missing.any():
+            raise ValueError(f"Sequence {np.asarray(sequences)[missing][0]} not found in the dataset.")
+        return self.values[row_ids[positions]]
 
     def return_label(self, sequences: list[str]) -> list[float]:
         """Return the labels for the given sequences.
@@ -89,16 +196,46 @@ class DNADataset(BaseDataset):
         Returns:
             list[float]: A list of labels corresponding to the given sequences.
         """
-        labels = []
-        for sequence in sequences:
-            if sequence in self.data["sequences"].values:
-                labels.append(self.data.loc[self.data["sequences"] == sequence, "values"].values[0])
-            else:
-                raise ValueError(f"Sequence {sequence} not found in the dataset.")
-        return labels
+        return self.return_labels(sequences).tolist()
 
     def __len__(self) -> int:
-        return len(self.data)
+        return len(self.row_ids)
 
     def __getitem__(self, index: int) -> tuple[torch.Tensor, torch.Tensor]:
-        return self.embedded_data[index].float(), torch.tensor(self.data["values"].iloc[index]).float()
+        row_id = self.row_ids[index]
+        return self.embedding_store[row_id].float(), self.label_store[row_id]
+
+    def __getitems__(self, indices: list[int] | np.ndarray) -> tuple[torch.Tensor, torch.Tensor]:
+        """Fetch a whole batch with one gather from the embedding and label stores.
+
+        The DataLoader calls this instead of `__getitem__` per sample and hands the returned,
+        already collated (inputs, labels) tuple to the collate function.
+        """
+        row_ids = torch.from_numpy(self.row_ids[np.asarray(indices, dtype=np.int64)])
+        return self.embedding_store.gather(row_ids).float(), self.label_store[row_ids]
+
+
+class DNASubset(DNADataset):
+    """Split view (train, val, test or pool) of a `DNADataset`.
+
+    Shares the sequences, values, embedding store and embedding model of the parent and
+    only holds the int64 array of global row ids it contains.
+    """
+
+    def __init__(self, parent: DNADataset, row_ids: np.ndarray) -> None:
+        # nothing is loaded or embedded here, every attribute except row_ids is shared with the parent
+        self.data_path = parent.data_path
+        self.batch_size = parent.batch_size
+        self.max_length = parent.max_length
+        self.train_val_test_pool_split = parent.train_val_test_pool_split
+        self.embedding_model = parent.embedding_model
+        self.embedding_store = parent.embedding_store
+        self.sequences = parent.sequences
+        self.values = parent.values
+        self.label_store = parent.label_store
+        self.codes = parent.codes
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)
+        self._sequence_index = None
+
+    def update_embedded_data(self) -> None:
+        """Subsets never embed, the embedding store belongs to the parent dataset."""
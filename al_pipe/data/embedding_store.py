@@ -0,0 +1,96 @@
+"""Embedding store shared between a dataset and all of its split views."""
+
+import numpy as np
+import torch
+
+from al_pipe.embedding_models.static.base_static_embedder import BaseStaticEmbedder
+
+
+class EmbeddingStore:
+    """Embeddings of every row of a dataset, computed once and keyed by global row id.
+
+    The parent dataset builds the store when it is loaded. Train, val, test and pool
+    datasets only hold row ids and gather from the shared store, so moving samples
+    between splits never triggers re-embedding.
+    """
+
+    def __init__(self, embeddings: torch.Tensor) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            embeddings: torch.Tensor, the embeddings, row ``i`` belongs to global row id ``i``
+        """
+        self.embeddings = embeddings
+
+    def gather(self, row_ids: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """Return the embeddings of the given global row ids, in order."""
+        return self.embeddings[torch.as_tensor(row_ids, dtype=torch.long)]
+
+    def materialize(self) -> None:
+        """Make sure the embeddings of all rows are held in memory, see `CodeEmbeddingStore`."""
+
+    def __getitem__(self, row_id: int) -> torch.Tensor:
+        return self.embeddings[row_id]
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+
+class CodeEmbeddingStore(EmbeddingStore):
+    """Embedding store backed by the nucleotide byte codes of a dataset instead of the embeddings.
+
+    Used for datasets loaded from binary files or streamed from large CSVs, whose codes are
+    memory-mapped. The codes are neither copied nor embedded up front: batches are read and
+    embedded when they are gathered, so startup is instant and the memory of the DataLoader
+    path is bounded by the batch size instead of the dataset size.
+
+    Reads of whole splits (e.g. the train and pool features of a query strategy) call
+    `materialize` first, which embeds all rows once, chunk by chunk, into one preallocated
+    tensor. Later gathers index into it, so every selection round does not re-embed the data.
+    """
+
+    def __init__(
+        self, codes: np.ndarray, embedding_model: BaseStaticEmbedder, max_length: int, chunk_size: int = 65536
+    ) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            codes: np.ndarray, uint8 codes of shape [N, L], row ``i`` belongs to global row id ``i``
+            embedding_model: BaseStaticEmbedder, the embedder whose ``embed_codes`` is applied per gather
+            max_length: int, the length the sequences are padded or truncated to
+            chunk_size: int, the number of rows embedded at a time by `materialize`
+        """
+        self.codes = codes
+        self.embedding_model = embedding_model
+        self.max_length = max_length
+        self.chunk_size = chunk_size
+        self.embeddings: torch.Tensor | None = None
+
+    def gather(self, row_ids: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """Return the embeddings of the given global row ids, in order, embedding their codes if needed."""
+        if self.embeddings is not None:
+            return super().gather(row_ids)
+        if isinstance(row_ids, torch.Tensor):
+            row_ids = row_ids.cpu().numpy()
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        return self.embedding_model.embed_codes(self.codes[row_ids], max_length=self.max_length)
+
+    def materialize(self) -> None:
+        """Embed all rows once, chunk by chunk, and keep the embeddings for later gathers."""
+        if self.embeddings is not None:
+            return
+        embeddings = None
+        for start in range(0, len(self.codes), self.chunk_size):
+            chunk = self.embedding_model.embed_codes(self.codes[start : start + self.chunk_size], self.max_length)
+            if embeddings is None:
+                embeddings = chunk.new_empty((len(self.codes), *chunk.shape[1:]))
+            embeddings[start : start + len(chunk)] = chunk
+        self.embeddings = embeddings
+
+    def __getitem__(self, row_id: int) -> torch.Tensor:
+        return self.gather(np.array([row_id]))[0]
+
+    def __len__(self) -> int:
+        return len(self.codes)
@@ -6,6 +6,8 @@ from typing import TYPE_CHECKING
 from torch.utils.data import DataLoader
 
 from al_pipe.data.base_dataset import BaseDataset
+from al_pipe.data_loader.batch_sampler import SliceBatchSampler
+from al_pipe.data_loader.resident_data_loader import ResidentDataLoader
 
 if TYPE_CHECKING:
     pass
@@ -26,6 +28,9 @@ class BaseDataLoader(DataLoader, ABC):
         pin_memory: bool = True,
         shuffle: bool = True,
         first_batch_strategy=None,
+        slice_batches: bool = False,
+        resident_device: str | None = None,
+        persistent_workers: bool = False,
     ) -> None:
         """Initialize the data loader.
 
@@ -35,6 +40,12 @@ class BaseDataLoader(DataLoader, ABC):
             num_workers: Number of subprocesses for data loading
             pin_memory: If True, pin memory for faster data transfer to GPU
             shuffle: If True, shuffle the data at every epoch
+            slice_batches: If True, split loaders draw batches with a SliceBatchSampler, so datasets
+                implementing ``__getitems__`` fetch each batch with one gather
+            resident_device: If set, split loaders are ResidentDataLoaders keeping the whole split
+                as tensors on this device instead of DataLoaders (meant for small splits)
+            persistent_workers: If True (and num_workers > 0), split loaders keep their worker processes
+                alive between epochs and AL iterations until their split changes
         """
         super().__init__(
             dataset,
@@ -48,6 +59,12 @@ class BaseDataLoader(DataLoader, ABC):
         self._num_workers = num_workers
         self._pin_memory = pin_memory
         self._shuffle = shuffle
+        self._slice_batches = slice_batches
+        self._resident_device = resident_device
+        self._persistent_workers = persistent_workers and num_workers > 0
+
+        # Split loaders are built on first use and reused until their split changes
+        self._loaders: dict[str, DataLoader | ResidentDataLoader] = {}
 
         # Initialize data splits
         self._train_dataset: BaseDataset | None = None
@@ -63,14 +80,16 @@ class BaseDataLoader(DataLoader, ABC):
     def update_train_pool_dataset(self, new_indices: list[int]) -> None:
         """Move the selected indices from pool_dataset to train dataset.
 
+        Both datasets gather their embeddings from the store of the full dataset by row id,
+        so no re-embedding happens here.
+
         Args:
             new_indices: Indices of new samples to add to training set
         """
         data_to_move = self._pool_dataset.get_subset(new_indices)
         self._train_dataset.append(data_to_move)
         self._pool_dataset.delete(new_indices)
-        self._train_dataset.update_embedded_data()
-        self._pool_dataset.update_embedded_data()
+        self._invalidate_loaders("train", "pool")
 
     def update_train_dataset(self, new_indices: list[int], action_type: str) -> None:
         """Update training dataset with new samples.
@@ -81,7 +100,7 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if action_type == "first-set":
             self._train_dataset = self._dataset.return_subset(new_indices)
-            self._train_dataset.update_embedded_data()
+            self._invalidate_loaders("train")
         else:
             raise ValueError(f"Invalid action type: {action_type}")
 
@@ -94,7 +113,7 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if action_type == "first-set":
             self._val_dataset = self._dataset.return_subset(new_indices)
-            self._val_dataset.update_embedded_data()
+            self._invalidate_loaders("val")
         else:
             raise ValueError(f"Invalid action type: {action_type}")
 
@@ -107,7 +126,7 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if action_type == "first-set":
             self._test_dataset = self._dataset.return_subset(new_indices)
-            self._test_dataset.update_embedded_data()
+            self._invalidate_loaders("test")
         else:
             raise ValueError(f"Invalid action type: {action_type}")
 
@@ -121,29 +140,63 @@ class BaseDataLoader(DataLoader, ABC):
         if action_type == "first-set":
             self._pool_dataset = self._dataset.return_subset(new_indices)
         elif action_type == "remove":
-            self._pool_dataset = self._pool_dataset.delete(new_indices)
+            self._pool_dataset.delete(new_indices)
         else:
             raise ValueError(f"Invalid action type: {action_type}")
-        self._pool_dataset.update_embedded_data()
+        self._invalidate_loaders("pool")
 
-    def get_train_loader(self) -> DataLoader:
-        """Get DataLoader for training data.
+    def _invalidate_loaders(self, *splits: str) -> None:
+        """Drop the cached loaders of the given splits, e.g. because their rows changed.
 
-        Returns:
-            DataLoader for training dataset
+        Persistent workers and resident loaders hold a snapshot of their split, so they must be
+        rebuilt after a change. Dropping the last reference shuts the worker processes down.
         """
-        if self._train_dataset is None:
-            raise ValueError("Training dataset has not been initialized")
+        for split in splits:
+            self._loaders.pop(split, None)
+
+    def _get_loader(self, split: str, dataset: BaseDataset) -> DataLoader | ResidentDataLoader:
+        """Return the cached loader of a split, building it if needed."""
+        if split not in self._loaders:
+            self._loaders[split] = self._build_loader(dataset)
+        return self._loaders[split]
+
+    def _build_loader(self, dataset: BaseDataset) -> DataLoader | ResidentDataLoader:
+        """Build a DataLoader over one of the splits."""
+        if self._resident_device is not None:
+            return ResidentDataLoader(dataset, self._batch_size, shuffle=self._shuffle, device=self._resident_device)
+        if self._slice_batches:
+            batch_sampler = SliceBatchSampler(dataset, self._batch_size, shuffle=self._shuffle)
+            return DataLoader(
+                dataset,
+                batch_sampler=batch_sampler,
+                num_workers=self._num_workers,
+                pin_memory=self._pin_memory,
+                collate_fn=self.get_collate_fn(),
+                persistent_workers=self._persistent_workers,
+            )
         return DataLoader(
-            self._train_dataset,
+            dataset,
             batch_size=self._batch_size,
             shuffle=self._shuffle,
             num_workers=self._num_workers,
             pin_memory=self._pin_memory,
             collate_fn=self.get_collate_fn(),
+            persistent_workers=self._persistent_workers,
         )
 
-    def get_val_loader(self) -> DataLoader:
+    def get_train_loader(self) -> DataLoader | ResidentDataLoader:
+        """Get DataLoader for training data.
+
+        The loader is cached and only rebuilt after the training split changes.
+
+        Returns:
+            DataLoader for training dataset
+        """
+        if self._train_dataset is None:
+            raise ValueError("Training dataset has not been initialized")
+        return self._get_loader("train", self._train_dataset)
+
+    def get_val_loader(self) -> DataLoader | ResidentDataLoader:
         """Get DataLoader for validation data.
 
         Returns:
@@ -151,16 +204,9 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if self._val_dataset is None:
             raise ValueError("Validation dataset has not been initialized")
-        return DataLoader(
-            self._val_dataset,
-            batch_size=self._batch_size,
-            shuffle=self._shuffle,
-            num_workers=self._num_workers,
-            pin_memory=self._pin_memory,
-            collate_fn=self.get_collate_fn(),
-        )
+        return self._get_loader("val", self._val_dataset)
 
-    def get_test_loader(self) -> DataLoader:
+    def get_test_loader(self) -> DataLoader | ResidentDataLoader:
         """Get DataLoader for test data.
 
         Returns:
@@ -168,16 +214,9 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if self._test_dataset is None:
             raise ValueError("Test dataset has not been initialized")
-        return DataLoader(
-            self._test_dataset,
-            batch_size=self._batch_size,
-            shuffle=self._shuffle,
-            num_workers=self._num_workers,
-            pin_memory=self._pin_memory,
-            collate_fn=self.get_collate_fn(),
-        )
+        return self._get_loader("test", self._test_dataset)
 
-    def get_pool_loader(self) -> DataLoader:
+    def get_pool_loader(self) -> DataLoader | ResidentDataLoader:
         """Get DataLoader for pool data.
 
         Returns:
@@ -185,14 +224,23 @@ class BaseDataLoader(DataLoader, ABC):
         """
         if self._pool_dataset is None:
             raise ValueError("Pool dataset has not been initialized")
-        return DataLoader(
-            self._pool_dataset,
-            batch_size=self._batch_size,
-            shuffle=self._shuffle,
-            num_workers=self._num_workers,
-            pin_memory=self._pin_memory,
-            collate_fn=self.get_collate_fn(),
-        )
+        return self._get_loader("pool", self._pool_dataset)
+
+    def get_train_dataset(self) -> BaseDataset:
+        """Get the training split without building a loader for it."""
+        return self._train_dataset
+
+    def get_val_dataset(self) -> BaseDataset:
+        """Get the validation split without building a loader for it."""
+        return self._val_dataset
+
+    def get_test_dataset(self) -> BaseDataset:
+        """Get the test split without building a loader for it."""
+        return self._test_dataset
+
+    def get_pool_dataset(self) -> BaseDataset:
+        """Get the pool split without building a loader for it."""
+        return self._pool_dataset
 
     def get_dataset(self) -> BaseDataset:
         """Get the dataset.
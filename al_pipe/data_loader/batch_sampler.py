@@ -0,0 +1,59 @@
+"""Batch sampler yielding whole index slices for datasets with a batched `__getitems__`."""
+
+from collections.abc import Iterator, Sized
+
+import numpy as np
+import torch
+
+from torch.utils.data import Sampler
+
+
+class SliceBatchSampler(Sampler[np.ndarray]):
+    """Yield each batch as one slice of a (shuffled) index array.
+
+    Shuffling is a single ``randperm`` per epoch and every batch is a view into it, so no
+    per-sample Python lists are built. Combined with a dataset implementing
+    ``__getitems__`` an epoch costs one gather per batch. The length of the data source is
+    read at the start of every epoch, so the sampler follows splits that grow or shrink.
+    """
+
+    def __init__(
+        self,
+        data_source: Sized,
+        batch_size: int,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        generator: torch.Generator | None = None,
+    ) -> None:
+        """
+        Initialize the sampler.
+
+        Args:
+            data_source: Sized, the dataset to sample from
+            batch_size: int, the number of indices per batch
+            shuffle: bool, whether to draw a new permutation every epoch
+            drop_last: bool, whether to drop the last batch if it is smaller than batch_size
+            generator: torch.Generator, the generator used for shuffling
+        """
+        super().__init__()
+        self.data_source = data_source
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        n = len(self.data_source)
+        if self.shuffle:
+            indices = torch.randperm(n, generator=self.generator).numpy()
+        else:
+            indices = np.arange(n)
+        stop = n - n % self.batch_size if self.drop_last else n
+        for start in range(0, stop, self.batch_size):
+            yield indices[start : start + self.batch_size]
+
+    def __len__(self) -> int:
+        n = len(self.data_source)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
@@ -4,11 +4,10 @@ from collections.abc import Callable
 
 import torch
 
-from torch.nn import functional as F
-
 from al_pipe.data.dna_dataset import DNADataset
 from al_pipe.data_loader.base_data_loader import BaseDataLoader
 from al_pipe.first_batch.base_first_batch import FirstBatchStrategy
+from al_pipe.util.data import dna_collate_fn
 
 
 class DNADataLoader(BaseDataLoader):
@@ -26,6 +25,9 @@ class DNADataLoader(BaseDataLoader):
         num_workers: int = 0,
         pin_memory: bool = False,
         first_batch_strategy: FirstBatchStrategy | None = None,
+        slice_batches: bool = False,
+        resident_device: str | None = None,
+        persistent_workers: bool = False,
     ) -> None:
         r"""Initialize the DNA data loader.
 
@@ -36,28 +38,33 @@ class DNADataLoader(BaseDataLoader):
             num_workers: Number of subprocesses to use for data loading
             pin_memory: Whether to pin memory in GPU training
             collate_fn: The collate function to use for the data
+            slice_batches: Whether to fetch whole batches through DNADataset.__getitems__
+            resident_device: Device to keep whole splits on as tensors, see ResidentDataLoader
+            persistent_workers: Whether split loaders keep their worker processes until their split changes
         """
-        super().__init__(dataset, batch_size, shuffle, num_workers, pin_memory, first_batch_strategy)
+        super().__init__(
+            dataset,
+            batch_size,
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            shuffle=shuffle,
+            first_batch_strategy=first_batch_strategy,
+            slice_batches=slice_batches,
+            resident_device=resident_device,
+            persistent_workers=persistent_workers,
+        )
         # TODO: move max_length to the constructor of the class and not using it from the dataset
         self._max_length = dataset.max_length
         self.collate_fn = self.get_collate_fn()
 
     def dna_collate_fn(self, batch: list[tuple[torch.Tensor, torch.Tensor]]) -> tuple[torch.Tensor, torch.Tensor]:
         """
-        Collate function for DNA sequences of various lengths.
+        Collate function for DNA sequences of various lengths, see `al_pipe.util.data.dna_collate_fn`.
+
+        Batches are only collated into pinned buffers in the main process, worker processes leave
+        pinning to the DataLoader.
         """
-        inputs = [item[0] for item in batch]
-        labels = torch.stack([item[1] for item in batch])
-
-        processed_inputs = []
-        for tensor in inputs:
-            if tensor.shape[0] < self._max_length:
-                processed_inputs.append(F.pad(tensor, (0, 0, 0, self._max_length - tensor.shape[0]), "constant", 0))
-                # padding = torch.zeros(max_length - tensor.shape[0], *tensor.shape[1:])
-                # processed_inputs.append(torch.cat([tensor, padding], dim=0))
-            else:
-                processed_inputs.append(tensor[: self._max_length])
-        return torch.stack(processed_inputs), labels
+        return dna_collate_fn(batch, self._max_length, pin_memory=self._pin_memory and self._num_workers == 0)
 
     def get_collate_fn(self) -> Callable:
         return self.dna_collate_fn
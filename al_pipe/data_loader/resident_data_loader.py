@@ -0,0 +1,65 @@
+"""Loader iterating over a split whose tensors are kept resident on one device."""
+
+from collections.abc import Iterator
+
+import numpy as np
+import torch
+
+from al_pipe.data.base_dataset import BaseDataset
+
+
+class ResidentDataLoader:
+    """Iterate over batches of a small split held in memory as two tensors.
+
+    Modeled on ``bmdal_reg.data.ParallelDictDataLoader``: the whole split is gathered once
+    through the dataset's ``__getitems__`` and moved to ``device``, each epoch is shuffled
+    with a single ``randperm`` on that device and batches are sliced from the tensors. There
+    is no per-sample Python and no worker process startup, so it can be passed directly to
+    ``Trainer.fit`` in place of a ``torch.utils.data.DataLoader``.
+    """
+
+    def __init__(
+        self,
+        dataset: BaseDataset,
+        batch_size: int,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        device: str | torch.device | None = None,
+    ) -> None:
+        """
+        Initialize the loader.
+
+        Args:
+            dataset: BaseDataset, the split to load, must implement ``__getitems__``
+            batch_size: int, the maximal number of samples per batch
+            shuffle: bool, whether to shuffle the samples before each epoch
+            drop_last: bool, whether to omit the last batch if it is smaller than the other ones
+            device: the device to keep the tensors on (if None, keep them where the dataset has them)
+        """
+        self.dataset = dataset
+        self.inputs, self.labels = dataset.__getitems__(np.arange(len(dataset)))
+        if device is not None:
+            self.inputs = self.inputs.to(device)
+            self.labels = self.labels.to(device)
+        self.n_samples = len(self.inputs)
+        self.batch_size = max(1, min(batch_size, self.n_samples))
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        stop = self.n_samples - self.n_samples % self.batch_size if drop_last else self.n_samples
+        self.sep_idxs = [*range(0, stop, self.batch_size), stop]
+
+    def __len__(self) -> int:
+        """Return the number of batches per epoch."""
+        return len(self.sep_idxs) - 1
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        """Iterate over the (inputs, labels) batches of one epoch."""
+        if self.shuffle:
+            perm = torch.randperm(self.n_samples, device=self.inputs.device)
+            for start, stop in zip(self.sep_idxs[:-1], self.sep_idxs[1:], strict=True):
+                idxs = perm[start:stop]
+                yield self.inputs[idxs], self.labels[idxs]
+        else:
+            for start, stop in zip(self.sep_idxs[:-1], self.sep_idxs[1:], strict=True):
+                yield self.inputs[start:stop], self.labels[start:stop]
@@ -2,6 +2,7 @@
 
 from abc import ABC, abstractmethod
 
+import numpy as np
 import pandas as pd
 import torch
 
@@ -19,15 +20,35 @@ class BaseStaticEmbedder(ABC):
 
     @staticmethod
     @abstractmethod
-    def embed_any_sequences(sequences: pd.Series) -> list[torch.Tensor]:
+    def embed_any_sequences(sequences: pd.Series, max_length: int = 100) -> torch.Tensor:
         """
         Given a pd.Series of DNA sequences, return their embedding representations.
 
         Args:
             sequences (pd.Series): pd.Series containing DNA sequences to embed
+            max_length (int): Length that the sequences are padded or truncated to
 
         Returns:
-            list[torch.Tensor]: List of torch tensors containing embedded representations
+            torch.Tensor: Tensor of shape [N, ...] stacking the embedded representations
                 of the input DNA sequences
         """
         raise NotImplementedError()
+
+    def embed_codes(self, codes: np.ndarray, max_length: int = 100) -> torch.Tensor:
+        """
+        Embed sequences given as nucleotide byte codes, e.g. from a binary dataset file.
+
+        The default implementation decodes the codes back into strings and calls
+        embed_any_sequences, embedders that work on codes directly should override it.
+
+        Args:
+            codes (np.ndarray): uint8 codes of shape [N, L], see al_pipe.util.general.encode_dna_batch
+            max_length (int): Length that the sequences are padded or truncated to
+
+        Returns:
+            torch.Tensor: Tensor of shape [N, ...] stacking the embedded representations
+        """
+        # TODO: fix circular import
+        from al_pipe.util.general import decode_dna_codes
+
+        return self.embed_any_sequences(pd.Series(decode_dna_codes(codes)), max_length=max_length)
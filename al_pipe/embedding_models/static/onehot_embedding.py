@@ -1,8 +1,8 @@
 """Onehot encoding class for data embedding."""
 
+import numpy as np
 import pandas as pd
 import torch
-import torch.nn.functional as F
 
 from al_pipe.embedding_models.static.base_static_embedder import BaseStaticEmbedder
 
@@ -24,45 +24,45 @@ class OneHotEmbedder(BaseStaticEmbedder):
         super().__init__(device)
 
     @staticmethod
-    def embed_any_sequences(sequences: pd.Series) -> list[torch.Tensor]:
+    def embed_any_sequences(sequences: pd.Series, max_length: int = 100) -> torch.Tensor:
         """
         Generate one-hot encoded embeddings for any input DNA sequences.
 
+        The whole series is encoded in one vectorized pass into a single preallocated tensor,
+        see `al_pipe.util.general.onehot_encode_dna_batch`.
+
         Args:
             sequences (pd.Series): A pandas Series containing DNA sequences to be encoded.
+            max_length (int): Sequences are zero-padded or truncated to this length.
 
         Returns:
-            list[torch.Tensor]: A list of tensors containing one-hot encoded tensors for each DNA sequence.
-                      Each tensor has shape (sequence_length, 4) where 4 represents the four
-                      possible nucleotides (A,C,G,T).
+            torch.Tensor: A tensor of shape (n_valid_sequences, max_length, 4) where 4 represents the four
+                      possible nucleotides (A,C,G,T). Sequences with invalid characters are skipped.
         """
         # TODO: fix circular import
-        from al_pipe.util.general import onehot_encode_dna
-
-        ## 1) Find the maximum sequence length
-        #    (fall back to 0 if there are no sequences)
-        # seq_lens = sequences.str.len().tolist()
-        # TODO: set max_len outside of this function
-        max_len = 100
-        # max_len = max(seq_lens) if seq_lens else 0
-
-        embeddings: list[torch.Tensor] = []
-        for seq in sequences:
-            encoded = onehot_encode_dna(seq)
-            if encoded is None:
-                continue
-
-            L = encoded.size(0)
-            if L < max_len:
-                # pad along dim=0 (the sequence dimension) on the "bottom"
-                # pad format is (pad_last_dim_left, pad_last_dim_right,
-                #                pad_second_last_dim_left, pad_second_last_dim_right, ...)
-                encoded = F.pad(encoded, (0, 0, 0, max_len - L), mode="constant", value=0)
-                print(f"padded {encoded.shape}")
-            else:
-                # truncate if longer than max_len
-                encoded = encoded[:max_len]
-
-            embeddings.append(encoded)
+        from al_pipe.util.general import onehot_encode_dna_batch
 
+        embeddings, valid = onehot_encode_dna_batch(sequences, max_length=max_length)
+        if not valid.all():
+            embeddings = embeddings[torch.from_numpy(valid)]
         return embeddings
+
+    @staticmethod
+    def embed_codes(codes: np.ndarray, max_length: int = 100) -> torch.Tensor:
+        """
+        Generate one-hot encoded embeddings directly from nucleotide byte codes.
+
+        Args:
+            codes (np.ndarray): uint8 codes of shape [N, L], e.g. a batch of a memory-mapped binary dataset.
+            max_length (int): Codes are padded or truncated to this length.
+
+        Returns:
+            torch.Tensor: A tensor of shape (N, max_length, 4).
+        """
+        # TODO: fix circular import
+        from al_pipe.util.general import PAD_CODE, onehot_from_codes
+
+        codes = np.asarray(codes[:, :max_length], dtype=np.uint8)
+        if codes.shape[1] < max_length:
+            codes = np.pad(codes, ((0, 0), (0, max_length - codes.shape[1])), constant_values=PAD_CODE)
+        return onehot_from_codes(codes)
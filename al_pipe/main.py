@@ -76,6 +76,7 @@ def main(cfg: DictConfig) -> None:
         train_val_test_pool_split=cfg.datasets.train_val_test_pool_split,
         max_length=cfg.datasets.MAX_LENGTH,
         embedding_model=embedding_model,
+        chunksize=cfg.datasets.chunksize,
     )
 
     full_data_loader = DNADataLoader(
@@ -84,6 +85,9 @@ def main(cfg: DictConfig) -> None:
         num_workers=cfg.datasets.num_workers,
         pin_memory=cfg.datasets.pin_memory,
         shuffle=cfg.datasets.shuffle,
+        slice_batches=cfg.datasets.slice_batches,
+        resident_device=cfg.datasets.resident_device,
+        persistent_workers=cfg.datasets.persistent_workers,
         first_batch_strategy=hydra.utils.instantiate(cfg.first_batch.init),
     )
 
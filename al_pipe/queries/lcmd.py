@@ -1,5 +1,7 @@
 """Simple query strategy."""
 
+import numpy as np
+import pandas as pd
 import torch
 
 from al_pipe.bmdal_reg.bmdal.algorithms import select_batch
@@ -11,16 +13,44 @@ from al_pipe.util.general import flat_list_tensor
 
 class LCMDQueryStrategy(BaseQueryStrategy):
     """
-    Random query strategy for active learning.
+    LCMD query strategy for active learning.
 
-    This strategy randomly selects samples from the unlabeled pool for labeling.
+    This strategy selects samples from the unlabeled pool with the LCMD method of bmdal_reg
+    on sketched gradient features of the regressor.
+
+    With ``incremental=True`` the strategy keeps the sketched features of the train and pool
+    rows and the LCMD state of the pool (``min_sq_dists`` and ``closest_idxs``) between rounds,
+    keyed by global row id. As long as the parameters of the regressor changed by at most
+    ``model_tolerance`` (relative to their norm) since the features were computed, the next
+    round reuses both and only folds the newly labeled rows into the state, instead of
+    recomputing all features and adding every training point again.
+
+    Once the regressor changed more, e.g. because it was retrained, the features are recomputed,
+    but the state is still carried over: the pool rows keep their assignment to the centers
+    (``closest_idxs``), only their distances to these centers are recomputed, and again only the
+    newly labeled rows are added. A center that became closer than the assigned one is not
+    detected, so the distances can be overestimated. With the default ``model_tolerance=0.0``
+    the features are never reused, as the pipeline retrains the regressor before every query.
 
     Attributes:
         selection_size (int): Number of samples to select in each query.
+        incremental (bool): Whether to carry the selection state across rounds.
+        model_tolerance (float): Maximal relative parameter change for which features are reused,
+            0.0 disables reusing the features.
     """
 
-    def __init__(self, selection_size: int) -> None:
+    def __init__(self, selection_size: int, incremental: bool = False, model_tolerance: float = 0.0) -> None:
         super().__init__(selection_size)
+        self.incremental = incremental
+        self.model_tolerance = model_tolerance
+        # sketched features of the rows in _feature_rows and the parameters they were computed with
+        self._features: torch.Tensor | None = None
+        self._feature_rows: pd.Index | None = None
+        self._params: torch.Tensor | None = None
+        # LCMD state of the pool rows in _state_rows and the row ids of all centers it contains
+        self._state: dict | None = None
+        self._state_rows: pd.Index | None = None
+        self._center_rows: np.ndarray | None = None
 
     # TODO: add status tracker later
     def select_samples(self, regressor: torch.nn.Module, full_data_loader: BaseDataLoader) -> None:
@@ -28,24 +58,120 @@ class LCMDQueryStrategy(BaseQueryStrategy):
         Select samples from the unlabeled pool for labeling.
 
         Args:
-            pool_loader: Pool of unlabeled samples to select from.
-
-        Returns:
-            List of indices of selected samples from unlabeled pool.
+            regressor: The trained model whose gradient features are used.
+            full_data_loader: The data loader holding the train and pool datasets.
         """
         # TODO: check if the new indices is from the pool dataset
         # TODO: data is of varying length fix to same length by trimming (should we consistently fix to same length?)
-        new_idxs, _ = select_batch(
+        train_dataset = full_data_loader.get_train_dataset()
+        pool_dataset = full_data_loader.get_pool_dataset()
+        train_rows, pool_rows = train_dataset.row_ids, pool_dataset.row_ids
+        if self.incremental and self._can_reuse(regressor, train_rows, pool_rows):
+            new_idxs = self._select_incremental(regressor, train_rows, pool_rows)
+        else:
+            init_state = None
+            train_order = np.arange(len(train_rows))
+            if self.incremental and self._state_covers(train_rows, pool_rows):
+                # keep the cluster assignment of the pool, the centers go first in the order they were added
+                train_rows = self._order_train_rows(train_rows)
+                train_order = pd.Index(train_dataset.row_ids).get_indexer(train_rows)
+                init_state = {
+                    "min_sq_dists": None,
+                    "closest_idxs": self._state["closest_idxs"][self._state_idxs(pool_rows)],
+                    "n_clusters": self._state["n_clusters"],
+                    "n_train": len(self._center_rows),
+                }
+            new_idxs, results = select_batch(
+                batch_size=self.selection_size,
+                models=[regressor],
+                data={
+                    "train": TensorFeatureData(flat_list_tensor(train_dataset.embedded_data[train_order])),
+                    "pool": TensorFeatureData(flat_list_tensor(pool_dataset.embedded_data)),
+                },
+                y_train=train_dataset.get_labels()[train_order],
+                selection_method="lcmd",
+                sel_with_train=True,
+                base_kernel="grad",
+                kernel_transforms=[("rp", [512])],
+                lcmd_init_state=init_state,
+                return_selection_state=self.incremental,
+                return_features=self.incremental,
+            )
+            if self.incremental:
+                features = results["features"]
+                self._features = torch.cat(
+                    [features["train"].get_feature_matrix(), features["pool"].get_feature_matrix()], dim=0
+                )
+                self._feature_rows = pd.Index(np.concatenate([train_rows, pool_rows]))
+                self._params = _flat_params(regressor)
+                self._store_state(results["selection_state"], train_rows, pool_rows, new_idxs)
+        full_data_loader.update_train_pool_dataset(new_idxs)
+
+    def _state_covers(self, train_rows: np.ndarray, pool_rows: np.ndarray) -> bool:
+        """Whether the stored state covers the current pool rows and all of its centers are train rows."""
+        return (
+            self._state is not None
+            and bool((self._state_rows.get_indexer(pool_rows) >= 0).all())
+            and bool(np.isin(self._center_rows, train_rows).all())
+        )
+
+    def _state_idxs(self, pool_rows: np.ndarray) -> torch.Tensor:
+        """Positions of the given pool rows in the stored state."""
+        return torch.as_tensor(self._state_rows.get_indexer(pool_rows), device=self._state["closest_idxs"].device)
+
+    def _order_train_rows(self, train_rows: np.ndarray) -> np.ndarray:
+        """Put the centers of the stored state first, in the order in which they were added."""
+        return np.concatenate([self._center_rows, train_rows[~np.isin(train_rows, self._center_rows)]])
+
+    def _can_reuse(self, regressor: torch.nn.Module, train_rows: np.ndarray, pool_rows: np.ndarray) -> bool:
+        """Whether the cached features and state cover the current rows and the model is close enough."""
+        if self._features is None or not self._state_covers(train_rows, pool_rows):
+            return False
+        if (self._feature_rows.get_indexer(train_rows) < 0).any():
+            return False
+        params = _flat_params(regressor)
+        if params.shape != self._params.shape:
+            return False
+        change = torch.linalg.norm(params - self._params) / torch.linalg.norm(self._params).clamp_min(1e-30)
+        return change.item() <= self.model_tolerance
+
+    def _select_incremental(
+        self, regressor: torch.nn.Module, train_rows: np.ndarray, pool_rows: np.ndarray
+    ) -> torch.Tensor:
+        """Continue the LCMD selection from the stored state on the cached features."""
+        # rows that are already centers of the state go first, only the remaining ones are added
+        train_rows = self._order_train_rows(train_rows)
+        state_idxs = self._state_idxs(pool_rows)
+        init_state = {
+            "min_sq_dists": self._state["min_sq_dists"][state_idxs],
+            "closest_idxs": self._state["closest_idxs"][state_idxs],
+            "n_clusters": self._state["n_clusters"],
+            "n_train": len(self._center_rows),
+        }
+        train_features = self._features[torch.as_tensor(self._feature_rows.get_indexer(train_rows))]
+        pool_features = self._features[torch.as_tensor(self._feature_rows.get_indexer(pool_rows))]
+        new_idxs, results = select_batch(
             batch_size=self.selection_size,
             models=[regressor],
-            data={
-                "train": TensorFeatureData(flat_list_tensor(full_data_loader.get_train_loader().dataset.embedded_data)),
-                "pool": TensorFeatureData(flat_list_tensor(full_data_loader.get_pool_loader().dataset.embedded_data)),
-            },
-            y_train=full_data_loader.get_train_loader().dataset.get_labels(),
+            data={"train": TensorFeatureData(train_features), "pool": TensorFeatureData(pool_features)},
+            y_train=None,
             selection_method="lcmd",
             sel_with_train=True,
-            base_kernel="grad",
-            kernel_transforms=[("rp", [512])],
+            base_kernel="linear",
+            kernel_transforms=[],
+            lcmd_init_state=init_state,
+            return_selection_state=True,
         )
-        full_data_loader.update_train_pool_dataset(new_idxs)
+        self._store_state(results["selection_state"], train_rows, pool_rows, new_idxs)
+        return new_idxs
+
+    def _store_state(self, state: dict, train_rows: np.ndarray, pool_rows: np.ndarray, new_idxs: torch.Tensor) -> None:
+        """Keep the LCMD state of the pool, whose centers are the train rows and the selected rows."""
+        self._state = state
+        self._state_rows = pd.Index(pool_rows)
+        self._center_rows = np.concatenate([train_rows, pool_rows[new_idxs.cpu().numpy()]])
+
+
+def _flat_params(model: torch.nn.Module) -> torch.Tensor:
+    """Return a detached copy of all parameters of the model as one flat tensor."""
+    return torch.cat([p.detach().flatten() for p in model.parameters()]).clone()
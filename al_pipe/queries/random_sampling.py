@@ -33,7 +33,7 @@ class RandomQueryStrategy(BaseQueryStrategy):
             List of indices of selected samples from unlabeled pool.
         """
         try:
-            selected_indices = random.sample(range(len(full_data_loader.get_pool_loader())), self.selection_size)
+            selected_indices = random.sample(range(len(full_data_loader.get_pool_dataset())), self.selection_size)
             # update the pool loader
             full_data_loader.update_train_pool_dataset(selected_indices)
         except ValueError:
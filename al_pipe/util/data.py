@@ -11,40 +11,238 @@ Test the function on a small sample
 
 """  # noqa: D205
 
+import json
 import os
 
+from collections.abc import Iterable, Iterator
+
+import numpy as np
 import pandas as pd
 import torch
-import torch.nn.functional as F
+
+from al_pipe.util.general import decode_dna_codes, encode_dna_batch
+
+# Binary dataset format: an 8 byte magic, a JSON header padded to BINARY_HEADER_SIZE bytes,
+# the uint8 nucleotide codes [n_rows, max_length] (see encode_dna_batch) and the float32 values [n_rows].
+BINARY_SUFFIX = ".dnabin"
+BINARY_MAGIC = b"ALPDNA01"
+BINARY_HEADER_SIZE = 4096
+BINARY_ALIGNMENT = 64
 
 
-def load_data(data_path: str) -> pd.DataFrame:
+def load_data(
+    data_path: str, chunksize: int | None = None, max_length: int | None = None
+) -> pd.DataFrame | tuple[np.memmap, np.memmap]:
     # load data from path
     """
     Load data from the given file path.
 
     Parameters:
     - data_path: str, the path to the data file (e.g., CSV)
+    - chunksize: int, if given, stream the CSV in chunks of this many rows instead of parsing it at once.
+      Each chunk is validated and encoded immediately into a binary cache next to the CSV
+      (see convert_csv_to_binary), so peak memory is bounded by the chunk size. The cache is
+      reused as long as it is newer than the CSV and has the requested max_length.
+    - max_length: int, only used in streaming mode, see convert_csv_to_binary
 
     Returns:
-    - pd.DataFrame containing the loaded data.
+    - pd.DataFrame containing the loaded data, or in streaming mode the
+      (codes, values) memory maps returned by load_binary_data.
     TODO: could support different file type
     """
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"File not found: {data_path}")
-
-    if data_path.lower().endswith(".csv"):
-        # default separator here is \t
-        data = pd.read_csv(data_path, sep="\t")
-        if data.shape[1] < 2:
-            raise ValueError("CSV file must contain at least two columns.")
-        data.columns = ["sequences", "values"]
-    else:
+    if not data_path.lower().endswith(".csv"):
         raise ValueError("Unsupported file type. Only CSV are supported.")
 
+    if chunksize is not None:
+        binary_path = os.path.splitext(data_path)[0] + BINARY_SUFFIX
+        if os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(data_path):
+            codes, values = load_binary_data(binary_path)
+            if max_length is None or codes.shape[1] == max_length:
+                return codes, values
+        convert_csv_to_binary(data_path, binary_path, max_length=max_length, chunksize=chunksize)
+        return load_binary_data(binary_path)
+
+    # default separator here is \t
+    data = pd.read_csv(data_path, sep="\t")
+    if data.shape[1] < 2:
+        raise ValueError("CSV file must contain at least two columns.")
+    data.columns = ["sequences", "values"]
+
     return data
 
 
+def _read_csv_chunks(csv_path: str, chunksize: int, usecols: list[int] | None = None) -> Iterator[pd.DataFrame]:
+    """Read a tab-separated CSV dataset in chunks of rows."""
+    for chunk in pd.read_csv(csv_path, sep="\t", chunksize=chunksize, usecols=usecols):
+        if usecols is None and chunk.shape[1] < 2:
+            raise ValueError("CSV file must contain at least two columns.")
+        yield chunk
+
+
+def create_binary_data(binary_path: str, n_rows: int, max_length: int) -> tuple[np.memmap, np.memmap]:
+    """
+    Create an empty binary dataset file and return writable memory maps of its arrays.
+
+    Parameters:
+    - binary_path: str, the path of the file to create (overwritten if it exists)
+    - n_rows: int, the number of sequences
+    - max_length: int, the fixed width of the stored sequences
+
+    Returns:
+    - tuple of the uint8 codes memmap [n_rows, max_length] and the float32 values memmap [n_rows].
+    """
+    codes_offset = BINARY_HEADER_SIZE
+    values_offset = -(-(codes_offset + n_rows * max_length) // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+    header = json.dumps(
+        {
+            "n_rows": n_rows,
+            "max_length": max_length,
+            "codes_offset": codes_offset,
+            "values_offset": values_offset,
+        }
+    ).encode()
+    if len(BINARY_MAGIC) + len(header) > BINARY_HEADER_SIZE:
+        raise ValueError("Binary dataset header is too large.")
+
+    with open(binary_path, "wb") as f:
+        f.write(BINARY_MAGIC + header.ljust(BINARY_HEADER_SIZE - len(BINARY_MAGIC)))
+        f.truncate(values_offset + n_rows * np.dtype(np.float32).itemsize)
+
+    codes = np.memmap(binary_path, dtype=np.uint8, mode="r+", offset=codes_offset, shape=(n_rows, max_length))
+    values = np.memmap(binary_path, dtype=np.float32, mode="r+", offset=values_offset, shape=(n_rows,))
+    return codes, values
+
+
+def convert_csv_to_binary(
+    csv_path: str, binary_path: str | None = None, max_length: int | None = None, chunksize: int = 1_000_000
+) -> str:
+    """
+    Convert a tab-separated CSV dataset into the binary dataset format.
+
+    The CSV is streamed twice in chunks, once to count the rows (and find the longest sequence
+    if max_length is not given) and once to encode each chunk straight into the preallocated
+    memory-mapped output, so the full string column is never held in memory. The file is
+    written under a temporary name and renamed when complete.
+
+    Parameters:
+    - csv_path: str, the path to the CSV file
+    - binary_path: str, the output path, defaults to csv_path with the BINARY_SUFFIX extension
+    - max_length: int, sequences are padded or truncated to this width,
+      defaults to the length of the longest sequence
+    - chunksize: int, the number of rows read and encoded at a time
+
+    Returns:
+    - str, the path of the written binary file.
+    """
+    if binary_path is None:
+        binary_path = os.path.splitext(csv_path)[0] + BINARY_SUFFIX
+
+    n_rows, longest = 0, 0
+    for chunk in _read_csv_chunks(csv_path, chunksize, usecols=[0]):
+        n_rows += len(chunk)
+        if max_length is None and len(chunk):
+            longest = max(longest, int(chunk.iloc[:, 0].str.len().max()))
+    if max_length is None:
+        max_length = longest
+
+    tmp_path = f"{binary_path}.{os.getpid()}.tmp"
+    try:
+        out_codes, out_values = create_binary_data(tmp_path, n_rows, max_length)
+        start = 0
+        for chunk in _read_csv_chunks(csv_path, chunksize):
+            end = start + len(chunk)
+            codes, valid = encode_dna_batch(chunk.iloc[:, 0], max_length)
+            if not valid.all():
+                raise ValueError(
+                    f"Sequence in row {start + int(np.argmin(valid))} contains characters other than A, C, G, T and N."
+                )
+            out_codes[start:end] = codes
+            out_values[start:end] = chunk.iloc[:, 1].to_numpy(dtype=np.float32)
+            start = end
+        out_codes.flush()
+        out_values.flush()
+        del out_codes, out_values
+        os.replace(tmp_path, binary_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return binary_path
+
+
+def load_binary_data(binary_path: str) -> tuple[np.memmap, np.memmap]:
+    """
+    Memory-map a binary dataset file written by convert_csv_to_binary.
+
+    Parameters:
+    - binary_path: str, the path to the binary file
+
+    Returns:
+    - tuple of the read-only uint8 codes memmap [n_rows, max_length] and float32 values memmap [n_rows].
+    """
+    if not os.path.exists(binary_path):
+        raise FileNotFoundError(f"File not found: {binary_path}")
+
+    with open(binary_path, "rb") as f:
+        raw_header = f.read(BINARY_HEADER_SIZE)
+    if not raw_header.startswith(BINARY_MAGIC):
+        raise ValueError(f"Not a binary dataset file: {binary_path}")
+    header = json.loads(raw_header[len(BINARY_MAGIC) :])
+
+    n_rows, max_length = header["n_rows"], header["max_length"]
+    codes = np.memmap(binary_path, dtype=np.uint8, mode="r", offset=header["codes_offset"], shape=(n_rows, max_length))
+    values = np.memmap(binary_path, dtype=np.float32, mode="r", offset=header["values_offset"], shape=(n_rows,))
+    return codes, values
+
+
+class CodedSequences:
+    """Read-only view of nucleotide codes that decodes sequences to strings only when indexed."""
+
+    def __init__(self, codes: np.ndarray) -> None:
+        self.codes = codes
+
+    def __getitem__(self, index: int | slice | np.ndarray) -> str | np.ndarray:
+        codes = self.codes[index]
+        if codes.ndim == 1:
+            return decode_dna_codes(codes[None])[0]
+        return decode_dna_codes(codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def keep_mask(indices: np.ndarray | torch.Tensor | Iterable[int], n: int) -> np.ndarray:
+    """
+    Build the boolean mask of the rows that survive deleting ``indices``.
+
+    Parameters:
+    - indices: positions to delete, given as a boolean mask of length n, or as a tensor,
+      array, list or set of integer positions (duplicates are allowed)
+    - n: int, the number of rows
+
+    Returns:
+    - np.ndarray of dtype bool and length n, False at the deleted positions.
+    """
+    if isinstance(indices, torch.Tensor):
+        indices = indices.detach().cpu().numpy()
+    elif not isinstance(indices, np.ndarray):
+        # lists may hold 0-d tensors, e.g. the output of a query strategy
+        indices = np.asarray([i.item() if isinstance(i, torch.Tensor) else i for i in indices])
+        if indices.size == 0:
+            indices = indices.astype(np.int64)
+
+    if indices.dtype == np.bool_:
+        if indices.shape != (n,):
+            raise ValueError(f"Boolean mask has shape {indices.shape}, expected ({n},).")
+        return ~indices
+
+    mask = np.ones(n, dtype=bool)
+    mask[indices.reshape(-1).astype(np.int64, copy=False)] = False
+    return mask
+
+
 # def dna_collate_fn(batch: list[tuple[torch.Tensor, torch.Tensor]]) -> tuple[torch.Tensor, torch.Tensor]:
 #     """
 #     Collate function for DNA sequences of various lengths.
@@ -55,20 +253,44 @@ def load_data(data_path: str) -> pd.DataFrame:
 
 
 def dna_collate_fn(
-    batch: list[tuple[torch.Tensor, torch.Tensor]], max_length: int
+    batch: list[tuple[torch.Tensor, torch.Tensor]], max_length: int, pin_memory: bool = False
 ) -> tuple[torch.Tensor, torch.Tensor]:
     """
     Collate function for DNA sequences of various lengths.
+
+    Every sample is written straight into one preallocated [B, max_length, ...] buffer, padded
+    with zeros or truncated to max_length. When all samples already have max_length rows the
+    buffer is filled by a single stack without any padding.
+
+    Parameters:
+    - batch: list of (input, label) pairs, inputs of shape [L_i, ...], or an (inputs, labels)
+      tuple that was already collated by a dataset's __getitems__
+    - max_length: int, the length inputs are padded or truncated to
+    - pin_memory: bool, allocate the output buffers in pinned memory (only if CUDA is available)
+
+    Returns:
+    - tuple of the inputs [B, max_length, ...] and the labels [B, ...].
     """
-    inputs = [item[0] for item in batch]
-    labels = torch.stack([item[1] for item in batch])
-
-    processed_inputs = []
-    for tensor in inputs:
-        if tensor.shape[0] < max_length:
-            processed_inputs.append(F.pad(tensor, (0, 0, 0, max_length - tensor.shape[0]), "constant", 0))
-            # padding = torch.zeros(max_length - tensor.shape[0], *tensor.shape[1:])
-            # processed_inputs.append(torch.cat([tensor, padding], dim=0))
-        else:
-            processed_inputs.append(tensor[:max_length])
-    return torch.stack(processed_inputs), labels
+    if isinstance(batch, tuple):
+        # already collated by the dataset's __getitems__, only the length may need adjusting
+        inputs, labels = batch
+        if inputs.shape[1] == max_length:
+            return inputs, labels
+        batch = list(zip(inputs, labels, strict=True))
+
+    inputs, labels = zip(*batch, strict=True)
+    pin_memory = pin_memory and torch.cuda.is_available()
+
+    first = inputs[0]
+    out_inputs = torch.empty((len(inputs), max_length, *first.shape[1:]), dtype=first.dtype, pin_memory=pin_memory)
+    if all(tensor.shape[0] == max_length for tensor in inputs):
+        torch.stack(inputs, out=out_inputs)
+    else:
+        out_inputs.zero_()
+        for out, tensor in zip(out_inputs, inputs, strict=True):
+            length = min(tensor.shape[0], max_length)
+            out[:length] = tensor[:length]
+
+    out_labels = torch.empty((len(labels), *labels[0].shape), dtype=labels[0].dtype, pin_memory=pin_memory)
+    torch.stack(labels, out=out_labels)
+    return out_inputs, out_labels
@@ -3,16 +3,51 @@
 import random
 import sys
 
+from collections.abc import Sequence
+
 import numpy as np
+import pandas as pd
 import torch
-import torch.nn.functional as F
 
 # TODO: think whether setting N to 0 is a good idea
 SEQUENCE_CODE = {"A": 0, "T": 1, "C": 2, "G": 3, "N": 0}
 
+# Byte codes produced by the batch encoder. 0-3 follow SEQUENCE_CODE, N and padding are kept apart so that
+# sequences can be decoded again, but both map to an all-zero one-hot row.
+N_CODE = 4
+PAD_CODE = 5
+INVALID_CODE = 255
+
+
+def _build_dna_lookup_table() -> np.ndarray:
+    """Build the 256-entry ASCII byte -> nucleotide code lookup table."""
+    table = np.full(256, INVALID_CODE, dtype=np.uint8)
+    for base in "ATCG":
+        table[ord(base)] = SEQUENCE_CODE[base]
+    table[ord("N")] = N_CODE
+    # numpy pads fixed-width byte strings with NUL bytes, NUL characters within a sequence are marked invalid
+    # by encode_dna_batch
+    table[0] = PAD_CODE
+    return table
+
+
+DNA_LOOKUP_TABLE = _build_dna_lookup_table()
 
-def flat_list_tensor(t_list: list[torch.Tensor]) -> torch.Tensor:
-    """Flatten a list of tensors into a single tensor."""
+# one row per byte code, only the codes of A, T, C and G are non-zero
+ONEHOT_CODE_TABLE = np.zeros((256, len(SEQUENCE_CODE) - 1), dtype=np.uint8)
+ONEHOT_CODE_TABLE[np.arange(4), np.arange(4)] = 1
+
+# inverse of DNA_LOOKUP_TABLE, padding decodes to the NUL byte that numpy strips from fixed-width strings
+DNA_DECODE_TABLE = np.zeros(256, dtype=np.uint8)
+for _base in "ATCG":
+    DNA_DECODE_TABLE[SEQUENCE_CODE[_base]] = ord(_base)
+DNA_DECODE_TABLE[N_CODE] = ord("N")
+
+
+def flat_list_tensor(t_list: list[torch.Tensor] | torch.Tensor) -> torch.Tensor:
+    """Flatten a list of tensors (or a stacked tensor) into a single [N, -1] tensor."""
+    if isinstance(t_list, torch.Tensor):
+        return t_list.reshape(len(t_list), -1)
     return torch.stack(t_list).view(len(t_list), -1)
 
 
@@ -89,32 +124,125 @@ def validate_dna(seq: str) -> None:
         raise ValueError(f"Invalid characters in DNA sequence: {invalid}")
 
 
-def onehot_encode_dna(seq: str) -> torch.Tensor:
-    """Given DNA sequence input covert it to onehot encoded form."""
+def encode_dna_batch(
+    sequences: pd.Series | Sequence[str], max_length: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert DNA sequences into a fixed-width array of nucleotide byte codes.
+
+    All sequences are copied into one fixed-width byte array of width max_length and mapped through
+    DNA_LOOKUP_TABLE in a single vectorized pass. Sequences shorter than max_length are padded with PAD_CODE,
+    longer ones are truncated before they are copied, so a single long sequence does not widen the array.
+    Only the uppercase characters A, C, G, T and N are valid.
+
+    Args:
+        sequences (pd.Series | Sequence[str]): The DNA sequences to encode.
+        max_length (int | None): Width of the output. Defaults to the length of the longest sequence.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: uint8 codes of shape [N, max_length] and a boolean mask of shape [N]
+            that is False for sequences containing characters other than A, C, G, T and N.
+    """
+    values = sequences.to_numpy() if isinstance(sequences, pd.Series) else sequences
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    if max_length is None:
+        max_length = int(lengths.max(initial=0))
+    codes, valid = _encode_fixed_width(values, lengths, max_length)
+
+    # validate the truncated part of the (usually few) longer sequences as well
+    long_rows = np.flatnonzero(lengths > max_length)
+    if len(long_rows) > 0:
+        tails = [values[i][max_length:] for i in long_rows]
+        _, tails_valid = _encode_fixed_width(tails, lengths[long_rows] - max_length, int(lengths.max()) - max_length)
+        valid[long_rows] &= tails_valid
+    return codes, valid
+
+
+def _encode_fixed_width(values: Sequence[str], lengths: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """Map the first width characters of each sequence to byte codes, see encode_dna_batch."""
+    # fixed-width byte strings truncate longer sequences on conversion and pad shorter ones with NUL bytes
+    itemsize = max(width, 1)
     try:
-        validate_dna(seq)
-    except ValueError:
-        return None
-    # Convert the string into a NumPy array
-    arr = np.array(list(seq))
+        raw = np.asarray(values, dtype=f"S{itemsize}")
+    except UnicodeEncodeError:
+        # non-ASCII characters are replaced by "?", which the lookup table marks as invalid
+        raw = np.asarray([seq.encode("ascii", errors="replace") for seq in values], dtype=f"S{itemsize}")
+    codes = DNA_LOOKUP_TABLE[raw.reshape(-1).view(np.uint8).reshape(len(lengths), itemsize)[:, :width]]
+    # a NUL byte within the sequence maps to PAD_CODE, but only the trailing NUL bytes are padding
+    in_sequence = np.arange(width) < lengths[:, None]
+    valid = ~((codes == INVALID_CODE) | ((codes == PAD_CODE) & in_sequence)).any(axis=1)
+    return np.ascontiguousarray(codes), valid
+
+
+def decode_dna_codes(codes: np.ndarray) -> np.ndarray:
+    """
+    Convert nucleotide byte codes back into DNA strings, the inverse of encode_dna_batch.
+
+    Args:
+        codes (np.ndarray): uint8 codes of shape [N, L].
+
+    Returns:
+        np.ndarray: Array of N strings with the padding removed.
+    """
+    codes = np.asarray(codes, dtype=np.uint8)
+    if codes.shape[1] == 0:
+        return np.full(len(codes), "", dtype=str)
+    raw = np.ascontiguousarray(DNA_DECODE_TABLE[codes]).view(f"S{codes.shape[1]}").reshape(len(codes))
+    return raw.astype(str)
 
-    # masked_N scores indices where N occurs
-    mask_N = arr == "N"
 
-    # Use vectorized indexing to map each character to its corresponding index.
-    vectorized_indices = np.vectorize(SEQUENCE_CODE.get)
-    indices = vectorized_indices(arr)
+def onehot_from_codes(
+    codes: np.ndarray, dtype: torch.dtype = torch.float32, out: torch.Tensor | None = None
+) -> torch.Tensor:
+    """
+    Expand nucleotide byte codes into one-hot vectors with a single table gather.
 
-    # Create the one-hot encoding matrix by indexing into an identity matrix.
-    one_hot = F.one_hot(
-        torch.tensor(indices, dtype=torch.long), num_classes=len(SEQUENCE_CODE) - 1
-    ).float()  # num_classses - 1 to account for N in the sequence
+    Args:
+        codes (np.ndarray): uint8 codes of shape [N, L] as returned by encode_dna_batch.
+        dtype (torch.dtype): dtype of the returned tensor, e.g. torch.uint8 or torch.float32.
+        out (torch.Tensor | None): Optional preallocated CPU tensor of shape [N, L, 4] to write into.
 
-    # Zero out rows corresponding to 'N'.
-    mask_N_tensor = torch.tensor(mask_N, dtype=torch.bool)
-    one_hot[mask_N_tensor] = 0
+    Returns:
+        torch.Tensor: One-hot tensor of shape [N, L, 4]. Rows of N and padding positions are all zero.
+    """
+    if out is None:
+        out = torch.empty((*codes.shape, ONEHOT_CODE_TABLE.shape[1]), dtype=dtype)
+    out_np = out.numpy()
+    # codes always lie in [0, 255], so mode="clip" only serves to avoid np.take's buffered "raise" mode
+    np.take(ONEHOT_CODE_TABLE.astype(out_np.dtype, copy=False), codes, axis=0, out=out_np, mode="clip")
+    return out
+
+
+def onehot_encode_dna_batch(
+    sequences: pd.Series | Sequence[str],
+    max_length: int | None = None,
+    dtype: torch.dtype = torch.float32,
+    out: torch.Tensor | None = None,
+) -> tuple[torch.Tensor, np.ndarray]:
+    """
+    One-hot encode a whole batch of DNA sequences into one preallocated [N, max_length, 4] tensor.
 
-    return one_hot
+    Args:
+        sequences (pd.Series | Sequence[str]): The DNA sequences to encode.
+        max_length (int | None): Sequences are padded or truncated to this length.
+            Defaults to the length of the longest sequence.
+        dtype (torch.dtype): dtype of the returned tensor.
+        out (torch.Tensor | None): Optional preallocated CPU tensor to write into.
+
+    Returns:
+        tuple[torch.Tensor, np.ndarray]: The one-hot tensor and the validity mask from encode_dna_batch.
+            Rows of invalid sequences only contain the encodable characters and should be discarded.
+    """
+    codes, valid = encode_dna_batch(sequences, max_length)
+    return onehot_from_codes(codes, dtype=dtype, out=out), valid
+
+
+def onehot_encode_dna(seq: str) -> torch.Tensor:
+    """Given DNA sequence input covert it to onehot encoded form."""
+    encoded, valid = onehot_encode_dna_batch([seq], max_length=len(seq))
+    if not valid[0]:
+        return None
+    return encoded[0]
 
 
 def pad_collate_fn(batch):
@@ -0,0 +1,68 @@
+"""Compare the hook-based and the torch.func-based computation of gradient features.
+
+Passes a synthetic pool through the al_pipe MLP (with BatchNorm) in batches, computes the
+per-layer gradient feature data with ModelGradTransform ('hooks') and FuncGradTransform
+('func'), reports the time per 1k pool samples and checks that both give the same data.
+Run from the repository root with al_pipe installed (or on PYTHONPATH), e.g.
+``python benchmarks/grad_features.py --sizes 1024 512 512 1 --device cuda``.
+"""
+
+import argparse
+import sys
+import time
+
+from pathlib import Path
+
+import torch
+
+import al_pipe
+
+# same import workaround as in al_pipe/main.py, bmdal_reg uses absolute imports
+sys.path.insert(0, str(Path(al_pipe.__file__).parent))
+
+import al_pipe.bmdal_reg.bmdal.feature_data as real_fd
+
+sys.modules["bmdal_reg.bmdal.feature_data"] = real_fd
+
+from al_pipe.bmdal_reg.bmdal.layer_features import FuncGradTransform, LinearGradientComputation, ModelGradTransform
+from al_pipe.regression.mlp import MLP
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--sizes", type=int, nargs="+", default=[512, 256, 256, 1])
+parser.add_argument("--n_pool", type=int, default=50_000)
+parser.add_argument("--batch_size", type=int, default=8192)
+parser.add_argument("--n_repeats", type=int, default=3)
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+torch.manual_seed(args.seed)
+model = MLP(args.sizes, batch_norm=True).to(args.device)
+with torch.no_grad():
+    model(torch.randn(1024, args.sizes[0], device=args.device))  # nontrivial BatchNorm running statistics
+grad_layers = [LinearGradientComputation(layer) for layer in model.modules() if isinstance(layer, torch.nn.Linear)]
+pool = torch.randn(args.n_pool, args.sizes[0], device=args.device)
+
+results = {}
+for name, tfm_class in [("hooks", ModelGradTransform), ("func", FuncGradTransform)]:
+    tfm = tfm_class(model, grad_layers)
+    best = float("inf")
+    for _ in range(args.n_repeats):
+        start = time.time()
+        data = [
+            tfm(real_fd.TensorFeatureData(pool[start_idx : start_idx + args.batch_size]))
+            for start_idx in range(0, args.n_pool, args.batch_size)
+        ]
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        best = min(best, time.time() - start)
+    results[name] = data
+    print(f"{name:>5}: {1000 * best / args.n_pool * 1000:8.2f} ms per 1k pool samples")
+
+same = all(
+    torch.allclose(hooks_fd.get_tensor(), func_fd.get_tensor())
+    for hooks_list, func_list in zip(results["hooks"], results["func"])
+    for hooks_layer, func_layer in zip(hooks_list.feature_data_list, func_list.feature_data_list)
+    for hooks_fd, func_fd in zip(hooks_layer.feature_data_list, func_layer.feature_data_list)
+)
+print("same feature data:", same)
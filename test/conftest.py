@@ -0,0 +1,66 @@
+"""Shared test setup."""
+
+import importlib.util
+import sys
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import al_pipe
+
+from al_pipe.data.dna_dataset import DNADataset
+from al_pipe.embedding_models.static.onehot_embedding import OneHotEmbedder
+from al_pipe.util.data import BINARY_SUFFIX, convert_csv_to_binary
+
+# test modules that import bmdal_reg, which needs dill (through bmdal_reg.utils)
+BMDAL_TEST_MODULES = ["test_feature_maps.py", "test_layer_features.py", "test_lcmd.py", "test_selection.py"]
+
+if importlib.util.find_spec("dill") is None:
+    collect_ignore = BMDAL_TEST_MODULES
+else:
+    # same import workaround as in al_pipe/main.py, bmdal_reg uses absolute imports
+    sys.path.insert(0, str(Path(al_pipe.__file__).parent))
+
+    import al_pipe.bmdal_reg.bmdal.feature_data as real_fd
+
+    sys.modules["bmdal_reg.bmdal.feature_data"] = real_fd
+
+
+@pytest.fixture
+def make_dna_dataset(tmp_path):
+    """Return a function that writes sequences to a tab-separated CSV in tmp_path and builds a DNADataset of it.
+
+    With ``binary=True`` the CSV is converted to the binary dataset format and the dataset is loaded from that.
+    """
+
+    def make(
+        sequences: list[str],
+        values: np.ndarray | None = None,
+        batch_size: int = 8,
+        train_val_test_pool_split: list[float] | dict[str, float] | None = None,
+        max_length: int = 6,
+        embedding_model: OneHotEmbedder | None = None,
+        binary: bool = False,
+        **kwargs,
+    ) -> DNADataset:
+        if values is None:
+            values = np.arange(len(sequences), dtype=float)
+        if train_val_test_pool_split is None:
+            train_val_test_pool_split = {"train": 0.25, "val": 0.25, "test": 0.25, "pool": 0.25}
+        pd.DataFrame({"sequences": sequences, "values": values}).to_csv(tmp_path / "data.csv", index=False, sep="\t")
+        if binary:
+            convert_csv_to_binary(str(tmp_path / "data.csv"))
+        return DNADataset(
+            data_path=str(tmp_path),
+            data_name="data" + BINARY_SUFFIX if binary else "data.csv",
+            batch_size=batch_size,
+            train_val_test_pool_split=train_val_test_pool_split,
+            max_length=max_length,
+            embedding_model=embedding_model or OneHotEmbedder(device="cpu"),
+            **kwargs,
+        )
+
+    return make
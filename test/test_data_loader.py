@@ -0,0 +1,85 @@
+"""Test the DNA data loader and its batch sampler."""
+
+import numpy as np
+import pytest
+import torch
+
+from al_pipe.data_loader.batch_sampler import SliceBatchSampler
+from al_pipe.data_loader.dna_data_loader import DNADataLoader
+from al_pipe.data_loader.resident_data_loader import ResidentDataLoader
+from al_pipe.first_batch.random_first_batch import RandomFirstBatch
+from al_pipe.queries.random_sampling import RandomQueryStrategy
+
+
+@pytest.fixture
+def dna_dataset(make_dna_dataset):
+    rng = np.random.default_rng(0)
+    return make_dna_dataset(["".join(rng.choice(list("ATCG"), size=rng.integers(3, 7))) for _ in range(40)])
+
+
+def test_slice_batch_sampler_covers_all_indices():
+    sampler = SliceBatchSampler(range(10), batch_size=4, shuffle=True)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 3
+    assert sorted(np.concatenate(batches).tolist()) == list(range(10))
+    assert len(list(SliceBatchSampler(range(10), batch_size=4, drop_last=True))) == 2
+
+
+def test_getitems_matches_getitem(dna_dataset):
+    inputs, labels = dna_dataset.__getitems__([3, 0, 7])
+    for i, index in enumerate([3, 0, 7]):
+        assert torch.equal(inputs[i], dna_dataset[index][0])
+        assert labels[i] == dna_dataset[index][1]
+
+
+@pytest.mark.parametrize("slice_batches", [False, True])
+def test_train_loader_yields_all_rows(dna_dataset, slice_batches):
+    loader = DNADataLoader(
+        dna_dataset, batch_size=4, shuffle=True, first_batch_strategy=RandomFirstBatch(), slice_batches=slice_batches
+    )
+    batches = list(loader.get_train_loader())
+    assert all(inputs.shape[1:] == (6, 4) for inputs, _ in batches)
+    labels = torch.cat([labels for _, labels in batches])
+    assert sorted(labels.tolist()) == sorted(loader._train_dataset.get_labels().squeeze(1).tolist())
+
+
+def test_resident_data_loader_slices_split(dna_dataset):
+    loader = ResidentDataLoader(dna_dataset, batch_size=16, shuffle=True, device="cpu")
+    batches = list(loader)
+    assert len(batches) == len(loader) == 3
+    assert loader.dataset is dna_dataset
+    labels = torch.cat([labels for _, labels in batches])
+    assert sorted(labels.tolist()) == list(range(40))
+
+    inputs, labels = next(iter(ResidentDataLoader(dna_dataset, batch_size=16)))
+    assert torch.equal(inputs, dna_dataset.embedded_data[:16].float())
+    assert len(ResidentDataLoader(dna_dataset, batch_size=16, drop_last=True)) == 2
+
+
+def test_data_loader_with_resident_device(dna_dataset):
+    loader = DNADataLoader(dna_dataset, batch_size=4, first_batch_strategy=RandomFirstBatch(), resident_device="cpu")
+    train_loader = loader.get_train_loader()
+    assert isinstance(train_loader, ResidentDataLoader)
+    assert sum(len(labels) for _, labels in train_loader) == len(loader._train_dataset)
+
+
+def test_loaders_are_cached_until_split_changes(dna_dataset):
+    loader = DNADataLoader(dna_dataset, batch_size=4, first_batch_strategy=RandomFirstBatch())
+    train_loader, pool_loader, val_loader = loader.get_train_loader(), loader.get_pool_loader(), loader.get_val_loader()
+    assert loader.get_train_loader() is train_loader
+
+    n_train, n_pool = len(loader.get_train_dataset()), len(loader.get_pool_dataset())
+    loader.update_train_pool_dataset([0, 1])
+    assert loader.get_train_loader() is not train_loader
+    assert loader.get_pool_loader() is not pool_loader
+    assert loader.get_val_loader() is val_loader
+    assert len(loader.get_train_dataset()) == n_train + 2
+    assert len(loader.get_pool_dataset()) == n_pool - 2
+
+
+def test_random_query_strategy_samples_from_whole_pool(dna_dataset):
+    loader = DNADataLoader(dna_dataset, batch_size=4, first_batch_strategy=RandomFirstBatch())
+    n_pool = len(loader.get_pool_dataset())
+    # more samples than pool batches, fewer than pool rows
+    RandomQueryStrategy(selection_size=n_pool - 1).select_samples(None, loader)
+    assert len(loader.get_pool_dataset()) == 1
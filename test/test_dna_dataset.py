@@ -0,0 +1,145 @@
+"""Test the DNA dataset and its split views."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from al_pipe.data.dna_dataset import DNADataset, DNASubset
+from al_pipe.embedding_models.static.onehot_embedding import OneHotEmbedder
+from al_pipe.util.data import BINARY_SUFFIX, convert_csv_to_binary
+
+
+class CountingEmbedder(OneHotEmbedder):
+    """One-hot embedder that counts how many sequences it embedded and the largest batch."""
+
+    def __init__(self) -> None:
+        super().__init__(device="cpu")
+        self.n_embedded = 0
+        self.largest_batch = 0
+
+    def embed_any_sequences(self, sequences: pd.Series, max_length: int = 100) -> torch.Tensor:
+        self.n_embedded += len(sequences)
+        return OneHotEmbedder.embed_any_sequences(sequences, max_length=max_length)
+
+    def embed_codes(self, codes: np.ndarray, max_length: int = 100) -> torch.Tensor:
+        self.n_embedded += len(codes)
+        self.largest_batch = max(self.largest_batch, len(codes))
+        return OneHotEmbedder.embed_codes(codes, max_length=max_length)
+
+
+SEQUENCES = ("AAAA", "CCCC", "GGGG", "TTTT", "ACGT", "TGCA")
+
+
+@pytest.fixture
+def make_small_dataset(make_dna_dataset):
+    def make(sequences: tuple[str, ...] | list[str] = SEQUENCES, **kwargs) -> DNADataset:
+        kwargs.setdefault("embedding_model", CountingEmbedder())
+        return make_dna_dataset(
+            sequences, batch_size=2, train_val_test_pool_split=[0.5, 0.0, 0.0, 0.5], max_length=4, **kwargs
+        )
+
+    return make
+
+
+@pytest.fixture
+def dna_dataset(make_small_dataset):
+    return make_small_dataset()
+
+
+def test_subsets_share_embedding_store(dna_dataset):
+    train = dna_dataset.return_subset([4, 0])
+    pool = dna_dataset.return_subset([1, 2, 3, 5])
+    assert train.embedding_store is dna_dataset.embedding_store
+    assert pool.embedding_store is dna_dataset.embedding_store
+    assert torch.equal(train.embedded_data, dna_dataset.embedded_data[[4, 0]])
+    assert torch.equal(train[1][0], dna_dataset[0][0])
+    assert dna_dataset.embedding_model.n_embedded == 6
+
+
+def test_move_pool_to_train_does_not_reembed(dna_dataset):
+    train = dna_dataset.return_subset([0, 1])
+    pool = dna_dataset.return_subset([2, 3, 4, 5])
+
+    train.append(pool.get_subset([1, 3]))
+    pool.delete([1, 3])
+
+    assert train.row_ids.tolist() == [0, 1, 3, 5]
+    assert pool.row_ids.tolist() == [2, 4]
+    assert torch.equal(train.embedded_data, dna_dataset.embedded_data[[0, 1, 3, 5]])
+    assert torch.equal(pool[1][0], dna_dataset[4][0])
+    assert pool[1][1].item() == 4
+    assert dna_dataset.embedding_model.n_embedded == 6
+
+
+def test_return_subset_is_index_view(dna_dataset):
+    pool = dna_dataset.return_subset([5, 1, 3])
+    assert isinstance(pool, DNASubset)
+    assert pool.sequences is dna_dataset.sequences
+    assert pool.row_ids.dtype == np.int64
+    assert pool.data["sequences"].tolist() == ["TGCA", "CCCC", "TTTT"]
+    assert pool.get_labels().squeeze(1).tolist() == [5.0, 1.0, 3.0]
+
+    nested = pool.return_subset([2])
+    assert nested.row_ids.tolist() == [3]
+    assert pool.return_label(["CCCC"]) == [1]
+
+
+def test_delete_with_mask_and_positions(dna_dataset):
+    pool = dna_dataset.return_subset([0, 1, 2, 3, 4, 5])
+    pool.delete(torch.tensor([4, 0]))
+    assert pool.row_ids.tolist() == [1, 2, 3, 5]
+    pool.delete(np.array([True, False, False, True]))
+    assert pool.row_ids.tolist() == [2, 3]
+    assert len(dna_dataset) == 6
+
+
+def test_return_label_follows_view_updates(dna_dataset):
+    pool = dna_dataset.return_subset([0, 1, 2])
+    assert pool.return_label(["GGGG", "AAAA"]) == [2, 0]
+    pool.delete([2])
+    with pytest.raises(ValueError):
+        pool.return_label(["GGGG"])
+    pool.append(np.array([5]))
+    assert pool.return_labels(pd.Series(["TGCA"])).tolist() == [5]
+
+
+def test_binary_dataset_matches_csv(dna_dataset, make_small_dataset):
+    binary_dataset = make_small_dataset(binary=True)
+    # the memory-mapped codes back the embedding store, nothing is copied or embedded up front
+    assert isinstance(binary_dataset.embedding_store.codes, np.memmap)
+    assert binary_dataset.embedding_model.n_embedded == 0
+    assert torch.equal(binary_dataset[4][0], dna_dataset[4][0])
+    assert torch.equal(binary_dataset.embedded_data, dna_dataset.embedded_data)
+    assert torch.equal(binary_dataset.get_labels(), dna_dataset.get_labels())
+    # reading the whole dataset embeds every row once, later reads use these embeddings
+    assert binary_dataset.embedding_model.n_embedded == 1 + len(SEQUENCES)
+
+    pool = binary_dataset.return_subset([3, 4])
+    assert pool.data["sequences"].tolist() == ["TTTT", "ACGT"]
+    assert pool.return_label(["ACGT"]) == [4.0]
+    assert torch.equal(pool[0][0], dna_dataset[3][0])
+    assert torch.equal(pool.__getitems__([1])[0], dna_dataset.__getitems__([4])[0])
+    assert torch.equal(pool.embedded_data, binary_dataset.embedded_data[[3, 4]])
+    assert binary_dataset.embedding_model.n_embedded == 1 + len(SEQUENCES)
+
+
+def test_chunked_dataset_embeds_per_batch(dna_dataset, make_small_dataset):
+    embedder = CountingEmbedder()
+    chunked_dataset = make_small_dataset(embedding_model=embedder, chunksize=2)
+    # construction never builds the full float32 embedding
+    assert embedder.n_embedded == 0
+
+    for row_ids in ([0, 1], [2, 3], [4, 5]):
+        batch = chunked_dataset.__getitems__(row_ids)
+        assert torch.equal(batch[0], dna_dataset.__getitems__(row_ids)[0])
+    assert embedder.n_embedded == 6
+    assert embedder.largest_batch == 2
+
+
+def test_invalid_sequences_are_dropped_at_load(make_small_dataset):
+    dataset = make_small_dataset(["AAAA", "ACXT", "GGGG", "acgt"])
+    assert dataset.data["sequences"].tolist() == ["AAAA", "GGGG"]
+    assert dataset.get_labels().flatten().tolist() == [0.0, 2.0]
+    assert dataset.embedded_data.shape == (2, 4, 4)
+    assert dataset.return_label(["GGGG"]) == [2.0]
@@ -2,6 +2,9 @@
 
 import pandas as pd
 import pytest
+import torch
+
+from al_pipe.embedding_models.static.onehot_embedding import OneHotEmbedder
 
 
 @pytest.fixture
@@ -42,3 +45,12 @@ def sample_sequences():
 
 #     with pytest.raises(ValueError):
 #         _ = embedder.get_embeddings()
+
+
+def test_onehot_embedder_batch_output():
+    """Test that OneHotEmbedder returns one padded tensor and skips invalid sequences."""
+    sequences = pd.Series(["ATCG", "XYZW", "GC"])
+    embeddings = OneHotEmbedder(device="cpu").embed_any_sequences(sequences, max_length=5)
+    assert embeddings.shape == (2, 5, 4)
+    assert torch.all(embeddings.sum(dim=-1)[0] == torch.tensor([1.0, 1.0, 1.0, 1.0, 0.0]))
+    assert torch.all(embeddings.sum(dim=-1)[1] == torch.tensor([1.0, 1.0, 0.0, 0.0, 0.0]))
@@ -0,0 +1,215 @@
+"""Test the feature maps of bmdal_reg."""
+
+import pytest
+import torch
+
+from al_pipe.bmdal_reg.bmdal.feature_data import ConcatFeatureData, Indexes, TensorFeatureData
+from al_pipe.bmdal_reg.bmdal.feature_maps import (
+    CholeskyStats,
+    IdentityFeatureMap,
+    KmerSpectrumFeatureMap,
+    PosteriorCache,
+    ReLUNNGPFeatureMap,
+    ReLUNTKFeatureMap,
+    TiledFeatureMap,
+    WeightedDegreeFeatureMap,
+    get_kernel_tile_size,
+    pack_dna_codes,
+    popcount,
+    robust_cholesky,
+    robust_cholesky_inv,
+)
+from al_pipe.bmdal_reg.bmdal.features import Features
+
+
+@pytest.mark.parametrize("n_features", [5, 1100])
+def test_posterior_cache_matches_fresh_posterior(n_features):
+    # 5 features use the feature-space posterior, 1100 features the kernel-space posterior
+    torch.manual_seed(0)
+    x = torch.randn(40, n_features, dtype=torch.float64)
+    test_data = TensorFeatureData(torch.randn(10, n_features, dtype=torch.float64))
+    feature_map = IdentityFeatureMap(n_features=n_features)
+    cache = PosteriorCache()
+    for n_rows in [20, 30, 40]:
+        cond_data = TensorFeatureData(x[:n_rows])
+        cache.set_context("model", x[:n_rows])
+        cached = feature_map.posterior(cond_data, sigma=0.5, posterior_cache=cache)
+        fresh = feature_map.posterior(cond_data, sigma=0.5)
+        torch.testing.assert_close(
+            cached.get_kernel_matrix(test_data, test_data), fresh.get_kernel_matrix(test_data, test_data)
+        )
+    assert cache.n_updates == 2
+
+    # a different key or changed data forces a full factorization
+    cache.set_context("other model", x)
+    assert cache.get(kernel_space=n_features > 5) == (None, 0)
+    cache.set_context("model", x)
+    feature_map.posterior(TensorFeatureData(x), sigma=0.5, posterior_cache=cache)
+    cache.set_context("model", torch.flip(x, dims=[0]))
+    assert cache.get(kernel_space=n_features > 5) == (None, 0)
+
+
+def test_robust_cholesky_adds_minimal_jitter():
+    torch.manual_seed(0)
+    x = torch.randn(50, 10, dtype=torch.float64)
+    matrix = x @ x.t()  # rank 10, not positive definite
+    stats = CholeskyStats()
+    L = robust_cholesky(matrix.clone(), stats=stats)
+    assert stats.n_factorizations == 1 and stats.n_jittered == 1
+    assert stats.n_retries == 1  # the eigenvalue estimate makes the first retry succeed
+    assert stats.max_rel_jitter < 1e-4
+    torch.testing.assert_close(L @ L.t(), matrix, atol=1e-3, rtol=0.0)
+
+    spd_matrix = matrix[:5, :5].clone()
+    torch.testing.assert_close(robust_cholesky_inv(spd_matrix), torch.linalg.cholesky(spd_matrix).inverse())
+    stats = CholeskyStats()
+    robust_cholesky_inv(spd_matrix, stats)
+    assert stats.get_result_dict() == {"n_factorizations": 1, "n_jittered": 0, "n_retries": 0, "max_rel_jitter": 0.0}
+
+
+@pytest.mark.parametrize("n_features", [3, -1])
+def test_threaded_tiled_kernel_matrix_matches_sequential(n_features):
+    torch.manual_seed(0)
+    x = torch.randn(700, 3, dtype=torch.float64)
+    feature_data = ConcatFeatureData([TensorFeatureData(x[:300]), TensorFeatureData(x[300:])])
+    feature_map = IdentityFeatureMap(n_features=3) if n_features > 0 else ReLUNNGPFeatureMap(n_layers=2)
+    idxs = torch.randperm(700)[:500]
+    expected = feature_map.get_kernel_matrix(feature_data, feature_data, slice(50, 650))
+    expected_sub = feature_map.get_kernel_matrix(feature_data, TensorFeatureData(x), None, idxs)
+    tiled_map = TiledFeatureMap(feature_map, n_threads=4)
+    n_threads_before = torch.get_num_threads()
+    result = tiled_map.get_kernel_matrix_tiled(
+        feature_data, feature_data, Indexes(700, slice(50, 650)), Indexes(700, None), tile_size=64
+    )
+    result_sub = tiled_map.get_kernel_matrix_tiled(
+        feature_data, TensorFeatureData(x), Indexes(700, None), Indexes(700, idxs), tile_size=64
+    )
+    # the global thread settings of PyTorch are left alone
+    assert torch.get_num_threads() == n_threads_before
+    torch.testing.assert_close(result, expected)
+    torch.testing.assert_close(result_sub, expected_sub)
+    torch.testing.assert_close(tiled_map.get_kernel_matrix(feature_data, feature_data, slice(50, 650)), expected)
+
+
+def test_tiled_feature_map_respects_torch_num_threads(monkeypatch):
+    tiled_map = TiledFeatureMap(IdentityFeatureMap(n_features=3), n_threads=4)
+    monkeypatch.setattr(torch, "get_num_threads", lambda: 2)
+    assert tiled_map.get_n_threads() == 2
+    monkeypatch.setattr(torch, "get_num_threads", lambda: 1)
+    assert tiled_map.get_n_threads() == 1
+
+    # with a single thread, large kernel matrices are not split into tiles
+    def fail(*args, **kwargs):
+        raise AssertionError("get_kernel_matrix_tiled() should not be called")
+
+    monkeypatch.setattr(tiled_map, "get_kernel_matrix_tiled", fail)
+    x = torch.randn(2000, 3, dtype=torch.float64)
+    torch.testing.assert_close(tiled_map.get_kernel_matrix(TensorFeatureData(x), TensorFeatureData(x)), x @ x.t())
+
+
+def test_kernel_tile_size_fits_cache_budget():
+    tile_size = get_kernel_tile_size(n_features=512, element_size=4)
+    assert 4 * (tile_size**2 + 2 * 512 * tile_size) <= 2**21
+    assert get_kernel_tile_size(n_features=-1, element_size=8) == 512
+    assert get_kernel_tile_size(n_features=10**6, element_size=4) == 64
+
+
+@pytest.mark.parametrize("feature_map_class", [ReLUNTKFeatureMap, ReLUNNGPFeatureMap])
+def test_relu_kernel_lookup_table_on_onehot_inputs(feature_map_class):
+    torch.manual_seed(0)
+    codes = torch.randint(4, (300, 20))
+    onehot = torch.nn.functional.one_hot(codes, 4).to(torch.float64)
+    onehot[:50, 15:] = 0.0  # padding of shorter sequences
+    onehot[50:60, 3] = 0.0  # N positions
+    feature_data = TensorFeatureData(onehot.flatten(1))
+    expected = feature_map_class(n_layers=3).get_kernel_matrix(feature_data, feature_data)
+    feature_map = feature_map_class(n_layers=3, use_lookup_table=True)
+    # the first block only contains the squared norms 15 and 20, the table is extended by 19 for the second one
+    result_1 = feature_map.get_kernel_matrix(feature_data, feature_data, slice(0, 40), slice(60, 100))
+    ((norms, table),) = feature_map.lookup_table.tables.values()
+    assert norms.tolist() == [15, 20]
+    result = feature_map.get_kernel_matrix(feature_data, feature_data)
+    ((norms, table),) = feature_map.lookup_table.tables.values()
+    assert norms.tolist() == [15, 19, 20] and table.shape == (3, 3, 21)
+    torch.testing.assert_close(result_1, expected[:40, 60:100])
+    torch.testing.assert_close(result, expected)
+
+    # non-integer dot products fall back to evaluating the recursion
+    scaled_data = TensorFeatureData(0.3 * onehot.flatten(1))
+    torch.testing.assert_close(
+        feature_map.get_kernel_matrix(scaled_data, scaled_data),
+        feature_map_class(n_layers=3).get_kernel_matrix(scaled_data, scaled_data),
+    )
+
+
+def _random_codes(n_samples: int, length: int) -> torch.Tensor:
+    """Random nucleotide codes with some N (4) and trailing padding (5) as in al_pipe.util.general."""
+    codes = torch.randint(4, (n_samples, length), dtype=torch.uint8)
+    codes[torch.rand(n_samples, length) < 0.05] = 4
+    for i, n_pad in enumerate(torch.randint(length // 4, (n_samples,)).tolist()):
+        codes[i, length - n_pad :] = 5
+    return codes
+
+
+def _naive_spectrum_kernel(x: list, y: list, k: int) -> float:
+    def counts(seq):
+        result = {}
+        for l in range(len(seq) - k + 1):
+            kmer = tuple(seq[l : l + k])
+            if all(c < 4 for c in kmer):
+                result[kmer] = result.get(kmer, 0) + 1
+        return result
+
+    counts_x, counts_y = counts(x), counts(y)
+    return float(sum(c * counts_y.get(kmer, 0) for kmer, c in counts_x.items()))
+
+
+def _naive_wd_kernel(x: list, y: list, degree: int) -> float:
+    result = 0.0
+    for d in range(1, degree + 1):
+        weight = 2 * (degree - d + 1) / (degree * (degree + 1))
+        for l in range(len(x) - d + 1):
+            if all(a == b and a < 4 for a, b in zip(x[l : l + d], y[l : l + d])):
+                result += weight
+    return result
+
+
+def test_popcount():
+    x = torch.tensor([0, 1, -1, 2**62 + 5, -(2**63), 0x5555555555555555], dtype=torch.int64)
+    expected = [bin(v & (2**64 - 1)).count("1") for v in x.tolist()]
+    assert popcount(x).tolist() == expected
+
+
+@pytest.mark.parametrize("feature_map", [KmerSpectrumFeatureMap(k=3), WeightedDegreeFeatureMap(degree=4)])
+def test_string_kernels_match_naive_implementation(feature_map):
+    torch.manual_seed(0)
+    # 70 positions span three words, such that matches across word boundaries are tested
+    codes_1, codes_2 = _random_codes(7, 70), _random_codes(5, 70)
+    codes_2[0] = codes_1[0]
+    data_1 = TensorFeatureData(pack_dna_codes(codes_1))
+    data_2 = TensorFeatureData(pack_dna_codes(codes_2))
+    assert data_1.get_tensor().shape == (7, 6)
+
+    if isinstance(feature_map, KmerSpectrumFeatureMap):
+        naive_kernel = lambda x, y: _naive_spectrum_kernel(x, y, 3)  # noqa: E731
+    else:
+        naive_kernel = lambda x, y: _naive_wd_kernel(x, y, 4)  # noqa: E731
+    expected = torch.tensor([[naive_kernel(x, y) for y in codes_2.tolist()] for x in codes_1.tolist()])
+    expected_diag = torch.tensor([naive_kernel(x, x) for x in codes_1.tolist()])
+
+    torch.testing.assert_close(feature_map.get_kernel_matrix(data_1, data_2), expected)
+    torch.testing.assert_close(feature_map.get_kernel_matrix_diag(data_1), expected_diag)
+    # the selection methods use the dtype of the kernel values, not of the packed sequences
+    assert Features(feature_map, data_1).get_dtype() == torch.float32
+
+
+@pytest.mark.parametrize("feature_map", [KmerSpectrumFeatureMap(k=3), WeightedDegreeFeatureMap(degree=4)])
+def test_string_kernel_sketch_is_unbiased(feature_map):
+    torch.manual_seed(1)
+    data = TensorFeatureData(pack_dna_codes(_random_codes(4, 50)))
+    kernel_matrix = feature_map.get_kernel_matrix(data, data)
+    sketches = [feature_map.sketch(64).get_feature_matrix(data) for i in range(200)]
+    sketched = torch.stack([features @ features.t() for features in sketches]).mean(dim=0)
+    assert sketches[0].shape == (4, 64)
+    # the inner products of the hashed features are unbiased estimates of the kernel values
+    assert (sketched - kernel_matrix).abs().max() < 0.1 * kernel_matrix.diagonal().max()
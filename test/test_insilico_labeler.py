@@ -22,3 +22,11 @@ def test_insilico_labeler_returns_labels():
     insilico_labeler = DNADataset(data_path="./dataset/test", data_name="test_data.csv", batch_size=1, train_val_test_pool_split=[0.5, 0.25, 0.25], max_length=4, embedding_model=None)
     labels = insilico_labeler.return_label(["ACCT", "ATCG", "ATTC"])
     assert labels == [2, 1, 3]
+
+
+def test_insilico_labeler_returns_labels_in_bulk():
+    insilico_labeler = DNADataset(data_path="./dataset/test", data_name="test_data.csv", batch_size=1, train_val_test_pool_split=[0.5, 0.25, 0.25], max_length=4, embedding_model=None)
+    labels = insilico_labeler.return_labels(["ATTC", "ATCG", "ATTC"])
+    assert labels.tolist() == [3, 1, 3]
+    with pytest.raises(ValueError, match="GGGG"):
+        insilico_labeler.return_labels(["ATCG", "GGGG"])
@@ -0,0 +1,109 @@
+"""Test the gradient features of bmdal_reg."""
+
+import pytest
+import torch
+
+from al_pipe.bmdal_reg.bmdal.algorithms import select_batch
+from al_pipe.bmdal_reg.bmdal.feature_data import Indexes, TensorFeatureData
+from al_pipe.bmdal_reg.bmdal.layer_features import (
+    FuncGradTransform,
+    GradFeatureCache,
+    LinearGradientComputation,
+    ModelGradTransform,
+)
+from al_pipe.regression.mlp import MLP
+
+
+@pytest.mark.parametrize(
+    "selection_method, kernel_transforms", [("lcmd", [("rp", [64])]), ("bait", [("train", [0.1])])]
+)
+def test_grad_feature_cache_skips_model_passes(selection_method, kernel_transforms):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(4, 16), torch.nn.ReLU(), torch.nn.Linear(16, 1))
+    n_forward = []
+    model.register_forward_hook(lambda module, inp, out: n_forward.append(len(inp[0])))
+    data = {
+        "train": TensorFeatureData(torch.randn(30, 4)),
+        "pool": TensorFeatureData(torch.randn(100, 4)),
+    }
+    cache = GradFeatureCache()
+
+    def select(**config):
+        torch.manual_seed(1)
+        return select_batch(
+            batch_size=5,
+            models=[model],
+            data=data,
+            y_train=None,
+            selection_method=selection_method,
+            base_kernel="grad",
+            kernel_transforms=kernel_transforms,
+            precomp_batch_size=32,
+            verbosity=0,
+            **config,
+        )[0]
+
+    expected = select()
+    n_forward.clear()
+    assert torch.equal(select(grad_feature_cache=cache), expected)
+    assert len(n_forward) > 0
+    n_forward.clear()
+    assert torch.equal(select(grad_feature_cache=cache), expected)
+    assert n_forward == []
+    assert cache.n_hits > 0
+
+    # the inputs are hashed once per FeatureData object, new objects with the same contents still hit the cache
+    assert len(cache.data_hashes) == 2
+    data = {key: TensorFeatureData(feature_data.get_tensor().clone()) for key, feature_data in data.items()}
+    assert torch.equal(select(grad_feature_cache=cache), expected)
+    assert n_forward == []
+
+    # changing the model invalidates the cached features
+    with torch.no_grad():
+        model[0].weight.mul_(2.0)
+    select(grad_feature_cache=cache)
+    assert len(n_forward) > 0
+
+
+def test_grad_feature_cache_keys_and_eviction():
+    cache = GradFeatureCache()
+    data = TensorFeatureData(torch.randn(20, 4))
+    stepped = Indexes(20, None)
+    stepped.idxs = slice(0, 10, 2)
+    assert cache.get_data_key(data, Indexes(20, slice(None, 10))) == cache.get_data_key(data, Indexes(20, slice(0, 10)))
+    assert cache.get_data_key(data, stepped) != cache.get_data_key(data, Indexes(20, slice(0, 10)))
+
+    # only the entries of the most recently used model are kept
+    cache.store(("model_1", "a"), data)
+    cache.store(("model_1", "b"), data)
+    cache.store(("model_2", "a"), data)
+    assert list(cache.entries) == [("model_2", "a")]
+
+    cache = GradFeatureCache(max_n_models=2)
+    cache.store(("model_1", "a"), data)
+    cache.store(("model_2", "a"), data)
+    assert cache.get(("model_1", "a")) is data
+    cache.store(("model_3", "a"), data)
+    assert set(cache.entries) == {("model_1", "a"), ("model_3", "a")}
+
+
+@pytest.mark.parametrize("n_last_layers", [1, 3])
+def test_func_grad_transform_matches_hooks(n_last_layers):
+    torch.manual_seed(0)
+    model = MLP([6, 16, 16, 1], batch_norm=True)
+    with torch.no_grad():
+        model(torch.randn(64, 6))  # nontrivial BatchNorm running statistics
+    model.train()
+    grad_layers = [LinearGradientComputation(layer) for layer in model.modules() if isinstance(layer, torch.nn.Linear)]
+    grad_layers = grad_layers[-n_last_layers:]
+    data = TensorFeatureData(torch.randn(20, 6))
+    expected = ModelGradTransform(model, grad_layers)(data)
+    result = FuncGradTransform(model, grad_layers)(data)
+    assert model.training
+    for expected_layer, layer in zip(expected.feature_data_list, result.feature_data_list, strict=True):
+        for expected_fd, fd in zip(expected_layer.feature_data_list, layer.feature_data_list, strict=True):
+            torch.testing.assert_close(fd.get_tensor(), expected_fd.get_tensor())
+
+    if n_last_layers > 1:
+        with pytest.raises(ValueError):
+            FuncGradTransform(model, grad_layers[::-1])
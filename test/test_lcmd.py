@@ -0,0 +1,131 @@
+"""Test the LCMD query strategy and the reusable LCMD selection state."""
+
+import numpy as np
+import torch
+
+from al_pipe.bmdal_reg.bmdal.algorithms import select_batch
+from al_pipe.bmdal_reg.bmdal.feature_data import TensorFeatureData
+from al_pipe.data_loader.dna_data_loader import DNADataLoader
+from al_pipe.embedding_models.static.onehot_embedding import OneHotEmbedder
+from al_pipe.first_batch.random_first_batch import RandomFirstBatch
+from al_pipe.queries import lcmd
+from al_pipe.queries.lcmd import LCMDQueryStrategy
+
+
+def _select(train: torch.Tensor, pool: torch.Tensor, batch_size: int, **config):
+    return select_batch(
+        batch_size=batch_size,
+        models=[torch.nn.Identity()],
+        data={"train": TensorFeatureData(train), "pool": TensorFeatureData(pool)},
+        y_train=None,
+        selection_method="lcmd",
+        sel_with_train=True,
+        base_kernel="linear",
+        kernel_transforms=[],
+        verbosity=0,
+        return_selection_state=True,
+        **config,
+    )
+
+
+def test_lcmd_continues_from_state():
+    torch.manual_seed(0)
+    train, pool = torch.randn(5, 3, dtype=torch.float64), torch.randn(60, 3, dtype=torch.float64)
+    first, results = _select(train, pool, 4)
+    state = results["selection_state"]
+    assert state["n_clusters"] == 9
+
+    # move the batch to the training set and continue from the stored state
+    rest = torch.ones(len(pool), dtype=torch.bool)
+    rest[first] = False
+    new_train = torch.cat([train, pool[first]])
+    init_state = {
+        "min_sq_dists": state["min_sq_dists"][rest],
+        "closest_idxs": state["closest_idxs"][rest],
+        "n_clusters": state["n_clusters"],
+        "n_train": len(new_train),
+    }
+    continued, _ = _select(new_train, pool[rest], 4, lcmd_init_state=init_state)
+    from_scratch, _ = _select(new_train, pool[rest], 4)
+    assert continued.tolist() == from_scratch.tolist()
+
+    # with changed features, only the assignment is kept and the distances are recomputed,
+    # scaling the features keeps every center the closest one such that this is exact
+    init_state["min_sq_dists"] = None
+    continued, results = _select(2 * new_train, 2 * pool[rest], 4, lcmd_init_state=init_state)
+    from_scratch, _ = _select(2 * new_train, 2 * pool[rest], 4)
+    assert continued.tolist() == from_scratch.tolist()
+    assert results["selection_state"]["n_clusters"] == state["n_clusters"] + 4
+
+
+class CodeCountingEmbedder(OneHotEmbedder):
+    """One-hot embedder that counts how many rows of codes it embedded."""
+
+    def __init__(self) -> None:
+        super().__init__(device="cpu")
+        self.n_embedded = 0
+
+    def embed_codes(self, codes: np.ndarray, max_length: int = 100) -> torch.Tensor:
+        self.n_embedded += len(codes)
+        return OneHotEmbedder.embed_codes(codes, max_length=max_length)
+
+
+def test_binary_dataset_is_embedded_once_across_rounds(make_dna_dataset):
+    rng = np.random.default_rng(0)
+    embedder = CodeCountingEmbedder()
+    dataset = make_dna_dataset(
+        ["".join(rng.choice(list("ATCG"), size=6)) for _ in range(80)],
+        train_val_test_pool_split={"train": 0.25, "val": 0.0, "test": 0.0, "pool": 0.75},
+        embedding_model=embedder,
+        binary=True,
+    )
+    loader = DNADataLoader(dataset=dataset, batch_size=8, num_workers=0, first_batch_strategy=RandomFirstBatch())
+    torch.manual_seed(0)
+    regressor = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(24, 4), torch.nn.ReLU(), torch.nn.Linear(4, 1))
+    strategy = LCMDQueryStrategy(selection_size=5)
+    assert embedder.n_embedded == 0
+
+    strategy.select_samples(regressor, loader)
+    assert embedder.n_embedded == 80
+    strategy.select_samples(regressor, loader)
+    assert embedder.n_embedded == 80
+    assert len(loader.get_train_dataset()) == 30
+
+
+def test_incremental_strategy_reuses_features(make_dna_dataset, monkeypatch):
+    rng = np.random.default_rng(0)
+    dataset = make_dna_dataset(
+        ["".join(rng.choice(list("ATCG"), size=6)) for _ in range(80)],
+        values=rng.normal(size=80),
+        train_val_test_pool_split={"train": 0.25, "val": 0.0, "test": 0.0, "pool": 0.75},
+    )
+    loader = DNADataLoader(dataset=dataset, batch_size=8, num_workers=0, first_batch_strategy=RandomFirstBatch())
+    torch.manual_seed(0)
+    regressor = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(24, 4), torch.nn.ReLU(), torch.nn.Linear(4, 1))
+    strategy = LCMDQueryStrategy(selection_size=5, incremental=True, model_tolerance=1e-3)
+    init_states = []
+
+    def recording_select_batch(**kwargs):
+        init_states.append(kwargs.get("lcmd_init_state"))
+        return select_batch(**kwargs)
+
+    monkeypatch.setattr(lcmd, "select_batch", recording_select_batch)
+
+    strategy.select_samples(regressor, loader)
+    features = strategy._features
+    n_train = len(loader.get_train_dataset())
+    strategy.select_samples(regressor, loader)
+    assert strategy._features is features
+    assert len(loader.get_train_dataset()) == n_train + 5
+    assert strategy._state["n_clusters"] == n_train + 5
+
+    with torch.no_grad():
+        regressor[1].weight.mul_(2.0)
+    strategy.select_samples(regressor, loader)
+    assert strategy._features is not features
+    # the features were recomputed, but the pool kept its centers and only the new rows were added
+    assert init_states[2]["min_sq_dists"] is None
+    assert init_states[2]["n_clusters"] == init_states[2]["n_train"] == n_train + 5
+    assert strategy._state["n_clusters"] == n_train + 10
+    train_rows = loader.get_train_dataset().row_ids
+    assert len(np.unique(train_rows)) == len(train_rows)
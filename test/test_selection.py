@@ -0,0 +1,223 @@
+"""Test the iterative selection methods of bmdal_reg."""
+
+import numpy as np
+import pytest
+import torch
+
+from al_pipe.bmdal_reg.bmdal.feature_data import TensorFeatureData
+from al_pipe.bmdal_reg.bmdal.feature_maps import IdentityFeatureMap
+from al_pipe.bmdal_reg.bmdal.features import Features
+from al_pipe.bmdal_reg.bmdal.selection import (
+    BaitFeatureSpaceSelectionMethod,
+    KmeansppSelectionMethod,
+    LargestClusterMaxDistSelectionMethod,
+    MaxDetFeatureSpaceSelectionMethod,
+    MaxDetSelectionMethod,
+    MaxDistSelectionMethod,
+    RandomizedMinDistSumSelectionMethod,
+)
+
+
+def _features(x: torch.Tensor) -> Features:
+    return Features(IdentityFeatureMap(n_features=x.shape[1]), TensorFeatureData(x))
+
+
+@pytest.mark.parametrize("method", [MaxDistSelectionMethod, LargestClusterMaxDistSelectionMethod])
+def test_add_many_matches_add(method):
+    torch.manual_seed(0)
+    pool = _features(torch.randn(50, 3, dtype=torch.float64))
+    # duplicated training points give ties, which must be resolved like in sequential adds
+    train = _features(torch.randn(10, 3, dtype=torch.float64).repeat(2, 1))
+
+    sequential = method(pool, train, verbosity=0)
+    for i in range(len(train)):
+        sequential.add(len(pool) + i)
+        sequential.n_added += 1
+    blocked = method(pool, train, verbosity=0)
+    blocked.add_many(slice(len(pool), len(pool) + 7))
+    blocked.add_many(slice(len(pool) + 7, len(pool) + len(train)))
+
+    assert blocked.n_added == sequential.n_added == 20
+    assert torch.allclose(blocked.min_sq_dists, sequential.min_sq_dists)
+    if method is LargestClusterMaxDistSelectionMethod:
+        assert torch.equal(blocked.closest_idxs, sequential.closest_idxs)
+        assert blocked.closest_idxs.max() <= 10
+
+
+@pytest.mark.parametrize("method", [MaxDistSelectionMethod, LargestClusterMaxDistSelectionMethod])
+def test_select_with_train_blocks(method):
+    torch.manual_seed(1)
+    pool = _features(torch.randn(80, 4))
+    train = _features(torch.randn(30, 4))
+    small_blocks = method(pool, train, verbosity=0, add_block_size=4).select(6)
+    one_block = method(pool, train, verbosity=0).select(6)
+    assert small_blocks.tolist() == one_block.tolist()
+
+
+@pytest.mark.parametrize("dist_weight_mode", ["sq-dist", "dist", "none"])
+def test_lcmd_cluster_index_matches_scores(dist_weight_mode):
+    torch.manual_seed(2)
+    pool = _features(torch.randn(200, 3, dtype=torch.float64))
+    train = _features(torch.randn(20, 3, dtype=torch.float64))
+    alg = LargestClusterMaxDistSelectionMethod(
+        pool, train, verbosity=0, dist_weight_mode=dist_weight_mode, n_cluster_candidates=2
+    )
+    alg.add_many(slice(len(pool), len(pool) + len(train)))
+    for _ in range(40):
+        scores = alg.get_scores().clone()
+        scores[alg.selected_idxs] = -torch.inf
+        next_idx = alg.get_next_idx()
+        assert next_idx == torch.argmax(scores).item()
+        alg.add(next_idx)
+        alg.n_added += 1
+        alg.selected_idxs.append(next_idx)
+        alg.selected_arr[next_idx] = True
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lcmd_cluster_index_resolves_tied_clusters(seed):
+    # mirrored pool points around two mirrored centers give clusters whose weights tie exactly in get_scores(),
+    # while the incrementally updated cluster weights can differ in the last bits
+    torch.manual_seed(seed)
+    half = torch.rand(100, 2, dtype=torch.float64) * torch.tensor([7.0, 3.0], dtype=torch.float64) + 0.1
+    pool = _features(torch.cat([half, -half]))
+    train = _features(torch.tensor([[1.0, 0.0], [-1.0, 0.0]], dtype=torch.float64))
+    alg = LargestClusterMaxDistSelectionMethod(pool, train, verbosity=0)
+    # the points leave the first cluster when the second center is added
+    for i in range(len(train)):
+        alg.add(len(pool) + i)
+        alg.n_added += 1
+    bincount = torch.bincount(alg.closest_idxs, weights=alg.min_sq_dists)
+    assert bincount[1] == bincount[2]
+    for _ in range(10):
+        scores = alg.get_scores().clone()
+        scores[alg.selected_idxs] = -torch.inf
+        next_idx = alg.get_next_idx()
+        assert next_idx == torch.argmax(scores).item()
+        alg.add(next_idx)
+        alg.n_added += 1
+        alg.selected_idxs.append(next_idx)
+        alg.selected_arr[next_idx] = True
+
+
+def test_update_min_sq_dists_in_tiles():
+    torch.manual_seed(3)
+    pool = _features(torch.randn(100, 3, dtype=torch.float64))
+    candidates = _features(torch.randn(6, 3, dtype=torch.float64).repeat(2, 1))
+    min_sq_dists = torch.full((100,), 2.0, dtype=torch.float64)
+    closest_idxs = torch.zeros(100, dtype=torch.long)
+
+    changed, old_sq_dists, old_closest = pool.update_min_sq_dists(
+        min_sq_dists, candidates, closest_idxs=closest_idxs, first_closest_idx=1, max_tile_size=30
+    )
+    expected_min, expected_argmin = candidates.get_sq_dists(pool).min(dim=0)
+    expected_changed = expected_min < 2.0
+    assert torch.equal(changed, torch.nonzero(expected_changed).squeeze(-1))
+    assert torch.all(old_sq_dists == 2.0) and torch.all(old_closest == 0)
+    assert torch.allclose(min_sq_dists, torch.where(expected_changed, expected_min, 2.0))
+    assert torch.equal(closest_idxs, torch.where(expected_changed, 1 + expected_argmin, 0))
+    assert closest_idxs.max() <= 6
+
+
+@pytest.mark.parametrize(
+    "method", [MaxDistSelectionMethod, LargestClusterMaxDistSelectionMethod, KmeansppSelectionMethod]
+)
+def test_small_tiles_give_same_selection(method):
+    pool = _features(torch.randn(60, 3))
+    train = _features(torch.randn(10, 3))
+    torch.manual_seed(4)
+    np.random.seed(4)
+    tiled = method(pool, train, verbosity=0, max_tile_size=7).select(8)
+    torch.manual_seed(4)
+    np.random.seed(4)
+    untiled = method(pool, train, verbosity=0).select(8)
+    assert tiled.tolist() == untiled.tolist()
+
+
+def test_rmds_selects_distinct_points():
+    torch.manual_seed(5)
+    pool = _features(torch.randn(30, 3))
+    train = _features(torch.randn(5, 3))
+    selected = RandomizedMinDistSumSelectionMethod(pool, train, verbosity=0, max_tile_size=16).select(10)
+    assert len(set(selected.tolist())) == 10
+
+
+def test_min_sq_dist_sums_match_untiled_computation():
+    torch.manual_seed(7)
+    pool = _features(torch.randn(50, 3, dtype=torch.float64))
+    candidates = pool[torch.tensor([3, 17, 41])]
+    min_sq_dists = pool.get_sq_dists(_features(torch.randn(4, 3, dtype=torch.float64))).min(dim=-1)[0]
+    expected = torch.minimum(min_sq_dists[None, :], candidates.get_sq_dists(pool)).sum(dim=-1)
+    sums = pool.get_min_sq_dist_sums(min_sq_dists, candidates, max_tile_size=7)
+    assert torch.allclose(sums, expected)
+
+
+@pytest.mark.parametrize("method", [MaxDistSelectionMethod, LargestClusterMaxDistSelectionMethod])
+def test_triangle_pruning_matches_exact_mode(method):
+    torch.manual_seed(6)
+    # well separated blobs, such that most distance computations can be pruned
+    centers = 20.0 * torch.randn(8, 4, dtype=torch.float64)
+    pool = _features((centers[:, None, :] + torch.randn(8, 100, 4, dtype=torch.float64)).reshape(-1, 4))
+    train = _features(centers[:3] + torch.randn(3, 4, dtype=torch.float64))
+    exact = method(pool, train, verbosity=0, add_block_size=2)
+    pruned = method(pool, train, verbosity=0, add_block_size=2, triangle_pruning=True)
+    assert pruned.select(30).tolist() == exact.select(30).tolist()
+    assert torch.allclose(pruned.min_sq_dists, exact.min_sq_dists)
+    assert pruned.n_sq_dist_evals < exact.n_sq_dist_evals / 2
+
+
+@pytest.mark.parametrize("noise_sigma", [0.0, 0.5])
+@pytest.mark.parametrize("sel_with_train", [False, True])
+def test_maxdet_feature_space_matches_kernel_space(noise_sigma, sel_with_train):
+    torch.manual_seed(0)
+    pool = _features(torch.randn(200, 8, dtype=torch.float64))
+    train = _features(torch.randn(3, 8, dtype=torch.float64))
+    config = dict(noise_sigma=noise_sigma, sel_with_train=sel_with_train, verbosity=0)
+    expected = MaxDetSelectionMethod(pool, train, **config).select(5)
+    alg = MaxDetFeatureSpaceSelectionMethod(pool, train, **config)
+    assert torch.equal(alg.select(5), expected)
+    assert alg.inv_gram.shape == (8, 8)
+
+
+def _exact_bait_selection(x: torch.Tensor, x_train: torch.Tensor, noise_sigma: float, batch_size: int) -> list:
+    # greedy BAIT in P-mode, where the deflation by the selected points is computed from scratch in float64
+    x, x_train = x.double(), x_train.double()
+    cov = x.t() @ x + x_train.t() @ x_train
+    selected = []
+    for _ in range(batch_size):
+        phi = x[selected]
+        gram = phi @ phi.t() + noise_sigma**2 * torch.eye(len(selected), dtype=torch.float64)
+        deflation = torch.eye(x.shape[1], dtype=torch.float64) - phi.t() @ torch.linalg.pinv(gram, hermitian=True) @ phi
+        scores = ((x @ deflation @ cov @ deflation) * x).sum(dim=-1)
+        scores /= ((x @ deflation) * x).sum(dim=-1) + noise_sigma**2 + 1e-8
+        scores[selected] = -np.inf
+        selected.append(torch.argmax(scores).item())
+    return selected
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("noise_sigma, batch_size, resync_interval", [(0.1, 16, None), (0.0, 8, 1)])
+def test_bait_float32_matches_exact_deflation(seed, noise_sigma, batch_size, resync_interval):
+    torch.manual_seed(seed)
+    scales = torch.logspace(0, -2, 8)
+    x, x_train = torch.randn(500, 8) * scales, torch.randn(20, 8) * scales
+    alg = BaitFeatureSpaceSelectionMethod(
+        _features(x), _features(x_train), noise_sigma=noise_sigma, resync_interval=resync_interval, verbosity=0
+    )
+    assert alg.select(batch_size).tolist() == _exact_bait_selection(x, x_train, noise_sigma, batch_size)
+
+
+@pytest.mark.parametrize("sel_with_train", [False, True])
+def test_bait_blocks_give_same_selection(sel_with_train):
+    torch.manual_seed(0)
+    x = torch.randn(500, 32, dtype=torch.float64)
+    pool = _features(x)
+    train = _features(torch.randn(5, 32, dtype=torch.float64))
+    config = dict(sel_with_train=sel_with_train, noise_sigma=0.1, overselection_factor=2.0, verbosity=0)
+    alg = BaitFeatureSpaceSelectionMethod(pool, train, max_tile_size=100, **config)
+    assert alg.block_size == 3
+    # in TP-mode, the train features are part of alg.features, otherwise they are added separately
+    cov = x.t() @ x + train.get_feature_matrix().t() @ train.get_feature_matrix()
+    torch.testing.assert_close(alg.scores_numerator[:500], torch.einsum("ij,ji->i", x, cov @ x.t()))
+    expected = BaitFeatureSpaceSelectionMethod(pool, train, **config).select(12)
+    assert torch.equal(alg.select(12), expected)
@@ -1,5 +1,20 @@
 """Testing functions in data.py."""
 
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from al_pipe.util.data import (
+    BINARY_SUFFIX,
+    CodedSequences,
+    convert_csv_to_binary,
+    dna_collate_fn,
+    keep_mask,
+    load_binary_data,
+    load_data,
+)
+
 # from al_pipe.util.data import Data
 
 
@@ -13,3 +28,69 @@
 #     # how do you test it with data
 #     data_class = Data(path, data_name)
 #     assert data_class is not None
+
+
+def test_keep_mask_accepts_positions_and_masks():
+    expected = [True, False, True, False, True]
+    assert keep_mask([3, 1, 1], 5).tolist() == expected
+    assert keep_mask({1, 3}, 5).tolist() == expected
+    assert keep_mask(torch.tensor([1, 3]), 5).tolist() == expected
+    assert keep_mask(np.array([False, True, False, True, False]), 5).tolist() == expected
+    assert keep_mask([torch.tensor(1), torch.tensor(3)], 5).tolist() == expected
+    assert keep_mask([False, True, False, True, False], 5).tolist() == expected
+    assert keep_mask([], 5).all()
+
+
+def test_binary_roundtrip(tmp_path):
+    data = pd.DataFrame({"sequences": ["ATCGN", "GA", "TTTTTTT"], "values": [0.5, 1.0, 2.0]})
+    data.to_csv(tmp_path / "data.csv", index=False, sep="\t")
+
+    binary_path = convert_csv_to_binary(str(tmp_path / "data.csv"))
+    assert binary_path.endswith(BINARY_SUFFIX)
+
+    codes, values = load_binary_data(binary_path)
+    assert codes.shape == (3, 7)
+    assert values.dtype == np.float32
+    assert values.tolist() == [0.5, 1.0, 2.0]
+    assert CodedSequences(codes)[np.arange(3)].tolist() == ["ATCGN", "GA", "TTTTTTT"]
+    assert CodedSequences(codes)[1] == "GA"
+
+
+def test_binary_rejects_invalid_sequences(tmp_path):
+    pd.DataFrame({"sequences": ["ATCG", "ATXG"], "values": [1, 2]}).to_csv(tmp_path / "bad.csv", index=False, sep="\t")
+    with pytest.raises(ValueError):
+        convert_csv_to_binary(str(tmp_path / "bad.csv"))
+
+
+def test_load_data_streaming_matches_full_load(tmp_path):
+    data = pd.DataFrame({"sequences": ["ATCG", "GA", "TTTTT", "NNA", "C"], "values": [0.0, 1.0, 2.0, 3.0, 4.0]})
+    data.to_csv(tmp_path / "data.csv", index=False, sep="\t")
+
+    codes, values = load_data(str(tmp_path / "data.csv"), chunksize=2, max_length=4)
+    assert codes.shape == (5, 4)
+    assert values.tolist() == data["values"].tolist()
+    assert CodedSequences(codes)[np.arange(5)].tolist() == ["ATCG", "GA", "TTTT", "NNA", "C"]
+
+    # the binary cache is reused, and rebuilt when the requested width changes
+    assert load_data(str(tmp_path / "data.csv"), chunksize=2, max_length=4)[0].shape == (5, 4)
+    assert load_data(str(tmp_path / "data.csv"), chunksize=3)[0].shape == (5, 4)
+    assert load_data(str(tmp_path / "data.csv"), chunksize=3, max_length=6)[0].shape == (5, 6)
+
+
+def test_dna_collate_fn_pads_and_truncates():
+    batch = [
+        (torch.ones(3, 4), torch.tensor(1.0)),
+        (torch.ones(6, 4), torch.tensor(2.0)),
+        (torch.ones(5, 4), torch.tensor(3.0)),
+    ]
+    inputs, labels = dna_collate_fn(batch, max_length=5)
+    assert inputs.shape == (3, 5, 4)
+    assert inputs.sum(dim=(1, 2)).tolist() == [12.0, 20.0, 20.0]
+    assert labels.tolist() == [1.0, 2.0, 3.0]
+
+
+def test_dna_collate_fn_fixed_length():
+    batch = [(torch.full((5, 4), float(i)), torch.tensor(float(i))) for i in range(4)]
+    inputs, labels = dna_collate_fn(batch, max_length=5)
+    assert torch.equal(inputs, torch.stack([item[0] for item in batch]))
+    assert labels.shape == (4,)
@@ -1,11 +1,13 @@
 """Test file for util.general."""
 
 import random
+import tracemalloc
 
 import numpy as np
+import pandas as pd
 import torch
 
-from al_pipe.util.general import onehot_encode_dna, seed_all
+from al_pipe.util.general import PAD_CODE, encode_dna_batch, onehot_encode_dna, onehot_encode_dna_batch, seed_all
 
 
 def test_returned_randomstate():  # noqa: D103
@@ -57,3 +59,45 @@ def test_onehot_encode_dna_invalid():
     seq = "ATCGX"
     encoded = onehot_encode_dna(seq)
     assert encoded is None
+
+
+def test_onehot_encode_dna_batch_pads_and_truncates():
+    encoded, valid = onehot_encode_dna_batch(pd.Series(["ATCGN", "AC", "ACGTAAAA"]), max_length=6)
+    assert encoded.shape == (3, 6, 4)
+    assert valid.all()
+    for i, seq in enumerate(["ATCGN", "AC", "ACGTAA"]):
+        expected = onehot_encode_dna(seq)
+        assert torch.equal(encoded[i, : len(seq)], expected)
+        assert torch.all(encoded[i, len(seq) :] == 0)
+
+
+def test_onehot_encode_dna_batch_marks_invalid_sequences():
+    codes, valid = encode_dna_batch(
+        pd.Series(["ATCG", "ATXG", "A\u00c4CG", "ATCGAXXX", "acgt", "A\x00G"]), max_length=4
+    )
+    # lowercase bases and NUL characters within a sequence are invalid
+    assert valid.tolist() == [True, False, False, False, False, False]
+    assert codes.shape == (6, 4)
+    assert onehot_encode_dna("acgt") is None
+    assert onehot_encode_dna("A\x00G") is None
+
+
+def test_encode_dna_batch_truncates_before_copying():
+    sequences = ["ACGT"] * 2000 + ["A" * 100_000 + "X"]
+    tracemalloc.start()
+    codes, valid = encode_dna_batch(sequences, max_length=4)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # a byte array as wide as the longest sequence would take 200 MB
+    assert peak < 10_000_000
+    assert codes.shape == (2001, 4)
+    assert valid[:-1].all() and not valid[-1]
+
+
+def test_onehot_encode_dna_batch_uint8_output():
+    out = torch.full((2, 3, 4), 7, dtype=torch.uint8)
+    encoded, _ = onehot_encode_dna_batch(["AT", "G"], max_length=3, out=out)
+    assert encoded is out
+    assert encoded.sum().item() == 3
+    codes, _ = encode_dna_batch(["G"], max_length=3)
+    assert codes[0, 1:].tolist() == [PAD_CODE, PAD_CODE]